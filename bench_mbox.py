@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Mbox Player
+Times startup and UI operations against a synthetic library.
+Run from the Mbox Player directory: python bench_mbox.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import tkinter as tk
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+
+LIBRARY_SIZE = 100000
+SWITCH_ROUNDS = 50
+SCALE_ROUNDS = 30
+SCALE_TARGETS = ((1280, 720), (960, 540), (640, 360))
+BUFFER_SIZES = (512, 1024, 4096)
+STARTUP_MODULES = ('tkinter', 'PIL.Image', 'PIL.ImageTk', 'numpy', 'pygame', 'cv2',
+                   'mutagen', 'library', 'metadata', 'widgets', 'playback',
+                   'waveform', 'thumbnails', 'main')
+
+# Runs in a fresh interpreter so nothing is imported or cached up front
+FIRST_PAINT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import tkinter as tk
+import main
+imported = time.perf_counter()
+
+restored = []
+on_library_loaded = main.MboxPlayer.on_library_loaded
+def timed_loaded(self, *args):
+    on_library_loaded(self, *args)
+    restored.append(time.perf_counter())
+main.MboxPlayer.on_library_loaded = timed_loaded
+
+painted = []
+root = tk.Tk()
+root.bind('<Expose>', lambda e: painted or painted.append(time.perf_counter()))
+app = main.MboxPlayer(root)
+deadline = time.perf_counter() + 10
+while not (painted and restored) and time.perf_counter() < deadline:
+    root.update()
+    time.sleep(0.001)
+root.destroy()
+
+print(imported - start, painted[0] - start, restored[0] - start)
+'''
+
+
+def synthetic_paths(count, ext='.mp3'):
+    """Generate fake library paths spread over artist/album folders"""
+    return [os.path.join('/media/music', f'artist{i % 500:03d}',
+                         f'album{i % 37:02d}', f'track{i:06d}{ext}')
+            for i in range(count)]
+
+
+def timed(func, *args):
+    """Run a function and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def write_silence(file_path, seconds=0.1, rate=44100):
+    """Write a short silent stereo WAV file"""
+    import wave
+    with wave.open(file_path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(int(seconds * rate) * 4))
+    return file_path
+
+
+def import_cost(module):
+    """Get the cold import time of a module, dependencies included, in seconds"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=APP_DIR, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module and fields[2][1] != ' ':
+            return int(fields[1]) / 1e6
+    return 0.0
+
+
+def bench_startup():
+    """Report per-module import cost and time-to-first-paint of a cold start"""
+    for module in STARTUP_MODULES:
+        print(f"Import {module}: {import_cost(module) * 1000:.1f} ms")
+
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    result = subprocess.run([sys.executable, '-c', FIRST_PAINT_SCRIPT],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1:] or ['unknown error']
+        print(f"⚠️  Skipped first paint benchmark: {error[0]}")
+        return
+    imported, painted, restored = map(float, result.stdout.split())
+    print(f"Cold start imports: {imported * 1000:.1f} ms")
+    print(f"Time to first paint: {painted * 1000:.1f} ms")
+    print(f"Library restored: {restored * 1000:.1f} ms")
+
+
+def bench_frame_scaling():
+    """Time each frame scaler and the hand-off to PIL on a 1080p frame"""
+    import numpy as np
+    import cv2
+    from PIL import Image
+    from video import SCALERS, FrameScaler, configured_scaler
+
+    rng = np.random.default_rng(0)
+    frame = np.empty((1080, 1920, 3), dtype=np.uint8)
+    frame[:] = np.linspace(0, 255, 1920, dtype=np.uint8)[None, :, None]
+    frame += rng.integers(0, 16, frame.shape, dtype=np.uint8)
+
+    def per_frame(func):
+        func()  # Warm up caches and lazy imports
+        start = time.perf_counter()
+        for _ in range(SCALE_ROUNDS):
+            func()
+        return (time.perf_counter() - start) / SCALE_ROUNDS * 1000
+
+    print(f"Configured scaler: {configured_scaler()}")
+    for width, height in SCALE_TARGETS:
+        dst = np.empty((height, width, 3), dtype=np.uint8)
+        costs = []
+        for method in SCALERS:
+            scaler = FrameScaler(method)
+            costs.append(f"{method} {per_frame(lambda: scaler.scale(frame, dst)):.2f}")
+        print(f"1080p -> {width}x{height} (ms/frame): {', '.join(costs)}")
+
+    # Handing a 720p frame to PIL on the Tk thread: unpacking BGR there versus
+    # wrapping an RGBA frame the decoder thread already converted
+    scaled = cv2.resize(frame, (1280, 720), interpolation=cv2.INTER_AREA)
+    rgba = np.empty((720, 1280, 4), dtype=np.uint8)
+    unpack = per_frame(lambda: Image.frombuffer('RGB', (1280, 720), scaled,
+                                                'raw', 'BGR', 0, 1).load())
+    convert = per_frame(lambda: cv2.cvtColor(scaled, cv2.COLOR_BGR2RGBA, dst=rgba))
+    wrap = per_frame(lambda: Image.frombuffer('RGBA', (1280, 720), rgba,
+                                              'raw', 'RGBA', 0, 1).load())
+    print(f"720p to PIL: BGR unpack {unpack:.2f} ms on the Tk thread, or RGBA "
+          f"convert {convert:.2f} ms on the decoder + wrap {wrap:.3f} ms")
+
+
+def bench_audio_output(seconds=1.5):
+    """Compare WAV decode paths and the output counters per mixer buffer size"""
+    import pygame
+    from config import ADVANCED
+    from playback import AudioEngine, decode_track, init_mixer
+
+    if not os.environ.get('SDL_AUDIODRIVER'):
+        try:
+            init_mixer()
+        except pygame.error:
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.mixer.quit()
+
+    rate = ADVANCED['sample_rate']
+    matching = write_silence('bench_matching.wav', seconds=30, rate=rate)
+    other = write_silence('bench_other.wav', seconds=30, rate=rate // 2)
+    init_mixer()
+    _, direct = timed(decode_track, matching)
+    _, through_sdl = timed(pygame.mixer.Sound, matching)
+    _, converted = timed(decode_track, other)
+    print(f"Open 30 s WAV: {direct * 1000:.1f} ms streamed (head only) "
+          f"({through_sdl * 1000:.1f} ms through SDL), {converted * 1000:.1f} ms resampled")
+
+    saved = ADVANCED['buffer_size']
+    try:
+        for buffer_size in BUFFER_SIZES:
+            pygame.mixer.quit()
+            ADVANCED['buffer_size'] = buffer_size
+            init_mixer()
+            engine = AudioEngine(post=lambda callback, *args: callback(*args), fade_duration=0)
+            engine.play(matching)
+            time.sleep(seconds)
+            latency = engine.latency()
+            engine.shutdown()
+            stats = engine.stats
+            print(f"Buffer {buffer_size}: device {latency['device'] * 1000:.1f} ms, "
+                  f"start {(stats['start_latency'] or 0) * 1000:.1f} ms, "
+                  f"min headroom {(stats['min_headroom'] or 0) * 1000:.1f} ms, "
+                  f"{stats['underruns']} underruns")
+    finally:
+        ADVANCED['buffer_size'] = saved
+        pygame.mixer.quit()
+
+
+def bench_equalizer(rounds=500):
+    """Time the equalizer per mixer buffer at the configured sample rate"""
+    import numpy as np
+    from config import ADVANCED
+    from equalizer import Equalizer, BANDS
+
+    rate, frames = ADVANCED['sample_rate'], ADVANCED['buffer_size']
+    rng = np.random.default_rng(0)
+    block = (rng.standard_normal((frames, ADVANCED['channels'])) * 3000).astype(np.int16)
+    gains = [6.0 if band % 2 else -6.0 for band in range(len(BANDS))]
+
+    start = time.perf_counter()
+    for _ in range(20):
+        equalizer = Equalizer(rate, gains)
+    rebuild = (time.perf_counter() - start) / 20
+
+    equalizer.process(block.copy())  # Warm up the FFT size
+    samples = [block.copy() for _ in range(rounds)]
+    start = time.perf_counter()
+    for chunk in samples:
+        equalizer.process(chunk)
+    per_block = (time.perf_counter() - start) / rounds
+    print(f"Equalizer, {len(BANDS)} bands: {per_block * 1000:.3f} ms per {frames}-frame block "
+          f"({per_block * rate / frames * 100:.2f}% of one core), "
+          f"{rebuild * 1000:.2f} ms to rebuild on a slider change")
+
+
+def bench_metadata_throughput(count=2000):
+    """Measure tag extraction throughput in files per second"""
+    from metadata import MetadataCache, MetadataPipeline
+
+    corpus = os.path.join(os.getcwd(), 'corpus')
+    os.makedirs(corpus, exist_ok=True)
+    paths = [write_silence(os.path.join(corpus, f'track{i:05d}.wav'))
+             for i in range(count)]
+
+    for label in ('Cold', 'Cached'):
+        cache = MetadataCache('bench_metadata.db')
+        received = []
+        pipeline = MetadataPipeline(cache, received.extend,
+                                    post=lambda callback, batch: callback(batch))
+        start = time.perf_counter()
+        pipeline.submit(paths)
+        pipeline.wait()
+        elapsed = time.perf_counter() - start
+        pipeline.stop()
+        cache.close()
+        print(f"{label} tag extraction: {len(received) / elapsed:,.0f} files/s "
+              f"({len(received)} files, {pipeline.workers} workers)")
+
+
+def bench_folder_import(count=100000):
+    """Time importing a large folder tree into the store and search index"""
+    from library import FolderImporter
+    from library_store import LibraryStore
+    from search import SearchIndex
+
+    root = os.path.join(os.getcwd(), 'import_tree')
+    for i, path in enumerate(synthetic_paths(count)):
+        path = os.path.join(root, os.path.relpath(path, '/media'))
+        if i < 500 * 37:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+
+    store = LibraryStore('bench_import.txt')
+    index = SearchIndex()
+    batches = []
+
+    def add_batch(paths):
+        batches.append(len(paths))
+        for file_path in store.add_many(paths):
+            index.add(file_path)
+
+    result, elapsed = timed(FolderImporter([root], add_batch).run)
+    store.close()
+    print(f"Folder import: {result['found']} files in {elapsed:.2f} s "
+          f"({result['found'] / elapsed:,.0f} files/s, {len(batches)} batches)")
+
+
+def bench_search(count=200000):
+    """Time building the search index and filtering queries over a large library"""
+    from search import SearchIndex
+
+    paths = synthetic_paths(count)
+    metadata = {path: {'title': f'Song {i % 9973}', 'artist': f'Artist {i % 500}',
+                       'album': f'Album {i % 37}'}
+                for i, path in enumerate(paths)}
+    index = SearchIndex()
+    _, build = timed(index.add_many, paths, metadata)
+    _, compile_time = timed(index.compile)
+    print(f"Search index over {count} tracks: {build * 1000:.0f} ms to build, "
+          f"{compile_time * 1000:.0f} ms to compile")
+
+    # Typing a query one character at a time, as the search box sees it
+    for query in ('t', 'tr', 'track', 'track0012', 'song 12 artist', 'zzz'):
+        matches, elapsed = timed(index.search, query)
+        print(f"Query {query!r}: {elapsed * 1000:.2f} ms ({len(matches)} matches)")
+
+    for path in synthetic_paths(count + 5000)[count:]:
+        index.add(path)
+    matches, elapsed = timed(index.search, 'track')
+    print(f"Query 'track' after 5000 adds: {elapsed * 1000:.2f} ms ({len(matches)} matches)")
+
+
+def bench_playlists(count=100000):
+    """Time streaming a large M3U into the playlist store and back out as PLS"""
+    from playlists import PlaylistStore
+
+    with open('bench.m3u', 'w', encoding='utf-8') as f:
+        f.write('#EXTM3U\n')
+        for path in synthetic_paths(count):
+            f.write(f'{path}\n')
+
+    store = PlaylistStore('bench_playlists.db')
+    playlist, elapsed = timed(store.import_file, 'bench.m3u')
+    print(f"Playlist import: {count} entries in {elapsed * 1000:.0f} ms")
+    _, elapsed = timed(len, playlist)
+    print(f"Playlist first load: {elapsed * 1000:.1f} ms "
+          f"({playlist.track_ids.itemsize * count / 1024:.0f} KiB of track ids)")
+    _, elapsed = timed(store.export_file, playlist.name, 'bench.pls')
+    print(f"Playlist export: {elapsed * 1000:.0f} ms")
+    store.close()
+
+
+def bench_category_switch():
+    """Time startup, first visit and cached switches between categories"""
+    from main import MboxPlayer
+    from library_store import LibraryStore
+
+    store = LibraryStore()
+    store.add_many(synthetic_paths(LIBRARY_SIZE))
+    store.close()
+
+    root = tk.Tk()
+    root.withdraw()
+    app, startup = timed(MboxPlayer, root)
+    _, restore = timed(root.update)
+    print(f"Startup with {LIBRARY_SIZE} tracks: {startup * 1000:.1f} ms "
+          f"(+{restore * 1000:.1f} ms restoring the library after paint)")
+
+    for category in app.categories[1:]:
+        _, first = timed(app.select_category, category)
+        root.update_idletasks()
+        print(f"First visit to {category}: {first * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    for _ in range(SWITCH_ROUNDS):
+        for category in app.categories:
+            app.select_category(category)
+            root.update_idletasks()
+    switches = SWITCH_ROUNDS * len(app.categories)
+    cached = (time.perf_counter() - start) / switches
+    print(f"Cached switch: {cached * 1000:.3f} ms average over {switches} switches")
+
+    # What every switch used to cost: building the view from scratch.
+    # This rebinds the app's widget attributes, so it has to run last.
+    start = time.perf_counter()
+    for _ in range(SWITCH_ROUNDS):
+        for category in app.categories:
+            frame = tk.Frame(app.content_area)
+            app.category_builders[category](frame)
+            root.update_idletasks()
+            frame.destroy()
+    rebuild = (time.perf_counter() - start) / switches
+    print(f"Rebuild switch: {rebuild * 1000:.3f} ms average "
+          f"({rebuild / cached:.1f}x slower than cached)")
+
+    root.destroy()
+
+
+def main():
+    print("⏱  Benchmarking Mbox Player...")
+    print("=" * 40)
+
+    # Keep benchmark data out of the real settings and library files
+    os.chdir(tempfile.mkdtemp(prefix='mbox_bench_'))
+
+    bench_startup()
+    bench_frame_scaling()
+    bench_audio_output()
+    bench_equalizer()
+    bench_metadata_throughput()
+    bench_folder_import()
+    bench_search()
+    bench_playlists()
+
+    # GUI benchmarks need a display
+    try:
+        bench_category_switch()
+    except tk.TclError as e:
+        print(f"⚠️  Skipped GUI benchmarks: {e}")
+
+    print("=" * 40)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,9 +31,12 @@ WINDOW = {
 MEDIA = {
     'supported_audio': ['.mp3', '.wav', '.flac', '.m4a', '.ogg'],
     'supported_video': ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm'],
+    'supported_image': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'],
     'default_volume': 70,
     'auto_play_next': True,
     'remember_position': True,
+    'resume_min_duration': 600,        # Only files this long (seconds) get resumed
+    'resume_margin': 10,               # Positions this close to either end are not kept
 }
 
 # File Settings
@@ -41,14 +44,27 @@ FILES = {
     'settings_file': 'mbox_settings.json',
     'log_file': 'mbox_player.log',
     'temp_dir': 'temp',
+    'library_file': 'mbox_library.txt',
+    'library_index': 'mbox_library.db',
+    'metadata_cache': 'mbox_metadata.db',
+    'resume_file': 'mbox_resume.json',
+    'fingerprints': 'mbox_fingerprints.db',
+    'playlists': 'mbox_playlists.db',
 }
 
 # Player Settings
 PLAYER = {
     'fade_duration': 0.5,              # Fade in/out duration in seconds
     'update_interval': 100,            # Progress update interval in milliseconds
+    'event_poll_interval': 30,         # Background event poll interval in milliseconds
+    'resume_save_delay': 5000,         # Delay before resume positions are written in milliseconds
     'show_metadata': True,             # Show media metadata
-    'show_visualizer': False,          # Show audio visualizer (future feature)
+    'show_visualizer': False,          # Show the spectrum visualizer under the seek bar
+    'shuffle': False,                  # Shuffle the library or playlist
+    'history_size': 100,               # Tracks remembered for Previous
+    'collapse_duplicates': True,       # Hide files with the same contents as another
+    'normalize_loudness': True,        # Play every track at the same loudness
+    'target_loudness': -18.0,          # Loudness to normalize to, in LUFS
 }
 
 # Library Settings
@@ -57,6 +73,9 @@ LIBRARY = {
     'scan_directories': [],            # Directories to auto-scan
     'exclude_patterns': ['*.tmp', '*.temp'],  # Files to exclude
     'max_recent_files': 50,            # Maximum recent files to remember
+    'watch': True,                     # Watch the scan directories for changes
+    'watch_poll_interval': 5.0,        # Seconds between directory checks without inotify
+    'watch_settle': 0.5,               # Seconds without events before a batch is applied
 }
 
 # Keyboard Shortcuts (future feature)
@@ -0,0 +1,59 @@
+"""
+Pytest hooks for the Mbox Player tests.
+
+The tests in test_mbox.py also run as a plain script, so they report a
+failure by returning False instead of raising; this makes pytest count
+that as a failure too. Tests that need a display or an audio device are
+marked to skip on machines that have neither.
+"""
+
+import pytest
+
+
+def has_display():
+    """Check whether Tk can open a window"""
+    import tkinter as tk
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+def has_audio_device():
+    """Check whether pygame can open a real audio device"""
+    import pygame
+    try:
+        pygame.mixer.init()
+    except pygame.error:
+        return False
+    pygame.mixer.quit()
+    return True
+
+
+NEEDS = {
+    'test_gui': (has_display, "no display"),
+    'test_audio_playback': (has_audio_device, "no audio device"),
+}
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark the display and audio device tests to skip where those are missing"""
+    checked = {}
+    for item in items:
+        if item.name not in NEEDS:
+            continue
+        check, reason = NEEDS[item.name]
+        if check not in checked:
+            checked[check] = check()
+        item.add_marker(pytest.mark.skipif(not checked[check], reason=reason))
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Fail a test that returns False"""
+    args = {name: pyfuncitem.funcargs[name]
+            for name in pyfuncitem._fixtureinfo.argnames}
+    if pyfuncitem.obj(**args) is False:
+        pytest.fail(f"{pyfuncitem.name} returned False")
+    return True
@@ -0,0 +1,131 @@
+"""
+Mbox Player Equalizer
+Graphic equalizer applied to the audio engine's blocks of decoded PCM.
+
+Each band is a peaking biquad (RBJ cookbook). Whenever a gain changes, the
+cascade's frequency response is evaluated once and turned into an impulse
+response long enough for the lowest band to ring out. Blocks are then
+filtered by FFT overlap-add, all channels in one call, carrying the tail
+into the next block. That is the same filter as running the biquads
+sample by sample, but costs a few FFTs per block instead of a Python loop.
+"""
+
+import math
+import threading
+import numpy as np
+
+BANDS = (31, 62, 125, 250, 500, 1000, 2000, 4000, 8000, 16000)  # Centre frequencies in Hz
+BAND_Q = 1.41  # About one octave wide
+MAX_GAIN = 12.0  # dB either way
+RING_SECONDS = 0.15  # Impulse response kept; the 31 Hz band is below -60 dB by then
+
+
+def peaking_biquad(frequency, gain, q, rate):
+    """Get the normalized (b, a) coefficients of a peaking filter"""
+    a = 10 ** (gain / 40)
+    w0 = 2 * math.pi * frequency / rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    a0 = 1 + alpha / a
+    b = (1 + alpha * a) / a0, -2 * cos_w0 / a0, (1 - alpha * a) / a0
+    return b, (1.0, -2 * cos_w0 / a0, (1 - alpha / a) / a0)
+
+
+def cascade_response(biquads, taps):
+    """Get the impulse response of a chain of biquads, truncated to taps"""
+    z = np.exp(-1j * np.pi * np.arange(taps // 2 + 1) / (taps // 2))
+    response = np.ones_like(z)
+    for b, a in biquads:
+        response *= np.polyval(b[::-1], z) / np.polyval(a[::-1], z)
+    return np.fft.irfft(response, n=taps)
+
+
+class _Filter:
+    """An impulse response with its spectra cached per FFT size"""
+
+    def __init__(self, impulse):
+        self.impulse = impulse
+        self.spectra = {}
+
+    def spectrum(self, nfft):
+        spectrum = self.spectra.get(nfft)
+        if spectrum is None:
+            spectrum = self.spectra[nfft] = np.fft.rfft(self.impulse, n=nfft)[:, None]
+        return spectrum
+
+
+class Equalizer:
+    """Filters blocks of (frames, channels) int16 samples in place.
+
+    ``set_gains`` may be called from any thread; it precomputes the filter
+    and swaps it in, so ``process`` (on the engine thread) never computes
+    coefficients. All gains at 0 dB bypass the filter entirely.
+    """
+
+    def __init__(self, rate, gains=None, bands=BANDS, q=BAND_Q):
+        self.rate = rate
+        self.bands = [f for f in bands if f < rate / 2]
+        self.q = q
+        self.taps = 1 << int(rate * RING_SECONDS).bit_length()
+        self.gains = [0.0] * len(self.bands)
+        self._filter = None
+        self._tail = None  # Filter output that runs past the last block
+        self._lock = threading.Lock()
+        if gains is not None:
+            self.set_gains(gains)
+
+    def set_gains(self, gains):
+        """Set every band's gain in dB"""
+        gains = [max(-MAX_GAIN, min(MAX_GAIN, float(g))) for g in gains[:len(self.bands)]]
+        gains += [0.0] * (len(self.bands) - len(gains))
+        biquads = [peaking_biquad(f, g, self.q, self.rate)
+                   for f, g in zip(self.bands, gains) if g]
+        self.gains = gains
+        self._filter = _Filter(cascade_response(biquads, self.taps)) if biquads else None
+
+    def set_gain(self, band, gain):
+        """Set one band's gain in dB"""
+        gains = list(self.gains)
+        gains[band] = gain
+        self.set_gains(gains)
+
+    def is_flat(self):
+        return self._filter is None
+
+    def reset(self):
+        """Forget the tail, e.g. when playback jumps"""
+        with self._lock:
+            self._tail = None
+
+    def process(self, samples):
+        """Filter a block of int16 samples in place"""
+        active = self._filter
+        with self._lock:
+            tail = self._tail
+            if active is None and tail is None:
+                return
+            frames = len(samples)
+            block = samples.reshape(frames, -1).astype(np.float32)
+            if active is None:
+                # Switched to flat: let the previous filter's tail finish
+                out = block
+                self._tail = None
+            else:
+                nfft = 1 << (frames + self.taps - 2).bit_length()
+                spectrum = np.fft.rfft(block, n=nfft, axis=0)
+                spectrum *= active.spectrum(nfft)
+                out = np.fft.irfft(spectrum, n=nfft, axis=0)[:frames + self.taps - 1]
+                self._tail = out[frames:].copy()
+                out = out[:frames]
+            if tail is not None:
+                overlap = min(frames, len(tail))
+                out[:overlap] += tail[:overlap]
+                if len(tail) > overlap:
+                    rest = tail[overlap:]
+                    if self._tail is None:
+                        self._tail = rest
+                    else:
+                        self._tail[:len(rest)] += rest
+            np.rint(out, out=out)
+            np.clip(out, -32768, 32767, out=out)
+            np.copyto(samples.reshape(frames, -1), out, casting='unsafe')
@@ -0,0 +1,314 @@
+"""
+Mbox Player Fingerprints
+Content fingerprints for finding duplicate files and for keying caches by
+content instead of by path, so moving or renaming a file keeps its tags
+and thumbnail.
+
+A fingerprint hashes a file's size with its first and last PARTIAL_BYTES.
+Duplicate detection only reads what it must: files are grouped by size,
+same-size files get the fingerprint, and only files whose fingerprints
+collide are hashed in full. Hashes are stored per (path, size, mtime), so
+later runs only read new or changed files.
+
+A matching fingerprint alone is not proof of identical contents, so a
+cache only reuses another file's entry once ``same_contents`` agrees. For
+a version that is gone that takes its stored full hash; moved files that
+were never hashed in full are simply read again.
+"""
+
+import os
+import hashlib
+import multiprocessing
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from config import FILES
+
+PARTIAL_BYTES = 64 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+
+def partial_hash(file_path):
+    """Hash a file's size, head and tail"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(size.to_bytes(8, 'little'))
+        digest.update(f.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            f.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            digest.update(f.read(PARTIAL_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash(file_path):
+    """Hash a file's whole contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_files(hash_func, paths):
+    """Hash a chunk of files in a pool worker, with None for unreadable ones"""
+    hashes = []
+    for file_path in paths:
+        try:
+            hashes.append(hash_func(file_path))
+        except OSError:
+            hashes.append(None)
+    return hashes
+
+
+class FingerprintStore:
+    """SQLite store of partial and full hashes, valid while size and mtime match"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or FILES['fingerprints']
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " partial TEXT, full TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_partial"
+                           " ON fingerprints (partial)")
+        self._conn.commit()
+
+    def lookup(self, file_path, size, mtime):
+        """Get the stored (partial, full) hashes for this file version, or (None, None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime, partial, full FROM fingerprints WHERE path = ?",
+                (file_path,)).fetchone()
+        if row is None or (row[0], row[1]) != (size, mtime):
+            return None, None
+        return row[2], row[3]
+
+    def store_many(self, rows):
+        """Store (path, size, mtime, partial, full) rows, keeping known hashes for None"""
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO fingerprints (path, size, mtime, partial, full)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET"
+                " partial=COALESCE(excluded.partial, CASE WHEN size=excluded.size"
+                "  AND mtime=excluded.mtime THEN partial END),"
+                " full=COALESCE(excluded.full, CASE WHEN size=excluded.size"
+                "  AND mtime=excluded.mtime THEN full END),"
+                " size=excluded.size, mtime=excluded.mtime", rows)
+            self._conn.commit()
+
+    def fingerprint(self, file_path, stat=None):
+        """Get a file's fingerprint, hashing it if the stored one is missing or stale"""
+        st = stat or os.stat(file_path)
+        partial, _ = self.lookup(file_path, st.st_size, st.st_mtime)
+        if partial is None:
+            partial = partial_hash(file_path)
+            self.store_many([(file_path, st.st_size, st.st_mtime, partial, None)])
+        return partial
+
+    def full_fingerprint(self, file_path, stat=None):
+        """Get a file's full hash, hashing all of it if the stored one is missing or stale"""
+        st = stat or os.stat(file_path)
+        full = self.lookup(file_path, st.st_size, st.st_mtime)[1]
+        if full is None:
+            full = full_hash(file_path)
+            self.store_many([(file_path, st.st_size, st.st_mtime, None, full)])
+        return full
+
+    def matches(self, fingerprint):
+        """Get (path, size, mtime) of every stored file version with this fingerprint"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, size, mtime FROM fingerprints WHERE partial = ?",
+                (fingerprint,)).fetchall()
+
+    def same_contents(self, file_path, stat, other_path, other_size, other_mtime):
+        """Confirm that a file with the same fingerprint as another version has its contents.
+
+        The full hashes decide: the other version's is read from disk while
+        it is still there, or else taken from the store. A version that is
+        gone and was never hashed in full cannot be confirmed, so the caller
+        reads the file itself instead.
+        """
+        try:
+            other = os.stat(other_path)
+        except OSError:
+            other = None
+        try:
+            if other is not None and (other.st_size, other.st_mtime) == (other_size, other_mtime):
+                other_full = self.full_fingerprint(other_path, other)
+            else:
+                other_full = self.lookup(other_path, other_size, other_mtime)[1]
+                if other_full is None or stat.st_size != other_size:
+                    return False
+            return other_full == self.full_fingerprint(file_path, stat)
+        except OSError:
+            return False
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class DuplicateFinder:
+    """Finds files with identical contents on a background thread.
+
+    Hashing runs in a process pool, a chunk of files per task. The result
+    lists groups of duplicate paths, each in the order the paths were given.
+    """
+
+    CHUNK_SIZE = 64
+
+    def __init__(self, store, paths, index=None, workers=None,
+                 on_progress=None, on_complete=None):
+        self.store = store
+        self.paths = list(paths)
+        self.index = index
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self._cancel = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._error = None  # First failure of a hashing chunk in the current search
+
+    def start(self):
+        """Run the search on a background thread"""
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self.find, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def cancel(self):
+        """Ask a running search to stop, dropping hashing work not yet started"""
+        self._cancel.set()
+        pool = self._pool
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def is_running(self):
+        """Check whether a background search is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for a background search to finish"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _stat_all(self):
+        """Get {path: (size, mtime)}, taken from the library index for scanned files"""
+        known = self.index.stat_map() if self.index is not None else {}
+        stats = {}
+        for file_path in self.paths:
+            if self._cancel.is_set():
+                break
+            stat = known.get(file_path)
+            if stat is None:
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                stat = (st.st_size, st.st_mtime)
+            stats[file_path] = stat
+        return stats
+
+    def _hash_groups(self, groups, column, hash_func, stats):
+        """Hash every file in groups of candidates, returning {path: hash}"""
+        hashes, missing = {}, []
+        for file_path in (path for group in groups for path in group):
+            stored = self.store.lookup(file_path, *stats[file_path])[column]
+            if stored is not None:
+                hashes[file_path] = stored
+            else:
+                missing.append(file_path)
+
+        chunks = [missing[i:i + self.CHUNK_SIZE]
+                  for i in range(0, len(missing), self.CHUNK_SIZE)]
+        if chunks and self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        futures = [self._pool.submit(_hash_files, hash_func, chunk) for chunk in chunks]
+        done = 0
+        for chunk, future in zip(chunks, futures):
+            if self._cancel.is_set():
+                break
+            try:
+                digests = future.result()
+            except Exception as e:
+                # Leave the chunk unhashed; its files simply match nothing
+                print(f"Error hashing files: {e}")
+                self._error = self._error or e
+                digests = []
+            rows = []
+            for file_path, digest in zip(chunk, digests):
+                if digest is not None:
+                    hashes[file_path] = digest
+                    size, mtime = stats[file_path]
+                    rows.append((file_path, size, mtime,
+                                 digest if column == 0 else None,
+                                 digest if column == 1 else None))
+            self.store.store_many(rows)
+            done += len(chunk)
+            if self.on_progress:
+                self.on_progress(done, len(missing))
+        return hashes
+
+    def find(self):
+        """Search synchronously and return a summary with the duplicate groups.
+
+        on_complete always gets the summary; its 'error' is the first
+        failure, if any, and the groups cover the files that were hashed.
+        """
+        result = {'groups': [], 'checked': 0, 'cancelled': False, 'error': None}
+        self._error = None
+        try:
+            stats = self._stat_all()
+            result['checked'] = len(stats)
+            groups = self._split(stats.keys(), lambda path: stats[path][0])
+
+            partials = self._hash_groups(groups, 0, partial_hash, stats)
+            groups = [group for candidates in groups
+                      for group in self._split(candidates, partials.get)]
+
+            fulls = self._hash_groups(groups, 1, full_hash, stats)
+            groups = [group for candidates in groups
+                      for group in self._split(candidates, fulls.get)]
+            if not self._cancel.is_set():
+                order = {path: i for i, path in enumerate(self.paths)}
+                result['groups'] = sorted((sorted(group, key=order.get) for group in groups),
+                                          key=lambda group: order[group[0]])
+        except Exception as e:
+            print(f"Error finding duplicates: {e}")
+            self._error = self._error or e
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+        result['cancelled'] = self._cancel.is_set()
+        result['error'] = self._error
+        if self.on_complete:
+            self.on_complete(result)
+        return result
+
+    @staticmethod
+    def _split(paths, key):
+        """Group paths by key, keeping groups of two or more; None keys never match"""
+        buckets = defaultdict(list)
+        for file_path in paths:
+            value = key(file_path)
+            if value is not None:
+                buckets[value].append(file_path)
+        return [group for group in buckets.values() if len(group) > 1]
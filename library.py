@@ -0,0 +1,345 @@
+"""
+Mbox Player Library
+Background scanner and incremental on-disk SQLite index for the media library.
+"""
+
+import os
+import fnmatch
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import MEDIA, LIBRARY, FILES
+from metadata import read_tags
+
+
+def media_extensions():
+    """Get the set of file extensions the library accepts"""
+    return (set(MEDIA['supported_audio']) | set(MEDIA['supported_video'])
+            | set(MEDIA['supported_image']))
+
+
+def is_excluded(name, patterns):
+    """Check a file or directory name against the exclude patterns"""
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+class LibraryIndex:
+    """SQLite index of library files with their size, mtime and tags"""
+
+    COLUMNS = ('path', 'size', 'mtime', 'title', 'artist', 'album',
+               'duration', 'bitrate')
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or FILES['library_index']
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " title TEXT, artist TEXT, album TEXT,"
+            " duration REAL, bitrate INTEGER,"
+            " scanned_at REAL)"
+        )
+        self._conn.commit()
+
+    def stat_map(self):
+        """Get a {path: (size, mtime)} map of every indexed file"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, size, mtime FROM files").fetchall()
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def paths(self):
+        """Get all indexed paths in a stable order"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM files ORDER BY rowid").fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, file_path):
+        """Get the indexed record for a path, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM files WHERE path = ?",
+                (file_path,)).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def upsert_many(self, records):
+        """Insert or update a batch of records"""
+        if not records:
+            return
+        now = time.time()
+        rows = [tuple(record.get(col) for col in self.COLUMNS) + (now,)
+                for record in records]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO files (path, size, mtime, title, artist, album,"
+                " duration, bitrate, scanned_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET size=excluded.size,"
+                " mtime=excluded.mtime, title=excluded.title,"
+                " artist=excluded.artist, album=excluded.album,"
+                " duration=excluded.duration, bitrate=excluded.bitrate,"
+                " scanned_at=excluded.scanned_at", rows)
+            self._conn.commit()
+
+    def remove_many(self, paths):
+        """Remove a batch of paths from the index"""
+        if not paths:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE path = ?",
+                                   [(path,) for path in paths])
+            self._conn.commit()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class LibraryScanner:
+    """Walks the scan directories on a worker pool and updates the index.
+
+    Only files whose (size, mtime) differ from the index are re-read with
+    mutagen; files that vanished from a scanned directory are removed.
+    Directories that cannot be listed (an unmounted drive, a permission
+    error) are reported as unreachable and their entries are kept.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, index, directories=None, exclude_patterns=None,
+                 workers=None, on_progress=None, on_complete=None):
+        self.index = index
+        self.directories = list(directories if directories is not None
+                                else LIBRARY['scan_directories'])
+        self.exclude_patterns = list(exclude_patterns if exclude_patterns is not None
+                                     else LIBRARY['exclude_patterns'])
+        self.workers = workers or min(8, (os.cpu_count() or 1) + 4)
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.extensions = media_extensions()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run the scan on a background thread"""
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self.scan, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def cancel(self):
+        """Ask a running scan to stop"""
+        self._cancel.set()
+
+    def is_running(self):
+        """Check whether a background scan is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for a background scan to finish"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _scan_dir(self, directory):
+        """List one directory, returning (media files with stat, subdirectories).
+
+        Raises OSError if the directory itself cannot be listed.
+        """
+        files, subdirs = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if is_excluded(entry.name, self.exclude_patterns):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in self.extensions:
+                        st = entry.stat()
+                        files.append((entry.path, st.st_size, st.st_mtime))
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def _walk(self, pool):
+        """Walk every scan directory in parallel, one task per directory.
+
+        Returns (files found, directories that could not be listed).
+        """
+        found, unreachable = [], []
+        pending = {}
+        for directory in self.directories:
+            if os.path.isdir(directory):
+                pending[pool.submit(self._scan_dir, directory)] = (directory, True)
+            else:
+                unreachable.append(directory)  # Unmounted or removed scan root
+        while pending and not self._cancel.is_set():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, is_root = pending.pop(future)
+                try:
+                    files, subdirs = future.result()
+                except FileNotFoundError:
+                    if is_root:
+                        unreachable.append(directory)
+                    continue  # A subdirectory deleted since its parent was listed
+                except OSError as e:
+                    print(f"Error scanning {directory}: {e}")
+                    unreachable.append(directory)
+                    continue
+                found.extend(files)
+                for subdir in subdirs:
+                    pending[pool.submit(self._scan_dir, subdir)] = (subdir, False)
+        for future in pending:
+            future.cancel()
+        return found, unreachable
+
+    def _read_record(self, item):
+        """Build an index record for a changed file"""
+        path, size, mtime = item
+        record = {'path': path, 'size': size, 'mtime': mtime}
+        record.update(read_tags(path))
+        return record
+
+    def scan(self):
+        """Scan synchronously and return a summary of what changed"""
+        known = self.index.stat_map()
+        result = {'seen': 0, 'updated': [], 'removed': [], 'unreachable': [],
+                  'cancelled': False}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            found, result['unreachable'] = self._walk(pool)
+            result['seen'] = len(found)
+
+            changed = [item for item in found
+                       if known.get(item[0]) != (item[1], item[2])]
+            batch = []
+            for record in pool.map(self._read_record, changed):
+                if self._cancel.is_set():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    break
+                batch.append(record)
+                result['updated'].append(record['path'])
+                if len(batch) >= self.BATCH_SIZE:
+                    self.index.upsert_many(batch)
+                    batch = []
+                    if self.on_progress:
+                        self.on_progress(len(result['updated']), len(changed))
+            self.index.upsert_many(batch)
+
+        if self._cancel.is_set():
+            result['cancelled'] = True
+        else:
+            # Only prune entries under directories that were actually listed;
+            # a root or subtree that could not be read keeps its entries
+            seen_paths = {item[0] for item in found}
+            roots = tuple(os.path.join(os.path.abspath(d), '') for d in self.directories)
+            skipped = tuple(os.path.join(os.path.abspath(d), '')
+                            for d in result['unreachable'])
+            result['removed'] = [path for path in known
+                                 if path not in seen_paths
+                                 and os.path.abspath(path).startswith(roots)
+                                 and not (skipped and os.path.abspath(path).startswith(skipped))]
+            self.index.remove_many(result['removed'])
+
+        if self.on_complete:
+            self.on_complete(result)
+        return result
+
+
+class FolderImporter:
+    """Walks folders on a background thread and hands over media paths in batches.
+
+    Files named directly in ``sources`` are taken as they are; folders are
+    walked recursively for audio, video and image files. ``on_batch(paths)`` gets
+    every BATCH_SIZE paths, or whatever was found within BATCH_INTERVAL
+    seconds, so the caller can update its list while the walk goes on.
+    """
+
+    BATCH_SIZE = 2000
+    BATCH_INTERVAL = 0.25
+
+    def __init__(self, sources, on_batch, on_complete=None, extensions=None,
+                 exclude_patterns=None):
+        self.sources = list(sources)
+        self.on_batch = on_batch
+        self.on_complete = on_complete
+        self.extensions = set(extensions if extensions is not None else media_extensions())
+        self.exclude_patterns = list(exclude_patterns if exclude_patterns is not None
+                                     else LIBRARY['exclude_patterns'])
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run the import on a background thread"""
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def cancel(self):
+        """Ask a running import to stop after the current batch"""
+        self._cancel.set()
+
+    def is_running(self):
+        """Check whether a background import is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for a background import to finish"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _walk(self):
+        """Yield media paths from the sources, each folder's files before its subfolders"""
+        for source in self.sources:
+            if not os.path.isdir(source):
+                yield source
+                continue
+            stack = [source]
+            while stack and not self._cancel.is_set():
+                try:
+                    with os.scandir(stack.pop()) as entries:
+                        entries = sorted(entries, key=lambda entry: entry.name)
+                except OSError:
+                    continue
+                subdirs = []
+                for entry in entries:
+                    if is_excluded(entry.name, self.exclude_patterns):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in self.extensions:
+                            yield entry.path
+                    except OSError:
+                        continue
+                stack.extend(reversed(subdirs))
+
+    def run(self):
+        """Import synchronously and return a summary"""
+        result = {'found': 0, 'cancelled': False}
+        batch = []
+        deadline = time.monotonic() + self.BATCH_INTERVAL
+        for path in self._walk():
+            if self._cancel.is_set():
+                break
+            batch.append(path)
+            if len(batch) >= self.BATCH_SIZE or time.monotonic() >= deadline:
+                result['found'] += len(batch)
+                self.on_batch(batch)
+                batch = []
+                deadline = time.monotonic() + self.BATCH_INTERVAL
+
+        result['cancelled'] = self._cancel.is_set()
+        if batch and not result['cancelled']:
+            result['found'] += len(batch)
+            self.on_batch(batch)
+        if self.on_complete:
+            self.on_complete(result)
+        return result
@@ -0,0 +1,154 @@
+"""
+Mbox Player Library Store
+Compact append-only storage for the media list, kept apart from the settings.
+
+The library lives in two files: a snapshot with one path per line and a
+journal of "+path" / "-path" records appended on every add or remove.
+Loading replays the journal over the snapshot; once the journal grows past
+a threshold it is folded into a new snapshot written to a temporary file
+and atomically swapped in with os.replace.
+"""
+
+import os
+import json
+
+from config import FILES
+
+
+def atomic_write(file_path, data):
+    """Write text to a file through a temporary file and os.replace"""
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def load_json(file_path, default=None):
+    """Load a JSON file, returning default if it is missing"""
+    if not os.path.exists(file_path):
+        return default
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(file_path, data):
+    """Atomically save data as JSON"""
+    atomic_write(file_path, json.dumps(data))
+
+
+class LibraryStore:
+    """Ordered set of library paths backed by a snapshot and a journal"""
+
+    MIN_COMPACT_ENTRIES = 1000
+
+    def __init__(self, snapshot_path=None):
+        self.snapshot_path = snapshot_path or FILES['library_file']
+        self.journal_path = self.snapshot_path + '.journal'
+        self._paths = {}  # dict keeps insertion order, used as an ordered set
+        self._journal = None
+        self._journal_entries = 0
+        self.load()
+
+    def __contains__(self, file_path):
+        return file_path in self._paths
+
+    def __len__(self):
+        return len(self._paths)
+
+    def paths(self):
+        """Get the stored paths in insertion order"""
+        return list(self._paths)
+
+    def load(self):
+        """Read the snapshot and replay the journal on top of it"""
+        self._paths = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if line:
+                        self._paths[line] = None
+
+        self._journal_entries = 0
+        torn = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # A line without its newline is a torn write from a crash
+                    if not line.endswith('\n'):
+                        torn = True
+                        continue
+                    if len(line) < 3:
+                        continue
+                    op, file_path = line[0], line[1:-1]
+                    if op == '+':
+                        self._paths[file_path] = None
+                    elif op == '-':
+                        self._paths.pop(file_path, None)
+                    self._journal_entries += 1
+
+        # Compacting drops a torn tail, so later appends start on a fresh line
+        if torn or self._needs_compaction():
+            self.compact()
+
+    def _append(self, records):
+        """Append journal records and flush them to disk"""
+        if not records:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(''.join(records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_entries += len(records)
+        if self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self):
+        """Check whether the journal has outgrown the snapshot"""
+        return self._journal_entries > max(self.MIN_COMPACT_ENTRIES,
+                                           len(self._paths) // 4)
+
+    def add_many(self, paths):
+        """Add paths that are not stored yet, returning the ones added"""
+        added = []
+        for file_path in paths:
+            if file_path not in self._paths and '\n' not in file_path:
+                self._paths[file_path] = None
+                added.append(file_path)
+        self._append([f'+{file_path}\n' for file_path in added])
+        return added
+
+    def remove_many(self, paths):
+        """Remove stored paths, returning the ones removed"""
+        removed = [file_path for file_path in paths if file_path in self._paths]
+        for file_path in removed:
+            del self._paths[file_path]
+        self._append([f'-{file_path}\n' for file_path in removed])
+        return removed
+
+    def clear(self):
+        """Remove every path"""
+        self._paths = {}
+        self.compact()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        atomic_write(self.snapshot_path,
+                     ''.join(f'{file_path}\n' for file_path in self._paths))
+        # Replaying a stale journal over the new snapshot is harmless, so a
+        # crash between the replace and the truncate loses nothing
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        self._journal_entries = 0
+
+    def close(self):
+        """Close the journal file"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
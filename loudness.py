@@ -0,0 +1,362 @@
+"""
+Mbox Player Loudness
+Per-track gain so tracks from different sources play at the same loudness.
+
+Gains are ReplayGain-style: decibels relative to REFERENCE_LUFS. Files that
+carry ReplayGain tags use them as they are; the rest are decoded in a
+background process pool and measured with the ITU-R BS.1770 gated loudness
+(K-weighting applied as FFT convolution, then overlapping 400 ms blocks
+with absolute and relative gates, as array operations rather than
+per-sample loops). Samples are fed to the meter a block at a time and only
+per-step energies are kept. 16-bit WAVs, and with the optional soundfile
+package FLAC, Ogg and MP3 files, are read from disk in blocks at their own
+rate and channel count, so memory does not grow with the file. Anything
+else is decoded whole by SDL; the pool's workers take turns at that for
+files over WHOLE_DECODE_BYTES, so only one such file is held at a time.
+Results are stored in the metadata cache, so at play time the gain is a
+lookup.
+"""
+
+import os
+import math
+import multiprocessing
+import threading
+import wave
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from config import PLAYER
+from metadata import read_tags
+
+REFERENCE_LUFS = -18.0  # Loudness a gain of 0 dB stands for (ReplayGain 2.0)
+ANALYSIS_RATE = 22050  # Decode rate for files SDL has to decode
+DECODE_FRAMES = 1 << 16  # Frames read and filtered at a time
+WHOLE_DECODE_BYTES = 16 * 1024 * 1024  # Files this large take turns at a whole decode
+BLOCK_SECONDS = 0.4  # Gating block length
+STEP_SECONDS = 0.1  # Gating block hop (75% overlap)
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the ungated loudness
+
+
+def k_weighting(rate):
+    """Get the (b, a) biquads of the BS.1770 K-weighting filter at a sample rate"""
+    # Stage 1: high shelf modelling the head
+    k = math.tan(math.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0,
+             (vh - vb * k / q + k * k) / a0)
+    shelf_poles = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    # Stage 2: high pass
+    k = math.tan(math.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass_poles = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    return [(shelf, shelf_poles), ((1.0, -2.0, 1.0), highpass_poles)]
+
+
+def k_weighting_response(rate, taps):
+    """Get the K-weighting filter as an FIR impulse response of a given length"""
+    z = np.exp(-1j * np.pi * np.arange(taps // 2 + 1) / (taps // 2))
+    response = np.ones_like(z)
+    for b, a in k_weighting(rate):
+        response *= np.polyval(b[::-1], z) / np.polyval(a[::-1], z)
+    return np.fft.irfft(response, n=taps)
+
+
+class LoudnessMeter:
+    """Gated loudness of samples fed one block after another.
+
+    The K-weighting filter runs as FFT overlap-add, carrying its tail from
+    one block into the next; only the energy of each STEP_SECONDS is kept.
+    """
+
+    def __init__(self, rate, channels):
+        self.rate = rate
+        self.step = int(STEP_SECONDS * rate)
+        self.taps = 1 << (rate // 4).bit_length()  # Well past the filter's decay
+        self.nfft = 1 << (DECODE_FRAMES + self.taps - 1).bit_length()
+        self._response = np.fft.rfft(k_weighting_response(rate, self.taps), n=self.nfft)[:, None]
+        self._tail = np.zeros((self.taps - 1, channels))
+        self._carry = np.zeros(0)  # Power of the frames past the last whole step
+        self._energies = []
+        self.peak = 0.0  # Largest absolute sample, full scale = 1.0
+
+    def feed(self, samples):
+        """Add the next int16 or float samples, shaped (frames,) or (frames, channels)"""
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        for start in range(0, len(samples), DECODE_FRAMES):
+            block = samples[start:start + DECODE_FRAMES]
+            if block.dtype == np.int16:
+                block = block.astype(np.float32) / 32768.0  # One block at a time
+            if len(block):
+                self.peak = max(self.peak, float(np.abs(block).max()))
+            filtered = np.fft.irfft(np.fft.rfft(block, n=self.nfft, axis=0) * self._response,
+                                    n=self.nfft, axis=0)[:len(block) + self.taps - 1]
+            filtered[:self.taps - 1] += self._tail
+            self._tail = filtered[len(block):].copy()
+            power = np.concatenate((self._carry, np.square(filtered[:len(block)]).sum(axis=1)))
+            steps = len(power) // self.step
+            self._energies.append(power[:steps * self.step].reshape(steps, self.step).sum(axis=1))
+            self._carry = power[steps * self.step:]
+
+    def loudness(self):
+        """Get the gated loudness in LUFS of everything fed so far, or None for silence"""
+        energies = np.concatenate(self._energies) if self._energies else np.zeros(0)
+        if not len(energies):
+            return None
+        step = self.step
+        per_block = int(round(BLOCK_SECONDS / STEP_SECONDS))
+        if len(energies) < per_block:
+            blocks = np.array([energies.sum() / (len(energies) * step)])  # Under one block
+        else:
+            totals = np.concatenate(([0.0], np.cumsum(energies)))
+            blocks = (totals[per_block:] - totals[:-per_block]) / (per_block * step)
+
+        with np.errstate(divide='ignore'):
+            levels = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[levels > ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        threshold = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE
+        gated = blocks[levels > max(threshold, ABSOLUTE_GATE)]
+        return -0.691 + 10 * math.log10(gated.mean())
+
+
+def measure_loudness(samples, rate):
+    """Get the gated loudness in LUFS of int16 or float samples, or None for silence"""
+    samples = np.asarray(samples)
+    meter = LoudnessMeter(rate, samples.shape[1] if samples.ndim > 1 else 1)
+    meter.feed(samples)  # Channel weights are 1 for L/R
+    return meter.loudness()
+
+
+def parse_replaygain(value):
+    """Get a number from a ReplayGain tag value such as '-6.54 dB', or None"""
+    try:
+        return float(str(value).split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def read_replaygain(file_path):
+    """Get (track gain dB, track peak) from a file's ReplayGain tags, or (None, None)"""
+    from mutagen import File  # Deferred so startup does not pay for mutagen
+    try:
+        audio = File(file_path, easy=True)
+    except Exception:
+        return None, None
+    if audio is None or audio.tags is None:
+        return None, None
+    values = [audio.get(key) for key in ('replaygain_track_gain', 'replaygain_track_peak')]
+    gain, peak = (parse_replaygain(value[0]) if value else None for value in values)
+    return gain, peak
+
+
+_whole_decode = None  # Semaphore the pool's workers share, set by _init_decoder
+
+
+def _init_decoder(whole_decode=None):
+    """Set up a silent stereo mixer in a pool worker for decoding"""
+    global _whole_decode
+    _whole_decode = whole_decode
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    import pygame
+    pygame.mixer.init(frequency=ANALYSIS_RATE, size=-16, channels=2)
+
+
+def source_channels(file_path):
+    """Get a file's channel count from its header, or None if unknown"""
+    from mutagen import File
+    try:
+        audio = File(file_path)
+    except Exception:
+        return None
+    return getattr(getattr(audio, 'info', None), 'channels', None)
+
+
+def open_sound_file(file_path):
+    """Open a file with soundfile, or get None if it is not installed or cannot read it"""
+    try:
+        import soundfile  # Optional; without it SDL decodes these files whole
+    except ImportError:
+        return None
+    try:
+        return soundfile.SoundFile(file_path)
+    except (RuntimeError, OSError):
+        return None
+
+
+def decode_blocks(file_path):
+    """Get (rate, channels, blocks of int16 samples) for a file.
+
+    16-bit PCM WAVs and files soundfile can read are streamed from disk
+    DECODE_FRAMES at a time. Anything else is decoded whole by SDL into
+    the worker's stereo mixer and walked as views of that buffer; of a
+    mono file's two identical channels only one is kept, so it is
+    measured as the single channel it is.
+    """
+    if file_path.lower().endswith('.wav'):
+        try:
+            w = wave.open(file_path, 'rb')
+        except (wave.Error, EOFError):
+            w = None  # Compressed or float WAV; SDL handles those
+        if w is not None and w.getsampwidth() != 2:
+            w.close()
+            w = None
+        if w is not None:
+            channels = w.getnchannels()
+
+            def read():
+                with w:
+                    while True:
+                        data = w.readframes(DECODE_FRAMES)
+                        if not data:
+                            return
+                        yield np.frombuffer(data, dtype='<i2').reshape(-1, channels)
+            return w.getframerate(), channels, read()
+
+    sound_file = open_sound_file(file_path)
+    if sound_file is not None:
+        def read():
+            with sound_file:
+                yield from sound_file.blocks(DECODE_FRAMES, dtype='int16', always_2d=True)
+        return sound_file.samplerate, sound_file.channels, read()
+
+    import pygame
+    mixer_channels = pygame.mixer.get_init()[2]
+    channels = min(mixer_channels, source_channels(file_path) or mixer_channels)
+
+    def decode():
+        # Held until the blocks are used up, so large decodes never overlap
+        slot = _whole_decode if os.path.getsize(file_path) >= WHOLE_DECODE_BYTES else None
+        if slot is not None:
+            slot.acquire()
+        try:
+            samples = pygame.sndarray.samples(pygame.mixer.Sound(file_path))  # No copy
+            if samples.ndim == 1:
+                samples = samples[:, None]
+            samples = samples[:, :channels]
+            for i in range(0, len(samples), DECODE_FRAMES):
+                yield samples[i:i + DECODE_FRAMES]
+        finally:
+            if slot is not None:
+                slot.release()
+    return pygame.mixer.get_init()[0], channels, decode()
+
+
+def analyze_file(file_path):
+    """Get a metadata record with the gain and peak of a file, measuring it if untagged"""
+    st = os.stat(file_path)
+    record = {'path': file_path, 'size': st.st_size, 'mtime': st.st_mtime}
+    record.update(read_tags(file_path))
+    gain, peak = read_replaygain(file_path)
+    if gain is None:
+        rate, channels, blocks = decode_blocks(file_path)
+        meter = LoudnessMeter(rate, channels)
+        for block in blocks:
+            meter.feed(block)
+        loudness = meter.loudness()
+        gain = 0.0 if loudness is None else REFERENCE_LUFS - loudness
+        peak = meter.peak
+    record['gain'] = round(gain, 2)
+    record['peak'] = None if peak is None else round(float(peak), 4)
+    return record
+
+
+def _analyze_files(paths):
+    """Analyze a chunk of files in a pool worker, skipping unreadable ones"""
+    records = []
+    for file_path in paths:
+        try:
+            records.append(analyze_file(file_path))
+        except Exception:
+            continue
+    return records
+
+
+def gain_factor(record, target=None):
+    """Get the linear gain to play a file at the target loudness, or 1.0 if unknown"""
+    if not record or record.get('gain') is None:
+        return 1.0
+    if target is None:
+        target = PLAYER['target_loudness']
+    factor = 10 ** ((record['gain'] + target - REFERENCE_LUFS) / 20)
+    if record.get('peak'):
+        factor = min(factor, 1.0 / record['peak'])  # Never push the peak past full scale
+    return factor
+
+
+class LoudnessAnalyzer:
+    """Measures files in a process pool and stores the gains in the metadata cache.
+
+    Only a few chunks are in flight at a time, so queueing a whole library
+    costs nothing up front. Records are handed to ``on_results`` through
+    ``post``.
+    """
+
+    CHUNK_SIZE = 8
+
+    def __init__(self, cache, on_results, post, workers=1):
+        self.cache = cache
+        self.on_results = on_results
+        self.post = post
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._waiting = deque()
+        self._requested = set()
+        self._in_flight = 0
+        self._pool = None
+
+    def request(self, paths):
+        """Queue files for analysis; files already queued or in flight are skipped"""
+        with self._lock:
+            for file_path in paths:
+                if file_path not in self._requested:
+                    self._requested.add(file_path)
+                    self._waiting.append(file_path)
+        self._fill()
+
+    def pending(self):
+        """Get the number of files still waiting or being analyzed"""
+        with self._lock:
+            return len(self._waiting) + self._in_flight
+
+    def _fill(self):
+        """Keep two chunks per worker submitted"""
+        with self._lock:
+            while self._waiting and self._in_flight < self.workers * 2 * self.CHUNK_SIZE:
+                chunk = [self._waiting.popleft()
+                         for _ in range(min(self.CHUNK_SIZE, len(self._waiting)))]
+                if self._pool is None:
+                    # Spawn rather than fork: a forked child would inherit SDL's audio state
+                    context = multiprocessing.get_context('spawn')
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=context,
+                        initializer=_init_decoder, initargs=(context.Semaphore(1),))
+                self._in_flight += len(chunk)
+                future = self._pool.submit(_analyze_files, chunk)
+                future.add_done_callback(lambda future, chunk=chunk: self._done(future, chunk))
+
+    def _done(self, future, chunk):
+        with self._lock:
+            self._in_flight -= len(chunk)
+            self._requested.difference_update(chunk)  # A later version may be requested again
+        if not future.cancelled() and future.exception() is None:
+            records = future.result()
+            if records:
+                self.cache.store_many(records)
+                self.post(self.on_results, records)
+        self._fill()
+
+    def shutdown(self):
+        with self._lock:
+            self._waiting.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,18 +1,24 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import filedialog, messagebox, simpledialog
 import os
-import sys
-import json
+import queue
 import threading
 import time
-from pathlib import Path
-from PIL import Image, ImageTk
-import pygame
-import cv2
-from mutagen import File
+from bisect import bisect_left
 
-# VLC availability will be checked when needed
-VLC_AVAILABLE = False
+from config import MEDIA, LIBRARY, FILES, PLAYER, ADVANCED
+from library import LibraryIndex, LibraryScanner, FolderImporter
+from metadata import MetadataCache, MetadataPipeline, display_name
+from library_store import LibraryStore, load_json, save_json
+from playlists import PlaylistStore, PLAYLIST_EXTENSIONS
+from play_queue import PlayQueue
+from resume import ResumeStore
+from fingerprint import FingerprintStore, DuplicateFinder
+from watcher import LibraryWatcher
+from widgets import VirtualListbox, WaveformSeekBar, ThumbnailGrid, VideoCanvas, SpectrumView
+
+# pygame, cv2, PIL and mutagen are imported where they are first used so the
+# window can appear before any of them has loaded
 
 class MboxPlayer:
     def __init__(self, root):
@@ -29,19 +35,188 @@ class MboxPlayer:
         
         self.root.configure(bg=self.bg_color)
         
-        # Initialize pygame mixer for audio
-        pygame.mixer.init()
+        # Background threads hand results to Tk through this queue, which a
+        # single after() loop drains (Tk calls are not safe from other threads)
+        self.events = queue.Queue()
+        
+        # Audio engine and pygame mixer, started on first playback
+        self._audio = None
+        
+        # Equalizer band gains in dB; the filter is built with the audio engine
+        self.eq_gains = []
+        self.equalizer = None
+        self.equalizer_window = None
+        
+        # Visualizer: the engine copies output into pcm_ring only while it is shown
+        self.show_visualizer = PLAYER['show_visualizer']
+        self.pcm_ring = None
+        self.spectrum = None
+        
+        # Video player and its window, created for the first video
+        self.video = None
+        self.video_window = None
         
         # Media state
         self.current_media = None
         self.is_playing = False
         self.media_list = []
-        self.current_index = 0
+        self.playing_list = self.media_list  # The library, or the active playlist
+        self.visual_list = []  # Pictures and videos in media_list, for the thumbnail grid
+        self.visual_extensions = set(MEDIA['supported_image']) | set(MEDIA['supported_video'])
+        self.play_queue = PlayQueue(shuffle=PLAYER['shuffle'],
+                                    history_size=PLAYER['history_size'])
         self.current_category = "Music"  # Default category
+        self.track_duration = None  # Seconds, from the metadata cache
+        self.progress_job = None  # Pending root.after id for update_progress
+        self.category_views = {}  # Category frames, built on first visit
+        
+        # Library storage: manually added files and the scanner's index
+        self.library_store = LibraryStore()
+        self.library_index = LibraryIndex()
+        self.scanner = None
+        self.watcher = None  # Applies file changes in the scan directories as they happen
+        self.importer = None  # Add Folder / drag-and-drop import in progress
+        self.import_added = 0
+        
+        # Content fingerprints: duplicate detection and move-proof cache keys
+        self.fingerprint_store = FingerprintStore()
+        self.duplicate_finder = None
+        self.duplicates = {}  # Path -> the first library path with the same contents
+        
+        # Tag metadata, filled in the background and cached across restarts
+        self.metadata = {}
+        self.metadata_cache = MetadataCache()
+        self.metadata_pipeline = MetadataPipeline(
+            self.metadata_cache, self.on_metadata,
+            post=self.post,
+            index=self.library_index,
+            fingerprints=self.fingerprint_store)
+        
+        # Per-track loudness gains, measured in the background into the metadata cache
+        self.loudness = None  # Created with the library after the first paint
+        
+        # Where long files were left off, written a few seconds after changes
+        self.resume_store = ResumeStore()
+        self.resume_job = None
+        
+        # Named playlists, loaded when opened
+        self.playlist_store = PlaylistStore()
+        self.playlist_window = None
+        
+        # Word index over names and tags; also the membership set for media_list
+        self.search_index = None  # Built on a worker at startup, see load_library
+        self.shown = {}  # Path -> search index id of each row of a filtered music list
+        self.shown_ids = []  # Those ids in row order, which is id order
+        
+        # Waveform peaks for the seek bar, built once per file
+        self.peak_cache = None  # Created on first playback
         
-        # Create GUI
+        # Thumbnails for the Pictures + Videos grid
+        self.thumbnail_cache = None  # Created with the grid
+        self.thumbnail_grid = None
+        
+        # Create GUI, then restore the library once the window has painted
         self.create_gui()
+        self.root.after_idle(self.finish_startup)
+        self.poll_events()
+    
+    def post(self, callback, *args):
+        """Run callback(*args) on the Tk thread; safe to call from any thread"""
+        self.events.put((callback, args))
+    
+    def poll_events(self):
+        """Run callbacks posted by background threads, then poll again"""
+        deadline = time.perf_counter() + 0.02  # Leave time for redraws in a burst
+        while time.perf_counter() < deadline:
+            try:
+                callback, args = self.events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error handling background event: {e}")
+        self.root.after(PLAYER['event_poll_interval'], self.poll_events)
+    
+    def finish_startup(self):
+        """Restore settings and the library after the first paint"""
+        self.root.update_idletasks()
+        if PLAYER['normalize_loudness']:
+            from loudness import LoudnessAnalyzer
+            self.loudness = LoudnessAnalyzer(self.metadata_cache, self.on_loudness,
+                                             post=self.post)
         self.load_settings()
+    
+    def load_library(self, stored):
+        """Build the media list, search index and tag map (worker thread)"""
+        from search import SearchIndex  # Pulls in numpy
+        metadata = {}
+        # Cached tags and gains load immediately; only unknown files get parsed
+        if PLAYER['show_metadata'] or PLAYER['normalize_loudness']:
+            try:
+                metadata = self.metadata_cache.load_all()
+            except Exception as e:
+                print(f"Error loading metadata cache: {e}")
+        try:
+            # Scanned files come from the index instead of re-walking the tree
+            indexed = self.library_index.paths()
+        except Exception as e:
+            print(f"Error loading library index: {e}")
+            indexed = []
+        
+        search_index = SearchIndex()
+        media_list = []
+        for paths in (stored, indexed):
+            for file_path in paths:
+                if file_path not in search_index:
+                    search_index.add(file_path, metadata.get(file_path))
+                    media_list.append(file_path)
+        search_index.compile()  # Here rather than on the first keystroke
+        self.post(self.on_library_loaded, media_list, search_index, metadata)
+    
+    def on_library_loaded(self, media_list, search_index, metadata):
+        """Take over the library built at startup, then scan and watch for changes"""
+        metadata.update(self.metadata)  # Tags read since the load began are newer
+        self.metadata = metadata
+        added = list(self.media_list)  # Imported while the library was loading
+        self.media_list[:] = media_list  # In place: playing_list may refer to it
+        self.visual_list[:] = self.visual_media(media_list)
+        self.search_index = search_index
+        self.add_to_library(added)
+        self.refresh_thumbnails()
+        
+        if PLAYER['show_metadata']:
+            self.read_metadata(path for path in self.media_list
+                               if path not in self.metadata)
+        self.analyze_loudness(self.media_list)
+        self.refresh_library_view()
+        
+        if LIBRARY['auto_scan'] and LIBRARY['scan_directories']:
+            # One scan catches changes made while the player was closed; the
+            # watcher keeps the library current from then on
+            self.start_library_scan()
+        elif self.media_list:
+            self.find_duplicates()
+        if LIBRARY['watch'] and LIBRARY['scan_directories']:
+            self.start_watcher()
+    
+    @property
+    def audio(self):
+        """Get the audio engine, starting the mixer on first use"""
+        if self._audio is None:
+            from playback import AudioEngine, init_mixer
+            from equalizer import Equalizer
+            rate = init_mixer()[0]
+            self.equalizer = Equalizer(rate, self.eq_gains)
+            self._audio = AudioEngine(
+                post=self.post,
+                on_track_start=self.on_track_start,
+                on_finished=self.on_playback_finished,
+                on_error=self.on_playback_error,
+                equalizer=self.equalizer)
+            self._audio.ring = self.pcm_ring if self.visualizer_active() else None
+            self._audio.set_volume(self.volume_var.get() / 100.0)
+        return self._audio
         
     def create_gui(self):
         # Main container with WMC-style layout
@@ -84,6 +259,12 @@ class MboxPlayer:
         # Category buttons (WMC style)
         self.categories = ["Music", "Pictures + Videos", "Extras", "Settings"]
         self.category_buttons = {}
+        self.category_builders = {
+            "Music": self.create_music_content,
+            "Pictures + Videos": self.create_video_content,
+            "Extras": self.create_extras_content,
+            "Settings": self.create_settings_content,
+        }
         
         for category in self.categories:
             btn = tk.Button(categories_frame, text=category, 
@@ -114,9 +295,26 @@ class MboxPlayer:
         # Playlist button
         playlist_btn = tk.Button(controls_inner, text="📋", font=('Arial', 12),
                                 bg=self.panel_color, fg=self.text_color,
-                                relief=tk.FLAT, bd=0, padx=10, pady=5)
+                                relief=tk.FLAT, bd=0, padx=10, pady=5,
+                                command=self.show_playlists)
         playlist_btn.pack(side=tk.LEFT, padx=5)
         
+        # Shuffle toggle
+        self.shuffle_button = tk.Button(controls_inner, text="🔀", font=('Arial', 12),
+                                        bg=(self.highlight_color if self.play_queue.shuffle
+                                            else self.panel_color),
+                                        fg=self.text_color,
+                                        relief=tk.FLAT, bd=0, padx=10, pady=5,
+                                        command=self.toggle_shuffle)
+        self.shuffle_button.pack(side=tk.LEFT, padx=5)
+        
+        # Visualizer toggle
+        self.visualizer_button = tk.Button(controls_inner, text="📊", font=('Arial', 12),
+                                           bg=self.panel_color, fg=self.text_color,
+                                           relief=tk.FLAT, bd=0, padx=10, pady=5,
+                                           command=self.toggle_visualizer)
+        self.visualizer_button.pack(side=tk.LEFT, padx=5)
+        
         # Volume controls
         vol_minus = tk.Button(controls_inner, text="−", font=('Arial', 12, 'bold'),
                              bg=self.panel_color, fg=self.text_color,
@@ -174,8 +372,15 @@ class MboxPlayer:
         
     def select_category(self, category):
         """Switch between media categories"""
+        previous_view = self.category_views.get(self.current_category)
         self.current_category = category
         
+        # The progress bar lives in the Music view; only poll while it is shown
+        if category == "Music" and self.is_playing:
+            self.start_progress()
+        else:
+            self.stop_progress()
+        
         # Update button highlights
         for cat, btn in self.category_buttons.items():
             if cat == category:
@@ -183,120 +388,170 @@ class MboxPlayer:
             else:
                 btn.configure(bg=self.bg_color, fg=self.text_color)
         
-        # Clear content area
-        for widget in self.content_area.winfo_children():
-            widget.destroy()
-        
-        # Create category-specific content
-        if category == "Music":
-            self.create_music_content()
-        elif category == "Pictures + Videos":
-            self.create_video_content()
-        elif category == "Extras":
-            self.create_extras_content()
-        elif category == "Settings":
-            self.create_settings_content()
-    
-    def create_music_content(self):
+        # Hide the previous view; views are cached rather than destroyed
+        if previous_view is not None:
+            previous_view.pack_forget()
+        
+        # Build category-specific content on first visit
+        view = self.category_views.get(category)
+        if view is None:
+            view = tk.Frame(self.content_area, bg=self.bg_color)
+            self.category_builders[category](view)
+            self.category_views[category] = view
+        view.pack(fill=tk.BOTH, expand=True)
+        if category == "Pictures + Videos":
+            self.thumbnail_grid.refresh()  # Catch up with changes made while hidden
+        
+        # The visualizer lives in the Music view as well; stop it while away
+        self.feed_visualizer(self.visualizer_active())
+    
+    def create_music_content(self, parent):
         """Create music category content"""
         # Title
-        title = tk.Label(self.content_area, text="MUSIC LIBRARY", 
+        title = tk.Label(parent, text="MUSIC LIBRARY", 
                         font=('Arial', 18, 'bold'), 
                         fg=self.text_color, bg=self.bg_color)
         title.pack(pady=(0, 20))
         
-        # Add music button
-        add_btn = tk.Button(self.content_area, text="Add Music Files", 
+        # Add music buttons
+        button_row = tk.Frame(parent, bg=self.bg_color)
+        button_row.pack(pady=10)
+        add_btn = tk.Button(button_row, text="Add Music Files", 
                            font=('Arial', 12, 'bold'),
                            bg=self.highlight_color, fg='white',
                            relief=tk.FLAT, padx=20, pady=10,
                            command=self.add_media)
-        add_btn.pack(pady=10)
+        add_btn.pack(side=tk.LEFT, padx=5)
+        self.add_folder_btn = tk.Button(button_row, text="Add Folder", 
+                                        font=('Arial', 12, 'bold'),
+                                        bg=self.accent_color, fg='white',
+                                        relief=tk.FLAT, padx=20, pady=10,
+                                        command=self.add_folder)
+        self.add_folder_btn.pack(side=tk.LEFT, padx=5)
+        dup_btn = tk.Button(button_row, text="Find Duplicates", 
+                           font=('Arial', 12, 'bold'),
+                           bg=self.accent_color, fg='white',
+                           relief=tk.FLAT, padx=20, pady=10,
+                           command=self.find_duplicates)
+        dup_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Search box, filtering the list as you type
+        search_frame = tk.Frame(parent, bg=self.bg_color)
+        search_frame.pack(fill=tk.X, padx=20)
+        tk.Label(search_frame, text="Search:", font=('Arial', 12),
+                 fg=self.text_color, bg=self.bg_color).pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self.refresh_library_view())
+        tk.Entry(search_frame, textvariable=self.search_var, font=('Arial', 12),
+                 bg=self.panel_color, fg=self.text_color,
+                 insertbackground=self.text_color,
+                 relief=tk.FLAT).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+        self.hide_duplicates_var = tk.BooleanVar(value=PLAYER['collapse_duplicates'])
+        tk.Checkbutton(search_frame, text="Hide duplicates", variable=self.hide_duplicates_var,
+                       command=self.refresh_library_view, font=('Arial', 11),
+                       fg=self.text_color, bg=self.bg_color, selectcolor=self.panel_color,
+                       activebackground=self.bg_color,
+                       activeforeground=self.text_color).pack(side=tk.LEFT)
         
         # Music list
-        list_frame = tk.Frame(self.content_area, bg=self.bg_color)
+        list_frame = tk.Frame(parent, bg=self.bg_color)
         list_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        self.media_listbox = tk.Listbox(list_frame, bg=self.panel_color, fg=self.text_color,
-                                       selectbackground=self.highlight_color, 
-                                       selectforeground='white',
-                                       font=('Arial', 12), height=15)
+        self.media_listbox = VirtualListbox(list_frame, self.media_list,
+                                            formatter=self.library_row,
+                                            bg=self.panel_color, fg=self.text_color,
+                                            selectbackground=self.highlight_color, 
+                                            selectforeground='white',
+                                            font=('Arial', 12), height=15)
         self.media_listbox.pack(fill=tk.BOTH, expand=True)
         self.media_listbox.bind('<Double-Button-1>', self.play_selected)
         
+        # Right-click menu for the up-next queue
+        self.queue_menu = tk.Menu(self.root, tearoff=0)
+        self.queue_menu.add_command(label="Play Next",
+                                    command=lambda: self.enqueue_selected(first=True))
+        self.queue_menu.add_command(label="Add to Up Next", command=self.enqueue_selected)
+        self.media_listbox.bind('<Button-3>', self.show_queue_menu)
+        
+        # Files and folders dropped on the list are imported (needs tkinterdnd2)
+        if getattr(self.root, 'TkdndVersion', None):
+            self.media_listbox.listbox.drop_target_register('DND_Files')
+            self.media_listbox.listbox.dnd_bind('<<Drop>>', self.on_drop)
+        
         # Now playing info
-        self.now_playing_label = tk.Label(self.content_area, 
+        self.now_playing_label = tk.Label(parent, 
                                          text="No music selected", 
                                          font=('Arial', 14), 
                                          fg=self.text_color, bg=self.bg_color)
         self.now_playing_label.pack(pady=10)
         
-        # Progress bar
+        # Waveform seek bar
         self.progress_var = tk.DoubleVar()
-        self.progress_bar = ttk.Progressbar(self.content_area, 
-                                           variable=self.progress_var,
-                                           maximum=100, length=400)
-        self.progress_bar.pack(pady=5)
+        self.progress_bar = WaveformSeekBar(parent, 
+                                            variable=self.progress_var,
+                                            command=self.seek_to, length=400,
+                                            bg=self.panel_color,
+                                            wave_color=self.text_color,
+                                            played_color=self.highlight_color)
+        self.progress_bar.pack(fill=tk.X, padx=20, pady=5)
+        
+        # Spectrum visualizer, packed by set_visualizer
+        self.visualizer_view = SpectrumView(parent, self.visual_frame, height=80,
+                                            bg=self.panel_color,
+                                            bar_color=self.text_color,
+                                            meter_color=self.highlight_color)
     
-    def create_video_content(self):
+    def create_video_content(self, parent):
         """Create video category content"""
         # Title
-        title = tk.Label(self.content_area, text="PICTURES + VIDEOS", 
+        title = tk.Label(parent, text="PICTURES + VIDEOS", 
                         font=('Arial', 18, 'bold'), 
                         fg=self.text_color, bg=self.bg_color)
         title.pack(pady=(0, 20))
         
-        # Video grid (placeholder)
-        grid_frame = tk.Frame(self.content_area, bg=self.bg_color)
-        grid_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Picture library
-        pic_frame = tk.Frame(grid_frame, bg=self.panel_color, width=200, height=150)
-        pic_frame.pack(side=tk.LEFT, padx=10, pady=10)
-        pic_frame.pack_propagate(False)
-        
-        tk.Label(pic_frame, text="Picture Library", 
-                font=('Arial', 12, 'bold'), 
-                fg=self.text_color, bg=self.panel_color).pack(pady=20)
-        
-        # Video library
-        vid_frame = tk.Frame(grid_frame, bg=self.panel_color, width=200, height=150)
-        vid_frame.pack(side=tk.LEFT, padx=10, pady=10)
-        vid_frame.pack_propagate(False)
-        
-        tk.Label(vid_frame, text="Video Library", 
-                font=('Arial', 12, 'bold'), 
-                fg=self.text_color, bg=self.panel_color).pack(pady=20)
-        
         # Add media button
-        add_btn = tk.Button(self.content_area, text="Add Media Files", 
+        add_btn = tk.Button(parent, text="Add Media Files", 
                            font=('Arial', 12, 'bold'),
                            bg=self.highlight_color, fg='white',
                            relief=tk.FLAT, padx=20, pady=10,
                            command=self.add_media)
         add_btn.pack(pady=10)
+        
+        # Thumbnail grid of the pictures and videos in the library
+        from thumbnails import ThumbnailCache
+        self.thumbnail_cache = ThumbnailCache(
+            post=self.post,
+            fingerprints=self.fingerprint_store)
+        self.thumbnail_grid = ThumbnailGrid(parent, self.visual_list,
+                                            self.thumbnail_cache,
+                                            on_open=self.open_visual_media,
+                                            bg=self.bg_color, fg=self.text_color,
+                                            placeholder=self.panel_color)
+        self.thumbnail_grid.pack(fill=tk.BOTH, expand=True, pady=10)
     
-    def create_extras_content(self):
+    def create_extras_content(self, parent):
         """Create extras category content"""
-        title = tk.Label(self.content_area, text="EXTRAS", 
+        title = tk.Label(parent, text="EXTRAS", 
                         font=('Arial', 18, 'bold'), 
                         fg=self.text_color, bg=self.bg_color)
         title.pack(pady=(0, 20))
         
         # Extras options
         extras = ["Play Favorites", "Media Info", "Equalizer", "Playlists"]
+        commands = {"Playlists": self.show_playlists, "Equalizer": self.show_equalizer}
         
         for extra in extras:
-            btn = tk.Button(self.content_area, text=extra, 
+            btn = tk.Button(parent, text=extra, 
                            font=('Arial', 14, 'bold'),
                            bg=self.bg_color, fg=self.text_color,
                            relief=tk.FLAT, bd=0, padx=20, pady=15,
-                           anchor=tk.W, width=25)
+                           anchor=tk.W, width=25,
+                           command=commands.get(extra))
             btn.pack(fill=tk.X, pady=2)
     
-    def create_settings_content(self):
+    def create_settings_content(self, parent):
         """Create settings category content"""
-        title = tk.Label(self.content_area, text="SETTINGS", 
+        title = tk.Label(parent, text="SETTINGS", 
                         font=('Arial', 18, 'bold'), 
                         fg=self.text_color, bg=self.bg_color)
         title.pack(pady=(0, 20))
@@ -305,7 +560,7 @@ class MboxPlayer:
         settings = ["Audio Settings", "Video Settings", "Interface Settings", "About"]
         
         for setting in settings:
-            btn = tk.Button(self.content_area, text=setting, 
+            btn = tk.Button(parent, text=setting, 
                            font=('Arial', 14, 'bold'),
                            bg=self.bg_color, fg=self.text_color,
                            relief=tk.FLAT, bd=0, padx=20, pady=15,
@@ -319,9 +574,11 @@ class MboxPlayer:
     def add_media(self):
         """Add media files to the library"""
         filetypes = [
-            ('Media files', '*.mp4 *.avi *.mkv *.mov *.wmv *.flv *.webm *.mp3 *.wav *.flac *.m4a *.ogg'),
+            ('Media files', '*.mp4 *.avi *.mkv *.mov *.wmv *.flv *.webm *.mp3 *.wav *.flac *.m4a *.ogg '
+                            '*.jpg *.jpeg *.png *.gif *.bmp *.webp'),
             ('Video files', '*.mp4 *.avi *.mkv *.mov *.wmv *.flv *.webm'),
             ('Audio files', '*.mp3 *.wav *.flac *.m4a *.ogg'),
+            ('Picture files', '*.jpg *.jpeg *.png *.gif *.bmp *.webp'),
             ('All files', '*.*')
         ]
         
@@ -330,32 +587,354 @@ class MboxPlayer:
             filetypes=filetypes
         )
         
-        for file in files:
-            if file not in self.media_list:
-                self.media_list.append(file)
-                filename = os.path.basename(file)
-                self.media_listbox.insert(tk.END, filename)
+        if files:
+            self.import_paths(files)
+    
+    def add_folder(self):
+        """Add every audio and video file under a folder, or cancel a running import"""
+        if self.importer is not None and self.importer.is_running():
+            self.importer.cancel()
+            return
+        folder = filedialog.askdirectory(title="Select a media folder")
+        if folder:
+            self.import_paths([folder])
+    
+    def on_drop(self, event):
+        """Import files and folders dropped on the music list"""
+        self.import_paths(self.root.tk.splitlist(event.data))
+        return event.action
+    
+    def import_paths(self, sources):
+        """Import files and folders in the background, adding them in batches"""
+        if self.importer is not None and self.importer.is_running():
+            messagebox.showinfo("Import", "An import is already in progress")
+            return
+        self.import_added = 0
+        self.importer = FolderImporter(
+            sources,
+            on_batch=lambda paths: self.post(self.on_import_batch, paths),
+            on_complete=lambda result: self.post(self.on_import_complete, result))
+        self.add_folder_btn.config(text="Cancel Import")
+        self.status_var.set("Importing...")
+        self.importer.start()
+    
+    def on_import_batch(self, paths):
+        """Add one batch of imported paths to the store, list and index"""
+        added = self.library_store.add_many(paths)
+        self.add_to_library(added)
+        self.update_library_view(added)
+        self.read_metadata(added)
+        self.import_added += len(added)
+        self.status_var.set(f"Importing... {self.import_added} files added")
+    
+    def on_import_complete(self, result):
+        """Finish an import once the background walk is done"""
+        self.add_folder_btn.config(text="Add Folder")
+        self.refresh_thumbnails()
+        state = "cancelled" if result['cancelled'] else "complete"
+        self.status_var.set(f"Import {state}: added {self.import_added} media files")
+        if self.import_added:
+            self.find_duplicates()
+    
+    def start_library_scan(self):
+        """Rescan the configured directories in the background"""
+        if self.scanner is not None and self.scanner.is_running():
+            return
+        self.status_var.set("Scanning library...")
+        self.scanner = LibraryScanner(
+            self.library_index,
+            on_progress=lambda done, total: self.post(
+                self.status_var.set, f"Scanning library... {done}/{total}"),
+            on_complete=lambda result: self.post(self.on_scan_complete, result))
+        self.scanner.start()
+    
+    def on_scan_complete(self, result):
+        """Merge the results of a library scan into the media list"""
+        self.merge_library_changes(result['updated'], result['removed'])
+        self.status_var.set(f"Library scan: {result['seen']} files, "
+                            f"{len(result['updated'])} updated, "
+                            f"{len(result['removed'])} removed"
+                            + (f", {len(result['unreachable'])} folders unreachable"
+                               if result['unreachable'] else ""))
+        self.find_duplicates()
+    
+    def start_watcher(self):
+        """Watch the configured directories for added, changed and removed files"""
+        if self.watcher is not None and self.watcher.is_running():
+            return
+        self.watcher = LibraryWatcher(
+            self.library_index,
+            on_changes=lambda result: self.post(self.on_library_changes, result))
+        self.watcher.start()
+    
+    def on_library_changes(self, result):
+        """Apply a batch of changes reported by the watcher"""
+        if result['rescan']:
+            self.start_library_scan()  # Events were lost, so the batch may be incomplete
+        self.merge_library_changes(result['updated'], result['removed'])
+        self.status_var.set(f"Library updated: {len(result['updated'])} changed, "
+                            f"{len(result['removed'])} removed")
+        if result['updated']:
+            self.find_duplicates()
+    
+    def merge_library_changes(self, updated, removed):
+        """Bring the media list, search index and views in line with the library index"""
+        removed = set(removed)
+        positions = []
+        if removed:
+            positions = [i for i, path in enumerate(self.media_list) if path in removed]
+            self.media_list[:] = [path for path in self.media_list if path not in removed]
+            self.visual_list[:] = [path for path in self.visual_list if path not in removed]
+            for file_path in removed:
+                self.search_index.remove(file_path)
+                self.duplicates.pop(file_path, None)
+        if positions and self.playing_list is self.media_list:
+            self.play_queue.remove(positions)
+            self.queue_next_track()  # The prefetched track may have moved or gone
+        if self.media_listbox.items is self.media_list:
+            for row in reversed(positions):
+                self.media_listbox.rows_removed(row)
+        self.add_to_library(updated)
         
-        self.save_settings()
-        self.status_var.set(f"Added {len(files)} media files")
+        self.update_library_view(removed.union(updated))
+        self.refresh_thumbnails()
+        self.read_metadata(updated)
+    
+    def add_to_library(self, paths):
+        """Append paths not yet in the library to the media list and search index"""
+        if self.search_index is None:
+            # Still loading at startup; indexed once the load hands over
+            self.media_list.extend(paths)
+            self.visual_list.extend(self.visual_media(paths))
+        else:
+            for file_path in paths:
+                if file_path not in self.search_index:
+                    self.search_index.add(file_path, self.metadata.get(file_path))
+                    self.media_list.append(file_path)
+                    if self.is_visual_media(file_path):
+                        self.visual_list.append(file_path)
+        if self.playing_list is self.media_list:
+            self.play_queue.set_length(len(self.media_list))
+    
+    def refresh_library_view(self):
+        """Show the media list, or only the entries matching the search box"""
+        query = self.search_var.get().strip()
+        hide = bool(self.duplicates) and self.hide_duplicates_var.get()
+        if not query and not hide:
+            if self.media_listbox.items is not self.media_list:
+                self.media_listbox.set_items(self.media_list)
+            else:
+                self.media_listbox.refresh()
+            return
+        if not query:
+            matches = self.media_list
+        else:
+            matches = self.search_index.search(query) if self.search_index is not None else []
+        if hide:
+            matches = [path for path in matches if path not in self.duplicates]
+        self.shown = {path: self.search_index.entry_id(path) for path in matches}
+        self.shown_ids = list(self.shown.values())
+        if matches != self.media_listbox.items:
+            self.media_listbox.set_items(matches)
+        else:
+            self.media_listbox.refresh()
+    
+    def update_library_view(self, paths):
+        """Show changes to some paths in the music list, inserting or removing only their rows"""
+        listbox = self.media_listbox
+        if listbox.items is self.media_list or self.search_index is None:
+            listbox.refresh()  # Unfiltered, the rows already follow media_list
+            return
+        query = self.search_var.get().strip()
+        hide = bool(self.duplicates) and self.hide_duplicates_var.get()
+        for file_path in paths:
+            wanted = (self.search_index.matches(file_path, query)
+                      and not (hide and file_path in self.duplicates))
+            entry = self.shown.get(file_path)
+            if entry is not None and not wanted:
+                row = bisect_left(self.shown_ids, entry)
+                del listbox.items[row], self.shown_ids[row], self.shown[file_path]
+                listbox.rows_removed(row)
+            elif entry is None and wanted:
+                entry = self.search_index.entry_id(file_path)
+                row = bisect_left(self.shown_ids, entry)
+                listbox.items.insert(row, file_path)
+                self.shown_ids.insert(row, entry)
+                self.shown[file_path] = entry
+                listbox.rows_inserted(row)
+        listbox.refresh()
+    
+    def library_row(self, file_path):
+        """Get the music list text for an entry, marking duplicates"""
+        if file_path in self.duplicates:
+            return f"{self.media_title(file_path)}  (duplicate)"
+        return self.media_title(file_path)
+    
+    def find_duplicates(self):
+        """Look for files with the same contents in the background"""
+        if self.duplicate_finder is not None and self.duplicate_finder.is_running():
+            return
+        self.duplicate_finder = DuplicateFinder(
+            self.fingerprint_store, self.media_list,
+            index=self.library_index,
+            on_progress=lambda done, total: self.post(
+                self.status_var.set, f"Checking for duplicates... {done}/{total}"),
+            on_complete=lambda result: self.post(self.on_duplicates, result))
+        self.duplicate_finder.start()
+    
+    def on_duplicates(self, result):
+        """Mark the duplicates found by the fingerprinting pass"""
+        if result['cancelled']:
+            return
+        self.duplicates = {path: group[0] for group in result['groups'] for path in group[1:]}
+        self.refresh_library_view()
+        if result['error'] is not None:
+            self.status_var.set(f"Duplicate check incomplete: {result['error']}")
+        elif self.duplicates:
+            self.status_var.set(f"Found {len(self.duplicates)} duplicate files "
+                                f"in {len(result['groups'])} groups")
+        else:
+            self.status_var.set("No duplicate files found")
+    
+    def is_visual_media(self, file_path):
+        """Check whether a path is a picture or video"""
+        return os.path.splitext(file_path)[1].lower() in self.visual_extensions
+    
+    def visual_media(self, paths):
+        """Get the pictures and videos among some paths"""
+        return [path for path in paths if self.is_visual_media(path)]
+    
+    def refresh_thumbnails(self):
+        """Redraw the thumbnail grid after visual_list changed, keeping its scroll position"""
+        if self.current_category == "Pictures + Videos":
+            self.thumbnail_grid.refresh()
+    
+    def open_visual_media(self, file_path):
+        """Open a picture or video from the thumbnail grid"""
+        if os.path.splitext(file_path)[1].lower() in MEDIA['supported_image']:
+            self.show_picture(file_path)
+        else:
+            self.play_from(self.media_list, self.media_list.index(file_path))
+    
+    def show_picture(self, file_path):
+        """Show a picture in its own window"""
+        from PIL import Image, ImageTk
+        try:
+            image = Image.open(file_path)
+            image.draft('RGB', (1280, 960))
+            image = image.convert('RGB')
+            image.thumbnail((1280, 960))
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open picture: {str(e)}")
+            return
+        
+        viewer = tk.Toplevel(self.root, bg='black')
+        viewer.title(os.path.basename(file_path))
+        viewer.photo = ImageTk.PhotoImage(image)
+        tk.Label(viewer, image=viewer.photo, bg='black').pack()
+        viewer.bind('<Escape>', lambda e: viewer.destroy())
+    
+    def read_metadata(self, paths):
+        """Queue files for background tag extraction"""
+        if PLAYER['show_metadata']:
+            self.metadata_pipeline.submit(paths)
+    
+    def on_metadata(self, records):
+        """Receive a batch of tag records from the metadata pipeline"""
+        for record in records:
+            self.metadata[record['path']] = record
+            if self.search_index is not None and record['path'] in self.search_index:
+                self.search_index.add(record['path'], record)
+            if record['path'] == self.current_media:
+                self.track_duration = record.get('duration')
+        self.analyze_loudness(record['path'] for record in records)
+        self.update_library_view([record['path'] for record in records])
+    
+    def analyze_loudness(self, paths):
+        """Queue audio files without a known gain for loudness analysis"""
+        if self.loudness is None:
+            return
+        self.loudness.request(
+            path for path in paths
+            if os.path.splitext(path)[1].lower() in MEDIA['supported_audio']
+            and (self.metadata.get(path) or {}).get('gain') is None)
+    
+    def on_loudness(self, records):
+        """Receive measured gains; they apply from the next time a track starts"""
+        for record in records:
+            self.metadata.setdefault(record['path'], {}).update(record)
+    
+    def track_gain(self, file_path):
+        """Get the loudness normalization gain for a file, 1.0 if unknown or off"""
+        if self.loudness is None:
+            return 1.0
+        from loudness import gain_factor
+        return gain_factor(self.metadata.get(file_path))
+    
+    def media_title(self, file_path):
+        """Get the display name for a library entry"""
+        return display_name(file_path, self.metadata.get(file_path))
     
     def play_selected(self, event=None):
         """Play the selected media file"""
         selection = self.media_listbox.curselection()
         if selection:
-            self.current_index = selection[0]
-            self.play_media()
+            self.play_from(self.media_list,
+                           self.media_list.index(self.media_listbox.items[selection[0]]))
+    
+    def play_from(self, items, position):
+        """Play a position of the library or a playlist, which becomes the play queue's list"""
+        if self.playing_list is not items:
+            self.playing_list = items
+            self.play_queue.reset(len(items))
+        self.play_queue.jump(position)
+        self.play_media()
+    
+    def show_queue_menu(self, event):
+        """Select the row under the pointer and show the up-next menu"""
+        row = self.media_listbox.listbox.nearest(event.y)
+        self.media_listbox.selection_set(self.media_listbox.top + row)
+        self.media_listbox.refresh()
+        self.queue_menu.tk_popup(event.x_root, event.y_root)
+    
+    def enqueue_selected(self, first=False):
+        """Add the selected library entry to the up-next queue"""
+        selection = self.media_listbox.curselection()
+        if not selection:
+            return
+        file_path = self.media_listbox.items[selection[0]]
+        if self.playing_list is not self.media_list:
+            # Up next holds library positions, so carry on from the library
+            self.playing_list = self.media_list
+            self.play_queue.reset(len(self.media_list))
+            if self.current_media in self.media_list:
+                self.play_queue.jump(self.media_list.index(self.current_media))
+        self.play_queue.enqueue(self.media_list.index(file_path), first=first)
+        if self.is_playing and self._audio is not None:
+            self.queue_next_track()
+        self.status_var.set(f"Up next: {self.media_title(file_path)}")
+    
+    def toggle_shuffle(self):
+        """Switch shuffle on or off"""
+        self.play_queue.set_shuffle(not self.play_queue.shuffle)
+        self.shuffle_button.config(bg=self.highlight_color if self.play_queue.shuffle
+                                   else self.panel_color)
+        if self.is_playing and self._audio is not None:
+            self.queue_next_track()
+        self.save_settings()
     
     def play_media(self):
         """Play the current media file"""
-        if not self.media_list:
+        if not self.playing_list:
             return
             
-        if self.current_index >= len(self.media_list):
-            self.current_index = 0
+        if (self.play_queue.current is None
+                or self.play_queue.current >= len(self.playing_list)):
+            self.play_queue.reset(len(self.playing_list))
+            self.play_queue.next()
             
-        file_path = self.media_list[self.current_index]
-        filename = os.path.basename(file_path)
+        file_path = self.playing_list[self.play_queue.current]
+        filename = self.media_title(file_path)
         
         self.now_playing_label.config(text=f"Now Playing: {filename}")
         self.status_var.set(f"Playing: {filename}")
@@ -365,134 +944,569 @@ class MboxPlayer:
         
         if ext in ['.mp3', '.wav', '.flac', '.m4a', '.ogg']:
             self.play_audio(file_path)
+        elif ext in MEDIA['supported_image']:
+            self.show_picture(file_path)
         else:
             self.play_video(file_path)
     
+    def media_player(self):
+        """Get the engine (audio or video) that plays the current media"""
+        if (self.current_media is not None and
+                os.path.splitext(self.current_media)[1].lower() in MEDIA['supported_video']):
+            return self.video
+        return self.audio
+    
     def play_audio(self, file_path):
         """Play audio file using pygame"""
-        try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-            self.is_playing = True
-            self.play_button.config(text="⏸", bg=self.highlight_color)
-            self.update_progress()
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not play audio: {str(e)}")
+        self.save_position()
+        if self.video is not None:
+            self.video.stop()
+        self.audio.play(file_path, start=self.resume_position(file_path),
+                        gain=self.track_gain(file_path))
+        self.current_media = file_path
+        self.track_duration = (self.metadata.get(file_path) or {}).get('duration')
+        if self.track_duration is None:
+            self.read_metadata([file_path])
+        self.show_waveform(file_path)
+        self.is_playing = True
+        self.play_button.config(text="⏸", bg=self.highlight_color)
+        self.progress_var.set(0)
+        self.start_progress()
+        self.queue_next_track()
+    
+    def queue_next_track(self):
+        """Tell the audio engine what to continue with so it can prefetch it"""
+        next_path = None
+        if MEDIA['auto_play_next'] and self.playing_list:
+            candidate = self.playing_list[self.play_queue.peek_next()]
+            if os.path.splitext(candidate)[1].lower() in MEDIA['supported_audio']:
+                next_path = candidate
+        self.audio.set_next(next_path, self.track_gain(next_path))
+    
+    def on_track_start(self, file_path, duration):
+        """Handle a track starting in the audio engine"""
+        if file_path != self.current_media:
+            # Gapless auto-advance to the prefetched track
+            if self.current_media is not None:
+                self.resume_store.forget(self.current_media)
+            next_index = self.play_queue.peek_next()
+            if next_index is not None and self.playing_list[next_index] == file_path:
+                self.play_queue.next()
+            self.current_media = file_path
+            self.track_duration = (self.metadata.get(file_path) or {}).get('duration')
+            filename = self.media_title(file_path)
+            self.now_playing_label.config(text=f"Now Playing: {filename}")
+            self.status_var.set(f"Playing: {filename}")
+            self.show_waveform(file_path)
+            self.queue_next_track()
+        if self.track_duration is None:
+            self.track_duration = duration
+    
+    def toggle_visualizer(self):
+        """Show or hide the spectrum visualizer"""
+        self.set_visualizer(not self.show_visualizer)
+        self.save_settings()
+    
+    def set_visualizer(self, shown):
+        """Show the visualizer and feed it from the engine, or hide it and stop both"""
+        self.show_visualizer = shown
+        if shown:
+            if self.pcm_ring is None:
+                from visualizer import PCMRing, SpectrumAnalyzer, RING_SECONDS
+                rate = self._audio.rate if self._audio is not None else ADVANCED['sample_rate']
+                self.pcm_ring = PCMRing(int(rate * RING_SECONDS), ADVANCED['channels'])
+                self.spectrum = SpectrumAnalyzer(rate)
+            self.visualizer_view.pack(fill=tk.X, padx=20, pady=5, after=self.progress_bar)
+        else:
+            self.visualizer_view.pack_forget()
+        self.feed_visualizer(self.visualizer_active())
+        self.visualizer_button.config(bg=self.highlight_color if shown else self.panel_color)
+    
+    def visualizer_active(self):
+        """Check whether the visualizer is switched on and its Music view is shown"""
+        return (self.show_visualizer and self.pcm_ring is not None
+                and self.current_category == "Music")
+    
+    def feed_visualizer(self, active):
+        """Start or stop the visualizer's redraws and the engine's copies into its ring"""
+        if self._audio is not None:
+            self._audio.ring = self.pcm_ring if active else None
+        if active:
+            self.visualizer_view.start()
+        else:
+            self.visualizer_view.stop()
+    
+    def visual_frame(self):
+        """Get spectrum bands and channel levels for the audio playing now"""
+        window = None
+        if self._audio is not None and self.is_playing:
+            end = self._audio.output_frame()
+            if end is not None:
+                window = self.pcm_ring.window(end, self.spectrum.size)
+        if window is None:
+            return self.spectrum.silence(), (0.0,) * self.pcm_ring.channels
+        return self.spectrum.analyze(window)
+    
+    def show_waveform(self, file_path):
+        """Draw cached peaks for a track, building them in the background if needed"""
+        if self.peak_cache is None:
+            from waveform import PeakCache
+            self.peak_cache = PeakCache(
+                post=self.post)
+        cached = self.peak_cache.load(file_path)
+        self.progress_bar.set_peaks(cached[0] if cached else None)
+        if cached is None:
+            self.peak_cache.request(file_path, self.on_peaks)
+    
+    def on_peaks(self, file_path, result):
+        """Receive freshly built peaks from the peak cache"""
+        if file_path == self.current_media and result is not None:
+            self.progress_bar.set_peaks(result[0])
+    
+    def seek_to(self, fraction):
+        """Seek to a fraction of the current track"""
+        if self.current_media is not None and self.track_duration:
+            self.media_player().seek(fraction * self.track_duration)
+            self.progress_var.set(fraction * 100)
+    
+    def on_playback_finished(self):
+        """Handle the audio or video engine running out of media"""
+        if self.current_media is None or self.media_player().is_active():
+            return  # Stopped, or a new track was started meanwhile
+        self.resume_store.forget(self.current_media)
+        self.is_playing = False
+        self.current_media = None
+        self.stop_progress()
+        self.progress_var.set(100)
+        self.play_button.config(text="▶", bg=self.highlight_color)
+        if MEDIA['auto_play_next'] and len(self.playing_list) > 1:
+            # The next item could not be prefetched (a video, or a long
+            # track that is only decoded when it is played)
+            self.next_track()
+        else:
+            self.status_var.set("Finished")
+    
+    def on_playback_error(self, file_path, error):
+        """Report a file the audio or video engine could not decode"""
+        if file_path == self.current_media and not self.media_player().is_active():
+            self.is_playing = False
+            self.current_media = None
+            self.stop_progress()
+            self.play_button.config(text="▶", bg=self.highlight_color)
+        messagebox.showerror("Error", f"Could not play {os.path.basename(file_path)}: {str(error)}")
+    
+    def show_video_window(self):
+        """Create the video window on first use and bring it forward"""
+        if self.video_window is None:
+            from video import VideoPlayer
+            self.video_window = tk.Toplevel(self.root, bg='black')
+            self.video_window.protocol("WM_DELETE_WINDOW", self.close_video_window)
+            view = VideoCanvas(self.video_window, width=960, height=540)
+            view.pack(fill=tk.BOTH, expand=True)
+            self.video = VideoPlayer(view, post=self.post,
+                                     on_start=self.on_track_start,
+                                     on_finished=self.on_playback_finished,
+                                     on_error=self.on_playback_error)
+        self.video_window.deiconify()
+        self.video_window.lift()
+        self.video_window.update_idletasks()  # Size the canvas before fitting frames
+    
+    def close_video_window(self):
+        """Stop the video and hide its window"""
+        if self.video.is_active():
+            self.stop_media()
+        self.video_window.withdraw()
     
     def play_video(self, file_path):
-        """Play video file using VLC"""
-        try:
-            # Check VLC availability at runtime
-            try:
-                import vlc
-                vlc_available = True
-            except:
-                vlc_available = False
-            
-            if vlc_available:
-                # VLC implementation would go here
-                self.is_playing = True
-                self.play_button.config(text="⏸", bg=self.highlight_color)
-                self.status_var.set(f"Video playback with VLC (not fully implemented)")
-            else:
-                # Show a placeholder for video files when VLC is not available
-                self.is_playing = True
-                self.play_button.config(text="⏸", bg=self.highlight_color)
-                self.status_var.set(f"Video playback requires VLC media player to be installed")
-                messagebox.showinfo("Video Playback", 
-                                  "Video playback requires VLC media player to be installed.\n"
-                                  "Please install VLC from https://www.videolan.org/")
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not play video: {str(e)}")
+        """Play video file in the video window"""
+        self.save_position()
+        if self._audio is not None:
+            self.audio.stop()
+        self.show_video_window()
+        self.current_media = file_path
+        self.video.play(file_path, start=self.resume_position(file_path))
+        self.video_window.title(os.path.basename(file_path))
+        # Filled in by on_track_start once the decoder has opened the file
+        self.track_duration = (self.metadata.get(file_path) or {}).get('duration')
+        self.progress_bar.set_peaks(None)
+        self.is_playing = True
+        self.play_button.config(text="⏸", bg=self.highlight_color)
+        self.progress_var.set(0)
+        self.start_progress()
     
     def play_pause(self):
         """Toggle play/pause"""
-        if not self.media_list:
+        if not self.playing_list:
             return
             
         if self.is_playing:
-            pygame.mixer.music.pause()
+            self.save_position()
+            self.media_player().pause()
             self.is_playing = False
+            self.stop_progress()
             self.play_button.config(text="▶", bg=self.highlight_color)
             self.status_var.set("Paused")
         else:
             if self.current_media is None:
                 self.play_media()
             else:
-                pygame.mixer.music.unpause()
+                self.media_player().resume()
                 self.is_playing = True
+                self.start_progress()
                 self.play_button.config(text="⏸", bg=self.highlight_color)
                 self.status_var.set("Playing")
     
     def stop_media(self):
         """Stop current media playback"""
-        pygame.mixer.music.stop()
+        self.save_position()
+        if self._audio is not None:
+            self.audio.stop()
+        if self.video is not None:
+            self.video.stop()
         self.is_playing = False
         self.current_media = None
+        self.stop_progress()
         self.play_button.config(text="▶", bg=self.highlight_color)
         self.progress_var.set(0)
         self.status_var.set("Stopped")
     
     def previous_track(self):
         """Play previous track"""
-        if self.media_list:
-            self.current_index = (self.current_index - 1) % len(self.media_list)
+        if self.playing_list:
+            self.play_queue.previous()
             self.play_media()
     
     def next_track(self):
         """Play next track"""
-        if self.media_list:
-            self.current_index = (self.current_index + 1) % len(self.media_list)
+        if self.playing_list:
+            self.play_queue.next()
             self.play_media()
     
+    def show_playlists(self):
+        """Open the playlist manager window"""
+        if self.playlist_window is not None and self.playlist_window.winfo_exists():
+            self.playlist_window.lift()
+            return
+        window = self.playlist_window = tk.Toplevel(self.root, bg=self.bg_color)
+        window.title("Playlists")
+        window.geometry("800x500")
+        
+        buttons = tk.Frame(window, bg=self.bg_color)
+        buttons.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
+        for text, command in (("Play", self.play_playlist),
+                              ("Save Library View", self.new_playlist),
+                              ("Import...", self.import_playlist),
+                              ("Export...", self.export_playlist),
+                              ("Delete", self.delete_playlist)):
+            tk.Button(buttons, text=text, font=('Arial', 11, 'bold'),
+                      bg=self.accent_color, fg='white', relief=tk.FLAT,
+                      padx=12, pady=6, command=command).pack(side=tk.LEFT, padx=5)
+        
+        self.playlist_names = tk.Listbox(window, font=('Arial', 12), width=24,
+                                         bg=self.panel_color, fg=self.text_color,
+                                         selectbackground=self.highlight_color,
+                                         exportselection=False)
+        self.playlist_names.pack(side=tk.LEFT, fill=tk.Y, padx=(10, 5), pady=10)
+        self.playlist_names.bind('<<ListboxSelect>>', lambda e: self.show_playlist_tracks())
+        
+        # Only the rows on screen are resolved from track ids to paths
+        self.playlist_tracks = VirtualListbox(window, [], formatter=self.media_title,
+                                              bg=self.panel_color, fg=self.text_color,
+                                              selectbackground=self.highlight_color,
+                                              selectforeground='white')
+        self.playlist_tracks.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 10), pady=10)
+        self.playlist_tracks.bind('<Double-Button-1>', self.play_playlist)
+        
+        self.refresh_playlist_names()
+    
+    def show_equalizer(self):
+        """Open the equalizer window"""
+        if self.equalizer_window is not None and self.equalizer_window.winfo_exists():
+            self.equalizer_window.lift()
+            return
+        from equalizer import BANDS, MAX_GAIN
+        self.eq_gains += [0.0] * (len(BANDS) - len(self.eq_gains))
+        window = self.equalizer_window = tk.Toplevel(self.root, bg=self.bg_color)
+        window.title("Equalizer")
+        window.protocol("WM_DELETE_WINDOW", self.close_equalizer)
+        
+        sliders = tk.Frame(window, bg=self.bg_color)
+        sliders.pack(padx=10, pady=10)
+        self.eq_scales = []
+        for band, frequency in enumerate(BANDS):
+            column = tk.Frame(sliders, bg=self.bg_color)
+            column.pack(side=tk.LEFT, padx=4)
+            scale = tk.Scale(column, from_=MAX_GAIN, to=-MAX_GAIN, resolution=0.5,
+                             length=220, orient=tk.VERTICAL, showvalue=False,
+                             bg=self.bg_color, fg=self.text_color,
+                             troughcolor=self.panel_color, highlightthickness=0,
+                             command=lambda value, band=band: self.set_eq_gain(band, value))
+            scale.set(self.eq_gains[band])
+            scale.pack()
+            label = f"{frequency // 1000}k" if frequency >= 1000 else str(frequency)
+            tk.Label(column, text=label, font=('Arial', 9),
+                     fg=self.text_color, bg=self.bg_color).pack()
+            self.eq_scales.append(scale)
+        
+        tk.Button(window, text="Flat", font=('Arial', 11, 'bold'),
+                  bg=self.accent_color, fg='white', relief=tk.FLAT, padx=12, pady=6,
+                  command=self.reset_equalizer).pack(pady=(0, 10))
+    
+    def set_eq_gain(self, band, value):
+        """Change one equalizer band; the filter is rebuilt here, not during playback"""
+        if self.eq_gains[band] == float(value):
+            return  # Echo of a scale.set() from show_equalizer or reset_equalizer
+        self.eq_gains[band] = float(value)
+        if self.equalizer is not None:
+            self.equalizer.set_gains(self.eq_gains)
+    
+    def reset_equalizer(self):
+        """Set every band to 0 dB, rebuilding the filter once rather than per band"""
+        self.eq_gains = [0.0] * len(self.eq_scales)
+        for scale in self.eq_scales:
+            scale.set(0)
+        if self.equalizer is not None:
+            self.equalizer.set_gains(self.eq_gains)
+    
+    def close_equalizer(self):
+        """Save the equalizer bands and close their window"""
+        self.save_settings()
+        self.equalizer_window.destroy()
+    
+    def refresh_playlist_names(self, select=None):
+        """Fill the playlist manager with the stored playlist names"""
+        names = self.playlist_store.names()
+        self.playlist_names.delete(0, tk.END)
+        self.playlist_names.insert(tk.END, *names)
+        if select in names:
+            self.playlist_names.selection_set(names.index(select))
+        self.show_playlist_tracks()
+    
+    def selected_playlist(self):
+        """Get the playlist selected in the manager, or None"""
+        selection = self.playlist_names.curselection()
+        if not selection:
+            return None
+        return self.playlist_store.get(self.playlist_names.get(selection[0]))
+    
+    def show_playlist_tracks(self):
+        """Show the tracks of the selected playlist"""
+        playlist = self.selected_playlist()
+        self.playlist_tracks.set_items(playlist if playlist is not None else [])
+    
+    def play_playlist(self, event=None):
+        """Make the selected playlist the play queue, starting at the selected track"""
+        playlist = self.selected_playlist()
+        if playlist is None or not len(playlist):
+            return
+        selection = self.playlist_tracks.curselection()
+        self.play_from(playlist, selection[0] if selection else 0)
+    
+    def new_playlist(self):
+        """Save the music list as shown (e.g. filtered by a search) as a playlist"""
+        name = simpledialog.askstring("New Playlist", "Playlist name:", parent=self.playlist_window)
+        if not name:
+            return
+        playlist = self.playlist_store.create(name, self.media_listbox.items)
+        self.refresh_playlist_names(select=name)
+        self.status_var.set(f"Saved playlist {name} ({len(playlist)} tracks)")
+    
+    def import_playlist(self):
+        """Import an M3U or PLS file in the background"""
+        file_path = filedialog.askopenfilename(
+            title="Import playlist", parent=self.playlist_window,
+            filetypes=[('Playlists', ' '.join(f'*{ext}' for ext in PLAYLIST_EXTENSIONS))])
+        if not file_path:
+            return
+        self.status_var.set(f"Importing playlist {os.path.basename(file_path)}...")
+        
+        def run():
+            try:
+                playlist = self.playlist_store.import_file(file_path)
+            except Exception as e:
+                self.post(messagebox.showerror, "Error", f"Could not import playlist: {str(e)}")
+            else:
+                self.post(self.on_playlist_imported, playlist)
+        threading.Thread(target=run, daemon=True).start()
+    
+    def on_playlist_imported(self, playlist):
+        """Show a playlist once its import has finished"""
+        if self.playlist_window is not None and self.playlist_window.winfo_exists():
+            self.refresh_playlist_names(select=playlist.name)
+        self.status_var.set(f"Imported playlist {playlist.name} ({len(playlist)} tracks)")
+    
+    def export_playlist(self):
+        """Export the selected playlist as M3U or PLS"""
+        playlist = self.selected_playlist()
+        if playlist is None:
+            return
+        file_path = filedialog.asksaveasfilename(
+            title="Export playlist", parent=self.playlist_window,
+            initialfile=f"{playlist.name}.m3u", defaultextension='.m3u',
+            filetypes=[('M3U playlist', '*.m3u *.m3u8'), ('PLS playlist', '*.pls')])
+        if not file_path:
+            return
+        try:
+            count = self.playlist_store.export_file(playlist.name, file_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not export playlist: {str(e)}")
+            return
+        self.status_var.set(f"Exported {count} tracks to {os.path.basename(file_path)}")
+    
+    def delete_playlist(self):
+        """Delete the selected playlist"""
+        playlist = self.selected_playlist()
+        if playlist is None or not messagebox.askyesno(
+                "Delete Playlist", f"Delete playlist {playlist.name}?",
+                parent=self.playlist_window):
+            return
+        if self.playing_list is playlist:
+            self.playing_list = self.media_list
+            self.play_queue.reset(len(self.media_list))
+        self.playlist_store.delete(playlist.name)
+        self.refresh_playlist_names()
+    
     def set_volume(self, value):
         """Set volume level"""
         volume = float(value) / 100.0
-        pygame.mixer.music.set_volume(volume)
+        if self._audio is not None:
+            self.audio.set_volume(volume)
+    
+    def start_progress(self):
+        """Start (or restart) the progress polling loop"""
+        self.stop_progress()
+        self.update_progress()
+    
+    def stop_progress(self):
+        """Cancel any pending progress update"""
+        if self.progress_job is not None:
+            self.root.after_cancel(self.progress_job)
+            self.progress_job = None
+    
+    def progress_interval(self):
+        """Pick the next progress update delay in milliseconds"""
+        interval = PLAYER['update_interval']  # Fastest allowed rate
+        if self.root.state() in ('iconic', 'withdrawn'):
+            return max(interval, 2000)
+        if self.track_duration:
+            # No point waking up before the bar can move by a whole pixel
+            width = max(self.progress_bar.winfo_width(), 1)
+            pixel_time = int(self.track_duration * 1000 / width)
+            interval = max(interval, min(pixel_time, 1000))
+        return interval
     
     def update_progress(self):
-        """Update progress bar"""
-        if self.is_playing and pygame.mixer.music.get_busy():
-            # This is a simplified progress update
-            # In a full implementation, you'd get actual position/duration
-            current_pos = pygame.mixer.music.get_pos() / 1000.0  # Convert to seconds
-            # For now, just simulate progress
-            progress = (time.time() % 100)  # Simulate 0-100 progress
-            self.progress_var.set(progress)
-            self.root.after(100, self.update_progress)
+        """Update progress bar from the mixer position"""
+        self.progress_job = None
+        if not (self.is_playing and self.media_player().is_active()):
+            return
+        
+        position = self.media_player().position()
+        if self.track_duration:
+            self.progress_var.set(min(100.0, 100.0 * position / self.track_duration))
+        self.save_position(position)
+        self.progress_job = self.root.after(self.progress_interval(), self.update_progress)
+    
+    def resume_position(self, file_path):
+        """Get where to start a file: its saved position, or the beginning"""
+        if not MEDIA['remember_position']:
+            return 0.0
+        return self.resume_store.get(file_path) or 0.0
+    
+    def save_position(self, position=None):
+        """Remember the current file's position, writing the store after a short delay"""
+        if not MEDIA['remember_position'] or self.current_media is None:
+            return
+        if position is None:
+            position = self.media_player().position()
+        self.resume_store.update(self.current_media, position, self.track_duration)
+        if self.resume_store.dirty and self.resume_job is None:
+            self.resume_job = self.root.after(PLAYER['resume_save_delay'], self.flush_resume)
+    
+    def flush_resume(self):
+        """Write pending resume positions"""
+        self.resume_job = None
+        self.resume_store.flush()
+    
+    def on_closing(self):
+        """Save settings and resume positions, stop background work, close the stores"""
+        self.save_settings()
+        self.save_position()
+        self.flush_resume()
+        
+        workers = [worker for worker in (self.scanner, self.importer, self.duplicate_finder)
+                   if worker is not None]
+        for worker in workers:
+            worker.cancel()
+        if self.watcher is not None:
+            self.watcher.stop()
+            workers.append(self.watcher)
+        if self.loudness is not None:
+            self.loudness.shutdown()
+        if self.peak_cache is not None:
+            self.peak_cache.shutdown()
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.cancel_pending()
+        if self.video is not None:
+            self.video.stop()
+        if self._audio is not None:
+            self._audio.shutdown()
+        self.metadata_pipeline.stop(timeout=1.0)
+        for worker in workers:
+            worker.wait(timeout=1.0)  # They write to the stores closed below
+        
+        for store in (self.library_store, self.library_index, self.metadata_cache,
+                      self.fingerprint_store, self.playlist_store):
+            try:
+                store.close()
+            except Exception as e:
+                print(f"Error closing {type(store).__name__}: {e}")
+        self.root.destroy()
     
     def load_settings(self):
         """Load saved settings"""
         try:
-            if os.path.exists('mbox_settings.json'):
-                with open('mbox_settings.json', 'r') as f:
-                    settings = json.load(f)
-                    self.media_list = settings.get('media_list', [])
-                    self.volume_var.set(settings.get('volume', 70))
-                    
-                    # Update listbox
-                    if hasattr(self, 'media_listbox'):
-                        for file_path in self.media_list:
-                            filename = os.path.basename(file_path)
-                            self.media_listbox.insert(tk.END, filename)
+            settings = load_json(FILES['settings_file'], {})
+            self.volume_var.set(settings.get('volume', 70))
+            self.eq_gains = [float(gain) for gain in settings.get('equalizer', [])]
+            self.set_visualizer(settings.get('visualizer', PLAYER['show_visualizer']))
+            if settings.get('shuffle', PLAYER['shuffle']) != self.play_queue.shuffle:
+                self.toggle_shuffle()
+            
+            # Move a media list from older settings files into the library store
+            if 'media_list' in settings:
+                self.library_store.add_many(settings['media_list'])
+                self.save_settings()
         except Exception as e:
             print(f"Error loading settings: {e}")
+        
+        # The media list and search index are built on a worker so a large
+        # library does not hold up the window; the store is read here
+        # because imports may add to it in the meantime
+        threading.Thread(target=self.load_library, args=(self.library_store.paths(),),
+                         daemon=True).start()
     
     def save_settings(self):
         """Save current settings"""
         try:
             settings = {
-                'media_list': self.media_list,
-                'volume': self.volume_var.get()
+                'volume': self.volume_var.get(),
+                'shuffle': self.play_queue.shuffle,
+                'equalizer': self.eq_gains,
+                'visualizer': self.show_visualizer
             }
-            with open('mbox_settings.json', 'w') as f:
-                json.dump(settings, f)
+            save_json(FILES['settings_file'], settings)
         except Exception as e:
             print(f"Error saving settings: {e}")
 
 def main():
-    root = tk.Tk()
+    try:
+        from tkinterdnd2 import TkinterDnD  # Optional, for drag-and-drop import
+        root = TkinterDnD.Tk()
+    except ImportError:
+        root = tk.Tk()
     app = MboxPlayer(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
     # Set window icon and make it resizable
     root.resizable(True, True)
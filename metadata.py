@@ -0,0 +1,260 @@
+"""
+Mbox Player Metadata
+Tag extraction with mutagen on a bounded thread pool, backed by a
+persistent cache keyed by (path, size, mtime) and, when fingerprints are
+available, by content so a moved file keeps its tags. The cache also holds
+each file's loudness gain (see loudness.py).
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import FILES
+
+TAG_FIELDS = ('title', 'artist', 'album', 'duration', 'bitrate')
+LOUDNESS_FIELDS = ('gain', 'peak')  # ReplayGain-style dB and linear sample peak
+
+
+def read_tags(file_path):
+    """Read title, artist, album, duration and bitrate with mutagen"""
+    from mutagen import File  # Deferred so startup does not pay for mutagen
+    tags = dict.fromkeys(TAG_FIELDS)
+    try:
+        audio = File(file_path, easy=True)
+    except Exception:
+        return tags
+    if audio is None:
+        return tags
+
+    for key in ('title', 'artist', 'album'):
+        values = audio.get(key) if audio.tags is not None else None
+        if values:
+            tags[key] = str(values[0])
+
+    info = getattr(audio, 'info', None)
+    if info is not None:
+        tags['duration'] = getattr(info, 'length', None)
+        tags['bitrate'] = getattr(info, 'bitrate', None)
+    return tags
+
+
+def display_name(file_path, tags=None):
+    """Get "Artist - Title" for a file, falling back to its filename"""
+    if tags and tags.get('title'):
+        if tags.get('artist'):
+            return f"{tags['artist']} - {tags['title']}"
+        return tags['title']
+    return os.path.basename(file_path)
+
+
+class MetadataCache:
+    """SQLite cache of tags, valid while a file's size and mtime are unchanged"""
+
+    COLUMNS = ('path', 'size', 'mtime') + TAG_FIELDS + ('fingerprint',) + LOUDNESS_FIELDS
+    # Filled in by separate passes, so a write without them keeps the stored values
+    KEPT = ('fingerprint',) + LOUDNESS_FIELDS
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or FILES['metadata_cache']
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " title TEXT, artist TEXT, album TEXT,"
+            " duration REAL, bitrate INTEGER)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(metadata)")}
+        for column, kind in (('fingerprint', 'TEXT'), ('gain', 'REAL'), ('peak', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE metadata ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS metadata_fingerprint"
+                           " ON metadata (fingerprint)")
+        self._conn.commit()
+
+    def load_all(self):
+        """Get every cached record as a {path: record} map"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM metadata").fetchall()
+        return {row[0]: dict(zip(self.COLUMNS, row)) for row in rows}
+
+    def lookup(self, file_path, size, mtime):
+        """Get the cached record if it matches the file's size and mtime"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM metadata WHERE path = ?",
+                (file_path,)).fetchone()
+        if row is None or (row[1], row[2]) != (size, mtime):
+            return None
+        return dict(zip(self.COLUMNS, row))
+
+    def lookup_fingerprint(self, fingerprint):
+        """Get the cached records of files with this fingerprint"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM metadata WHERE fingerprint = ?",
+                (fingerprint,)).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def store_many(self, records):
+        """Insert or replace a batch of records, keeping known KEPT values for None"""
+        if not records:
+            return
+        rows = [tuple(record.get(col) for col in self.COLUMNS) for record in records]
+        updates = [f"{col}=COALESCE(excluded.{col}, CASE WHEN size=excluded.size"
+                   f" AND mtime=excluded.mtime THEN {col} END)" if col in self.KEPT
+                   else f"{col}=excluded.{col}" for col in self.COLUMNS[1:]]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO metadata ({', '.join(self.COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(self.COLUMNS))})"
+                f" ON CONFLICT(path) DO UPDATE SET {', '.join(updates)}", rows)
+            self._conn.commit()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class MetadataPipeline:
+    """Extracts tags for submitted files without blocking the caller.
+
+    A dispatcher thread skips files the cache (or the library index) already
+    knows and parses the rest on a bounded pool. Records are handed to
+    ``on_results`` in batches through ``post`` (usually ``root.after`` with a
+    0 delay, so the callback runs on the Tk thread).
+    """
+
+    BATCH_SIZE = 200
+    FLUSH_INTERVAL = 0.25  # seconds
+
+    def __init__(self, cache, on_results, post, workers=None, index=None,
+                 fingerprints=None):
+        self.cache = cache
+        self.on_results = on_results
+        self.post = post
+        self.index = index
+        self.fingerprints = fingerprints
+        self.workers = workers or min(8, (os.cpu_count() or 1) + 2)
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+        self._batch = []
+        self._fresh = []
+        self._outstanding = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stopped = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, paths):
+        """Queue files for tag extraction"""
+        paths = list(paths)
+        if paths:
+            with self._lock:
+                self._outstanding += len(paths)
+                self._idle.clear()
+            self._queue.put(paths)
+
+    def wait(self, timeout=None):
+        """Block until every submitted file has been posted"""
+        return self._idle.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Stop the dispatcher and the worker pool, waiting up to timeout for the dispatcher"""
+        self._stopped.set()
+        self._queue.put(None)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if timeout is not None:
+            self._dispatcher.join(timeout)
+
+    def _known_record(self, file_path, size, mtime):
+        """Find tags that are already stored for this exact file version"""
+        record = self.cache.lookup(file_path, size, mtime)
+        if record is None and self.index is not None:
+            indexed = self.index.get(file_path)
+            if indexed and (indexed['size'], indexed['mtime']) == (size, mtime):
+                record = {col: indexed.get(col) for col in MetadataCache.COLUMNS}
+        return record
+
+    def _dispatch(self):
+        while not self._stopped.is_set():
+            try:
+                paths = self._queue.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                self._flush()
+                continue
+            if paths is None:
+                break
+
+            for file_path in paths:
+                if self._stopped.is_set():
+                    break
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    self._done(None)
+                    continue
+                record = self._known_record(file_path, st.st_size, st.st_mtime)
+                if record is not None:
+                    self._done(record)
+                else:
+                    self._slots.acquire()
+                    self._pool.submit(self._parse, file_path, st)
+
+    def _parse(self, file_path, st):
+        record = {'path': file_path, 'size': st.st_size, 'mtime': st.st_mtime}
+        fresh = True
+        try:
+            if self.fingerprints is not None:
+                # A file seen before under another path only needs its tags copied
+                record['fingerprint'] = self.fingerprints.fingerprint(file_path, st)
+                for moved in self.cache.lookup_fingerprint(record['fingerprint']):
+                    if moved['path'] != file_path and self.fingerprints.same_contents(
+                            file_path, st, moved['path'], moved['size'], moved['mtime']):
+                        record.update((key, moved[key]) for key in TAG_FIELDS + LOUDNESS_FIELDS)
+                        return
+            record.update(read_tags(file_path))
+        except OSError:
+            fresh = False
+        finally:
+            self._slots.release()
+            self._done(record, fresh=fresh)
+
+    def _done(self, record, fresh=False):
+        """Add a finished record to the pending batch"""
+        with self._lock:
+            if record is not None:
+                self._batch.append(record)
+                if fresh:
+                    self._fresh.append(record)
+            self._outstanding -= 1
+            finished = self._outstanding == 0
+            full = len(self._batch) >= self.BATCH_SIZE
+        if finished or full:
+            self._flush()
+        if finished:
+            with self._lock:
+                if self._outstanding == 0:
+                    self._idle.set()
+
+    def _flush(self):
+        """Persist freshly parsed records and post the batch to the caller"""
+        with self._lock:
+            batch, fresh = self._batch, self._fresh
+            self._batch, self._fresh = [], []
+        if fresh:
+            self.cache.store_many(fresh)
+        if batch:
+            self.post(self.on_results, batch)
@@ -0,0 +1,201 @@
+"""
+Mbox Player Play Queue
+Playback order over a list of tracks: sequential or shuffled, an up-next
+queue the user can add to, and a bounded history for going back.
+
+Positions are indexes into the list being played. The shuffle order is a
+Fisher-Yates permutation drawn one step at a time, keeping only the swaps
+made so far, so shuffling a huge library costs nothing up front.
+"""
+
+import random
+from bisect import bisect_left
+from collections import deque
+
+
+class LazyShuffle:
+    """Random permutation of range(length), generated as it is consumed"""
+
+    def __init__(self, length, rng=None):
+        self.length = length
+        self.rng = rng or random.Random()
+        self._swaps = {}  # Sparse Fisher-Yates array: position -> value if moved
+        self._drawn = 0
+
+    def remaining(self):
+        return self.length - self._drawn
+
+    def grow(self, length):
+        """Extend the permutation to new positions at the end; they join the undrawn part"""
+        if length > self.length:
+            self.length = length
+
+    def remove(self, removed, remap):
+        """Drop a set of removed values and renumber the rest with remap.
+
+        The values not drawn yet stay undrawn, so the round carries on.
+        """
+        undrawn = [remap(value)
+                   for value in (self._swaps.get(k, k) for k in range(self._drawn, self.length))
+                   if value not in removed]
+        self.length -= len(removed)
+        self._drawn = self.length - len(undrawn)
+        self._swaps = {position: value for position, value in enumerate(undrawn, self._drawn)
+                       if position != value}
+
+    def draw(self):
+        """Get the next position of the permutation, or None once all are drawn"""
+        i = self._drawn
+        if i >= self.length:
+            return None
+        j = self.rng.randrange(i, self.length)
+        swaps = self._swaps
+        value = swaps.get(j, j)
+        swaps[j] = swaps.pop(i, i)
+        self._drawn += 1
+        return value
+
+
+class PlayQueue:
+    """Decides what plays next and previous over a list of a given length.
+
+    ``next`` takes from the up-next deque first, then from the forward
+    stack left by ``previous``, then from the sequential or shuffled order.
+    All of them are O(1); only ``peek_next`` may draw ahead from the
+    shuffle, and the drawn position is kept for the following ``next``.
+    """
+
+    def __init__(self, length=0, shuffle=False, history_size=100, rng=None):
+        self.rng = rng or random.Random()
+        self.length = length
+        self.shuffle = shuffle
+        self.current = None
+        self.up_next = deque()
+        self.history = deque(maxlen=history_size)
+        self._forward = []  # Positions stepped back over, replayed by next()
+        self._shuffle = None
+        self._drawn = deque()  # Drawn from the shuffle but not yet played
+
+    def reset(self, length):
+        """Start over on a list whose positions have changed"""
+        self.length = length
+        self.current = None
+        self.up_next.clear()
+        self.history.clear()
+        self._forward.clear()
+        self._restart_shuffle()
+
+    def set_length(self, length):
+        """Follow a list that has had items appended"""
+        if length < self.length:
+            self.reset(length)
+            return
+        self.length = length
+        if self._shuffle is not None:
+            self._shuffle.grow(length)
+
+    def remove(self, positions):
+        """Follow a list that has had the items at some positions removed.
+
+        The up-next queue, history and shuffle round keep their other
+        positions, renumbered. If the current position itself was removed,
+        the queue starts over.
+        """
+        removed = set(positions)
+        if not removed:
+            return
+        if self.current in removed:
+            self.reset(self.length - len(removed))
+            return
+        order = sorted(removed)
+
+        def remap(position):
+            return position - bisect_left(order, position)
+
+        self.length -= len(removed)
+        if self.current is not None:
+            self.current = remap(self.current)
+        for kept in (self.up_next, self.history, self._forward, self._drawn):
+            remapped = [remap(p) for p in kept if p not in removed]
+            kept.clear()
+            kept.extend(remapped)
+        if self._shuffle is not None:
+            self._shuffle.remove(removed, remap)
+
+    def set_shuffle(self, shuffle):
+        """Switch between sequential and shuffled order from the current track on"""
+        self.shuffle = shuffle
+        self._forward.clear()
+        self._restart_shuffle()
+
+    def enqueue(self, position, first=False):
+        """Add a position to the up-next queue, at the front if first"""
+        if first:
+            self.up_next.appendleft(position)
+        else:
+            self.up_next.append(position)
+
+    def jump(self, position):
+        """Play a position chosen by the user"""
+        self._forward.clear()
+        self._advance(position)
+        return position
+
+    def peek_next(self):
+        """Get the position next() would return, without moving"""
+        if self.up_next:
+            return self.up_next[0]
+        if self._forward:
+            return self._forward[-1]
+        if not self.length:
+            return None
+        if not self.shuffle:
+            return 0 if self.current is None else (self.current + 1) % self.length
+        if not self._drawn:
+            self._draw()
+        return self._drawn[0]
+
+    def next(self):
+        """Move to the next position and return it, or None for an empty list"""
+        position = self.peek_next()
+        if position is None:
+            return None
+        if self.up_next:
+            self.up_next.popleft()
+        elif self._forward:
+            self._forward.pop()
+        elif self.shuffle:
+            self._drawn.popleft()
+        self._advance(position)
+        return position
+
+    def previous(self):
+        """Move back to the previously played position and return it"""
+        if self.history:
+            if self.current is not None:
+                self._forward.append(self.current)
+            self.current = self.history.pop()
+        elif self.current is not None and not self.shuffle and self.length:
+            # Nothing played before this: step back through the list instead
+            self._forward.append(self.current)
+            self.current = (self.current - 1) % self.length
+        return self.current
+
+    def _advance(self, position):
+        if self.current is not None:
+            self.history.append(self.current)
+        self.current = position
+
+    def _draw(self):
+        """Draw a shuffled position, starting a new round once all were played"""
+        if self._shuffle is None or not self._shuffle.remaining():
+            self._shuffle = LazyShuffle(self.length, self.rng)
+        position = self._shuffle.draw()
+        if position == self.current and self._shuffle.remaining():
+            # Do not repeat the current track straight away at a round boundary
+            self._drawn.append(self._shuffle.draw())
+        self._drawn.append(position)
+
+    def _restart_shuffle(self):
+        self._shuffle = None
+        self._drawn.clear()
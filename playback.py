@@ -0,0 +1,739 @@
+"""
+Mbox Player Playback
+Audio engine that feeds decoded PCM to a pygame mixer channel in short
+blocks from a background thread. The next track in the queue is opened
+ahead of time, so auto-advance is gapless and loading never stalls the UI.
+
+Fades and crossfades (PLAYER['fade_duration']) are baked into the blocks
+with precomputed gain ramps, so they are sample-accurate and keep running
+however busy the Tk thread is. Each track also carries a fixed gain for
+loudness normalization, applied the same way, and an optional equalizer
+(equalizer.py) filters each block as it is cut. Finished blocks can also
+be copied into a visualizer ring (visualizer.py) by output frame.
+
+The mixer is opened with ADVANCED['sample_rate'], ['channels'] and
+['buffer_size']. Files that already match that rate and channel count
+skip SDL's decode and resample and are streamed from disk a block at a
+time, with only their first HEAD_SECONDS prefetched: 16-bit PCM WAVs
+through the wave module, and FLAC, Ogg, MP3 and the like through the
+optional soundfile package. Anything else is decoded whole by SDL, which
+has no way to hand over its PCM in pieces, so the next track is only
+decoded ahead if it is shorter than DECODE_AHEAD_SECONDS.
+"""
+
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+import pygame
+
+from config import PLAYER, ADVANCED
+from metadata import read_tags
+
+BLOCK_SECONDS = 0.2  # Length of each block handed to the mixer
+HEAD_SECONDS = 1.0  # Read when a streamed track is opened or prefetched
+DECODE_AHEAD_SECONDS = 600  # Longest track decoded whole ahead of time (~100 MB)
+TRACK_STARTS_KEPT = 100  # Entries kept in stats['track_starts']
+
+
+@lru_cache(maxsize=16)
+def gain_ramp(frames, fade_in):
+    """Equal-power gain ramp of a given length, rising or falling"""
+    t = (np.arange(frames, dtype=np.float32) + 0.5) / max(frames, 1)
+    ramp = np.sin(t * (np.pi / 2)) if fade_in else np.cos(t * (np.pi / 2))
+    ramp.flags.writeable = False  # Shared through the cache
+    return ramp
+
+
+def _per_frame(gains, samples):
+    """Shape per-frame gains to broadcast over (frames, channels) samples"""
+    return gains[:, None] if samples.ndim > 1 else gains
+
+
+def apply_gain(samples, gains):
+    """Scale integer samples in place by per-frame gains"""
+    np.multiply(samples, _per_frame(gains, samples), out=samples, casting='unsafe')
+
+
+def scale(samples, gain):
+    """Scale integer samples in place by a constant gain, clipping at full scale"""
+    limits = np.iinfo(samples.dtype)
+    scaled = np.multiply(samples, np.float32(gain), dtype=np.float32)
+    np.clip(scaled, limits.min, limits.max, out=scaled)
+    np.copyto(samples, scaled, casting='unsafe')
+
+
+def crossfade(tail, head, fade_out, fade_in):
+    """Mix the end of one track into the start of the next"""
+    mixed = tail * _per_frame(fade_out, tail) + head * _per_frame(fade_in, head)
+    limits = np.iinfo(tail.dtype)
+    return np.clip(mixed, limits.min, limits.max).astype(tail.dtype)
+
+
+def init_mixer():
+    """Open the mixer with the ADVANCED sample rate, channels and buffer size"""
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=ADVANCED['sample_rate'], size=-16,
+                          channels=ADVANCED['channels'], buffer=ADVANCED['buffer_size'])
+    return pygame.mixer.get_init()
+
+
+class Track:
+    """A track in the mixer's sample format, read one block at a time"""
+
+    direct = False  # Read as-is, without SDL conversion or resampling
+
+    def __init__(self, path, frames, rate, gain=1.0):
+        self.path = path
+        self.frames = frames
+        self.rate = rate
+        self.gain = gain  # Loudness normalization, applied as blocks are cut
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def read(self, start, count):
+        """Get count frames of samples from a frame, fewer at the end"""
+        raise NotImplementedError
+
+
+class DecodedTrack(Track):
+    """A track decoded whole by SDL, for formats it cannot stream to us"""
+
+    def __init__(self, path, sound, rate, gain=1.0):
+        self.sound = sound  # Owns the buffer the samples point into
+        self.samples = pygame.sndarray.samples(sound)
+        super().__init__(path, len(self.samples), rate, gain)
+
+    def read(self, start, count):
+        return self.samples[start:start + count]
+
+
+class StreamedTrack(Track):
+    """A track in the mixer's format, streamed from disk.
+
+    Only the first HEAD_SECONDS are held in memory, so the start of the
+    track (and of a crossfade into it) never waits on the disk; the rest
+    is read a block at a time as it is needed.
+    """
+
+    direct = True
+
+    def __init__(self, path, frames, rate, channels, head, gain=1.0):
+        super().__init__(path, frames, rate, gain)
+        self.channels = channels
+        self.head = head
+
+    def read(self, start, count):
+        count = max(0, min(count, self.frames - start))
+        if start + count <= len(self.head):
+            return self.head[start:start + count]
+        samples = self._read(start, count)
+        if len(samples) < count:  # The file is shorter than its header says
+            padding = np.zeros((count - len(samples),) + samples.shape[1:], samples.dtype)
+            samples = np.concatenate((samples, padding))
+        return samples
+
+    def _read(self, start, count):
+        """Read up to count frames of int16 samples from the file"""
+        raise NotImplementedError
+
+
+class WavTrack(StreamedTrack):
+    """A 16-bit PCM WAV in the mixer's format"""
+
+    def _read(self, start, count):
+        with wave.open(self.path, 'rb') as w:
+            w.setpos(start)
+            return pcm_samples(w.readframes(count), self.channels)
+
+
+class SoundFileTrack(StreamedTrack):
+    """A file soundfile can decode (FLAC, Ogg, MP3...) in the mixer's format.
+
+    The file stays open while the track is alive, so reading on from the
+    previous block needs no seek.
+    """
+
+    def __init__(self, path, sound_file, rate, head, gain=1.0):
+        super().__init__(path, sound_file.frames, rate, sound_file.channels, head, gain)
+        self._file = sound_file
+
+    def _read(self, start, count):
+        if self._file.tell() != start:
+            self._file.seek(start)
+        return self._file.read(count, dtype='int16')
+
+
+def pcm_samples(data, channels):
+    """View 16-bit little-endian PCM bytes as (frames, channels) samples"""
+    samples = np.frombuffer(data, dtype='<i2')
+    return samples.reshape(-1, channels) if channels > 1 else samples
+
+
+def open_matching_wav(file_path, rate, channels):
+    """Open a WAV for streaming if it already has the mixer's format, else None"""
+    try:
+        with wave.open(file_path, 'rb') as w:
+            if (w.getframerate(), w.getnchannels(), w.getsampwidth()) != (rate, channels, 2):
+                return None
+            frames = w.getnframes()
+            head = pcm_samples(w.readframes(min(frames, int(HEAD_SECONDS * rate))), channels)
+    except (wave.Error, EOFError):
+        return None  # Compressed or float WAV; SDL handles those
+    return WavTrack(file_path, frames, rate, channels, head)
+
+
+def open_matching_sound_file(file_path, rate, channels):
+    """Open a file with soundfile for streaming if it has the mixer's rate and channels.
+
+    Returns None if soundfile is not installed or cannot read the file.
+    """
+    try:
+        import soundfile  # Optional; without it SDL decodes these files whole
+    except ImportError:
+        return None
+    try:
+        sound_file = soundfile.SoundFile(file_path)
+    except (RuntimeError, OSError):
+        return None
+    if (sound_file.samplerate, sound_file.channels) != (rate, channels):
+        sound_file.close()
+        return None
+    head = sound_file.read(min(sound_file.frames, int(HEAD_SECONDS * rate)), dtype='int16')
+    return SoundFileTrack(file_path, sound_file, rate, head)
+
+
+def decode_track(file_path, decode_limit=None):
+    """Open a file as a Track in the mixer's sample format.
+
+    Files in the mixer's format are streamed, with only their head read
+    now; anything else is decoded whole by SDL. Returns None instead of
+    decoding a file that runs longer than decode_limit seconds.
+    """
+    rate, size, channels = pygame.mixer.get_init()
+    track = None
+    if size == -16 and file_path.lower().endswith('.wav'):
+        track = open_matching_wav(file_path, rate, channels)
+    if track is None and size == -16:
+        track = open_matching_sound_file(file_path, rate, channels)
+    if track is not None:
+        return track
+    if decode_limit is not None:
+        duration = read_tags(file_path)['duration']
+        if duration is not None and duration > decode_limit:
+            return None
+    return DecodedTrack(file_path, pygame.mixer.Sound(file_path), rate)
+
+
+class Prefetcher:
+    """Opens the upcoming track on a background thread.
+
+    A track that would have to be decoded whole is only decoded ahead if
+    it is shorter than DECODE_AHEAD_SECONDS; longer ones are left for the
+    engine to open when they are played.
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._path = None
+        self._future = None
+
+    def prefetch(self, file_path):
+        """Start opening a file unless it is already being prefetched"""
+        with self._lock:
+            if file_path == self._path:
+                return
+            self._path = file_path
+            self._future = (self._pool.submit(decode_track, file_path, DECODE_AHEAD_SECONDS)
+                            if file_path else None)
+
+    def take(self, file_path, ahead=False):
+        """Get an opened track, using the prefetched one if it matches.
+
+        With ahead set, returns None rather than decoding a long track
+        whole that was not decoded ahead.
+        """
+        with self._lock:
+            future = self._future if file_path == self._path else None
+            if future is not None:
+                self._path, self._future = None, None
+        track = future.result() if future is not None else None
+        if track is None and not ahead:
+            track = decode_track(file_path)
+        return track
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Block:
+    """A block of output that has been handed to the mixer"""
+
+    def __init__(self, track, start, samples, out_start, announce):
+        self.track = track
+        self.start = start  # First frame of the block within its track
+        self.frames = len(samples)
+        self.out_start = out_start  # First frame within the output stream
+        self.announce = announce  # First block after a load or track change
+        self.sound = pygame.sndarray.make_sound(samples)
+        self.samples = pygame.sndarray.samples(self.sound)  # Writable, for fades
+
+
+class _Envelope:
+    """A gain ramp pinned to a range of output frames"""
+
+    def __init__(self, start, ramp, before, after):
+        self.start = start
+        self.ramp = ramp
+        self.before = before  # Gain ahead of the ramp
+        self.after = after  # Gain once the ramp has finished
+
+    @property
+    def end(self):
+        return self.start + len(self.ramp)
+
+    def gains(self, out_start, frames):
+        offsets = np.arange(out_start - self.start, out_start - self.start + frames)
+        gains = self.ramp.take(np.clip(offsets, 0, len(self.ramp) - 1))
+        gains[offsets < 0] = self.before
+        gains[offsets >= len(self.ramp)] = self.after
+        return gains
+
+
+class AudioEngine:
+    """Plays decoded tracks on a dedicated mixer channel.
+
+    Control methods only put a command on a queue and return; the engine
+    thread owns the mixer, runs the commands in order, does the decoding
+    and keeps exactly one block queued behind the one that is playing. A
+    new volume or seek command replaces one still waiting in the queue, and
+    a new play or stop replaces any waiting transport command, so dragging
+    a slider never piles up work. Because the first block of the next track is queued
+    while the last block of the current one plays, there is no gap between
+    tracks. With a fade duration set, the end of one track is mixed into
+    the start of the next, and play, pause and stop fade in or out.
+    Callbacks are delivered through ``post`` (usually root.after).
+
+    ``stats`` counts coalesced commands, underruns (the channel ran dry mid-track), the delay
+    from play() to sound, and the least audio left queued when a block was
+    topped up; together with ``latency()`` they show whether
+    ADVANCED['buffer_size'] suits the host. ``stats['track_starts']`` keeps
+    the last TRACK_STARTS_KEPT (path, output frame) pairs where a track
+    began.
+    """
+
+    def __init__(self, post, on_track_start=None, on_finished=None, on_error=None,
+                 fade_duration=None, equalizer=None):
+        self.post = post
+        self.on_track_start = on_track_start
+        self.on_finished = on_finished
+        self.on_error = on_error
+        self.prefetcher = Prefetcher()
+        self.equalizer = equalizer
+        self.ring = None  # PCMRing fed with each block while the visualizer is shown
+
+        pygame.mixer.set_reserved(1)
+        self.channel = pygame.mixer.Channel(0)
+        self.rate = pygame.mixer.get_init()[0]
+        self.buffer_size = ADVANCED['buffer_size']
+        if fade_duration is None:
+            fade_duration = PLAYER['fade_duration']
+        self.fade_frames = int(fade_duration * self.rate)
+
+        self._cond = threading.Condition()
+        self._commands = deque()  # (name, args) waiting for the engine thread
+        self._request = None  # (source, start_seconds[, gain]) waiting to be loaded
+        self._next_path = None
+        self._next_gain = 1.0
+        self._incoming = None  # Next track while it is being crossfaded in
+        self._track = None  # Track currently being fed to the mixer
+        self._frame = 0  # Next frame of self._track to hand to the mixer
+        self._announce = False  # Next block starts a newly loaded track
+        self._blocks = deque()  # Blocks handed to the mixer, playing one first
+        self._block_started = 0.0
+        self._out_frame = 0  # Output-stream frame of the next block to cut
+        self._envelope = None
+        self._halt = None  # (out_frame, final) to halt at after a fade-out
+        self._paused_at = None  # (track, seconds) to resume from
+        self._running = True
+        self._requested_at = None  # When the play() being loaded was made
+        self.stats = {'commands': 0, 'coalesced': 0, 'underruns': 0,
+                      'track_starts': deque(maxlen=TRACK_STARTS_KEPT),
+                      'start_latency': None, 'min_headroom': None}
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Control, safe to call from any thread
+
+    # Pending commands that a newly queued command makes pointless
+    SUPERSEDES = {
+        'volume': {'volume'},
+        'seek': {'seek'},
+        'play': {'play', 'seek', 'pause', 'resume', 'stop'},
+        'stop': {'play', 'seek', 'pause', 'resume', 'stop'},
+    }
+
+    def play(self, file_path, start=0.0, gain=1.0):
+        """Start playing a file, optionally from an offset in seconds and with a gain"""
+        self._command('play', file_path, start, gain, time.monotonic())
+
+    def set_next(self, file_path, gain=1.0):
+        """Set the track to continue with, and open it in the background"""
+        with self._cond:
+            self._next_path = file_path
+            self._next_gain = gain
+        self.prefetcher.prefetch(file_path)
+
+    def pause(self):
+        """Fade out and remember where to resume"""
+        self._command('pause')
+
+    def resume(self):
+        """Fade back in from where playback was paused"""
+        self._command('resume')
+
+    def stop(self):
+        """Fade out and unload the current track"""
+        self._command('stop')
+
+    def seek(self, seconds):
+        """Jump to a position in the current track"""
+        self._command('seek', seconds)
+
+    def set_volume(self, volume):
+        """Set the channel volume (0.0 - 1.0)"""
+        self._command('volume', volume)
+
+    def flush(self, timeout=None):
+        """Wait until the engine thread has run every queued command"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._commands, timeout)
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._reset()
+            self._cond.notify()
+        self.prefetcher.shutdown()
+
+    # State
+
+    def is_active(self):
+        """Check whether a track is loaded (playing or paused)"""
+        with self._cond:
+            for name, _ in reversed(self._commands):
+                if name in ('play', 'stop'):
+                    return name == 'play'
+            if self._request is not None or self._paused_at is not None:
+                return True
+            stopping = self._halt is not None and self._halt[1]
+            return not stopping and (self._track is not None or bool(self._blocks))
+
+    def position(self):
+        """Get the playback position in seconds within the playing track"""
+        with self._cond:
+            if self._paused_at is not None:
+                return self._paused_at[1]
+            if not self._blocks:
+                return 0.0
+            block, out_frame = self._playing_frame()
+            return (block.start + out_frame - block.out_start) / block.track.rate
+
+    def output_frame(self):
+        """Get the output-stream frame playing now, or None while nothing is heard"""
+        with self._cond:
+            if self._paused_at is not None or not self._blocks:
+                return None
+            return self._playing_frame()[1]
+
+    def latency(self):
+        """Get output latency figures in seconds.
+
+        'device' is the mixer buffer, 'queued' the audio already handed to
+        the channel ahead of the playing position, and 'start' the delay of
+        the last play() before sound started.
+        """
+        with self._cond:
+            queued = 0
+            if self._blocks:
+                block, out_frame = self._playing_frame()
+                queued = sum(b.frames for b in self._blocks) - (out_frame - block.out_start)
+            return {'device': self.buffer_size / self.rate,
+                    'queued': queued / self.rate,
+                    'start': self.stats['start_latency']}
+
+    def _command(self, name, *args):
+        with self._cond:
+            superseded = self.SUPERSEDES.get(name, ())
+            if superseded:
+                pending = len(self._commands)
+                self._commands = deque(c for c in self._commands if c[0] not in superseded)
+                self.stats['coalesced'] += pending - len(self._commands)
+            self._commands.append((name, args))
+            self._cond.notify_all()
+
+    # Engine thread
+
+    def _execute(self, name, args):
+        """Run one command (lock held)"""
+        self.stats['commands'] += 1
+        if name == 'play':
+            file_path, start, gain, self._requested_at = args
+            self._request = (file_path, start, gain)
+            self._paused_at = None
+        elif name == 'pause':
+            if self._paused_at is not None or not self._blocks:
+                return
+            block, out_frame = self._playing_frame()
+            resume = min(block.start + out_frame - block.out_start + self.fade_frames,
+                         block.track.frames)
+            self._paused_at = (block.track, resume / block.track.rate)
+            self._fade_out(out_frame, final=False)
+        elif name == 'resume':
+            if self._paused_at is not None:
+                self._request, self._paused_at = self._paused_at, None
+        elif name == 'stop':
+            self._request = None
+            self._paused_at = None
+            if self._blocks and self._halt is None:
+                self._fade_out(self._playing_frame()[1], final=True)
+            elif self._halt is None:
+                self._reset()
+        elif name == 'seek':
+            seconds, = args
+            if self._paused_at is not None:
+                self._paused_at = (self._paused_at[0], seconds)
+                return
+            track = self._blocks[0].track if self._blocks else self._track
+            if track is not None:
+                self._request = (track, seconds)
+        elif name == 'volume':
+            self.channel.set_volume(*args)
+
+    def _playing_frame(self):
+        """Estimate the playing block and output frame (lock held)"""
+        block = self._blocks[0]
+        elapsed = int((time.monotonic() - self._block_started) * self.rate)
+        return block, block.out_start + min(max(elapsed, 0), block.frames)
+
+    def _fade_out(self, out_frame, final):
+        """Ramp down from an output frame, then halt (lock held)"""
+        if not self.fade_frames:
+            self._reset()
+            return
+        self._envelope = _Envelope(out_frame, gain_ramp(self.fade_frames, False), 1.0, 0.0)
+        ring = self.ring
+        for block in self._blocks:
+            apply_gain(block.samples, self._envelope.gains(block.out_start, block.frames))
+            if ring is not None:
+                ring.write(block.samples, block.out_start)
+        self._halt = (self._envelope.end, final)
+        self._cond.notify()
+
+    def _reset(self):
+        self.channel.stop()
+        self._blocks.clear()
+        self._track = None
+        self._incoming = None
+        self._frame = 0
+        self._envelope = None
+        self._halt = None
+        if self.equalizer is not None:
+            self.equalizer.reset()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._commands and self._request is None and (
+                        self._halt is None and self._track is None and not self._blocks):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                while self._commands:
+                    self._execute(*self._commands.popleft())
+                self._cond.notify_all()  # Wake flush()
+                request, self._request = self._request, None
+
+            if request is not None:
+                self._load(*request)  # Decoding happens outside the lock
+
+            with self._cond:
+                self._pump()
+                if not self._commands:
+                    self._cond.wait(BLOCK_SECONDS / 4)
+
+    def _load(self, source, start, gain=None):
+        """Open (or reuse) a track and restart the channel at an offset"""
+        try:
+            track = source if isinstance(source, Track) else self.prefetcher.take(source)
+            if gain is not None:
+                track.gain = gain
+        except Exception as e:
+            if self.on_error:
+                self.post(self.on_error, source, e)
+            return
+        with self._cond:
+            if any(name in ('play', 'stop') for name, _ in self._commands):
+                return  # Superseded while decoding
+            self._reset()
+            self._track = track
+            self._frame = max(0, min(int(start * track.rate), track.frames))
+            self._announce = True
+            if self.fade_frames:
+                self._envelope = _Envelope(self._out_frame,
+                                           gain_ramp(self.fade_frames, True), 0.0, 1.0)
+
+    def _take_next(self):
+        """Get the opened next track, or None.
+
+        A long track that was not decoded ahead is not decoded here, with
+        the lock held; playback finishes instead and the caller plays it.
+        """
+        next_path, self._next_path = self._next_path, None
+        if next_path is None:
+            return None
+        try:
+            track = self.prefetcher.take(next_path, ahead=True)
+            if track is not None:
+                track.gain = self._next_gain
+            return track
+        except Exception as e:
+            if self.on_error:
+                self.post(self.on_error, next_path, e)
+            return None
+
+    def _cut(self):
+        """Cut the next block's samples from the current (and incoming) track.
+
+        Returns (track, start frame, samples, announce, gain still to apply)
+        or None at the end.
+        """
+        if self._track is not None and self._frame >= self._track.frames:
+            if self._incoming is not None:
+                self._track, self._incoming = self._incoming[0], None  # Too short to overlap
+            else:
+                self._track = self._take_next()
+            self._frame = 0
+            self._announce = self._track is not None
+        track = self._track
+        if track is None:
+            return None
+
+        pos = self._frame
+        frames = min(track.frames - pos, int(BLOCK_SECONDS * track.rate))
+
+        # Pick up the next track once the crossfade region is within reach
+        if (self.fade_frames and self._incoming is None and self._next_path is not None
+                and pos + frames >= track.frames - self.fade_frames):
+            incoming = self._take_next()
+            if incoming is not None:
+                overlap = min(self.fade_frames, track.frames // 2, incoming.frames // 2)
+                self._incoming = (incoming, overlap)
+
+        if self._incoming is None:
+            self._frame += frames
+            announce, self._announce = self._announce, False
+            return track, pos, track.read(pos, frames), announce, track.gain
+
+        incoming, overlap = self._incoming
+        fade_start = track.frames - overlap
+        if pos < fade_start:
+            frames = min(frames, fade_start - pos)
+            self._frame += frames
+            announce, self._announce = self._announce, False
+            return track, pos, track.read(pos, frames), announce, track.gain
+
+        # Inside the crossfade: the block belongs to the incoming track.
+        # Both gains ride on the ramps, so the mix is already normalized
+        k = pos - fade_start
+        samples = crossfade(track.read(pos, frames),
+                            incoming.read(k, frames),
+                            gain_ramp(overlap, False)[k:k + frames] * track.gain,
+                            gain_ramp(overlap, True)[k:k + frames] * incoming.gain)
+        self._frame += frames
+        if self._frame >= track.frames:
+            self._track, self._frame, self._incoming = incoming, k + frames, None
+        self._announce = False
+        return incoming, k, samples, k == 0, 1.0
+
+    def _next_block(self):
+        """Cut the next block and apply any active fade"""
+        if self._halt is not None and self._out_frame >= self._halt[0]:
+            return None  # Nothing more is needed before halting
+        cut = self._cut()
+        if cut is None:
+            return None
+        track, start, samples, announce, gain = cut
+        block = _Block(track, start, samples, self._out_frame, announce)
+        self._out_frame += block.frames
+        if gain != 1.0:
+            scale(block.samples, gain)
+        if self.equalizer is not None:
+            self.equalizer.process(block.samples)
+
+        if self._envelope is not None:
+            apply_gain(block.samples, self._envelope.gains(block.out_start, block.frames))
+            if self._out_frame >= self._envelope.end and self._envelope.after == 1.0:
+                self._envelope = None
+        ring = self.ring
+        if ring is not None:
+            ring.write(block.samples, block.out_start)
+        return block
+
+    def _pump(self):
+        """Retire finished blocks and keep one block queued (lock held)"""
+        playing = self.channel.get_sound()
+        while self._blocks and self._blocks[0].sound is not playing:
+            self._blocks.popleft()
+            if self._blocks:
+                self._started(self._blocks[0])
+
+        if self._halt is not None and (
+                not self._blocks or self._playing_frame()[1] >= self._halt[0]):
+            self._reset()  # The fade-out has finished
+            return
+
+        if not self._blocks and not self.channel.get_busy():
+            block = self._next_block()
+            if block is None:
+                if self.on_finished:
+                    self.post(self.on_finished)
+                return
+            if not block.announce:
+                self.stats['underruns'] += 1  # Ran dry in the middle of a track
+            self._blocks.append(block)
+            self.channel.play(block.sound)
+            self._started(block)
+
+        if len(self._blocks) < 2 and self.channel.get_queue() is None:
+            block = self._next_block()
+            if block is not None:
+                if self._blocks:
+                    self._record_headroom()
+                self._blocks.append(block)
+                self.channel.queue(block.sound)
+
+    def _record_headroom(self):
+        """Track the least audio left playing when the queue was topped up"""
+        block, out_frame = self._playing_frame()
+        headroom = (block.out_start + block.frames - out_frame) / self.rate
+        if self.stats['min_headroom'] is None or headroom < self.stats['min_headroom']:
+            self.stats['min_headroom'] = headroom
+
+    def _started(self, block):
+        """Record that a block has started playing"""
+        self._block_started = time.monotonic()
+        if block.announce and self._requested_at is not None:
+            self.stats['start_latency'] = self._block_started - self._requested_at
+            self._requested_at = None
+        if block.announce:
+            self.stats['track_starts'].append((block.track.path, block.out_start))
+            if self.on_track_start:
+                self.post(self.on_track_start, block.track.path, block.track.duration)
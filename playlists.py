@@ -0,0 +1,297 @@
+"""
+Mbox Player Playlists
+Named playlists kept in SQLite. Each distinct path is stored once in a
+tracks table and playlists hold ordered track ids, so a path shared by
+many playlists costs a few bytes per entry. M3U and PLS files are read
+and written a line at a time through cursors and batched inserts, so a
+huge playlist never has to fit in memory.
+"""
+
+import os
+import sqlite3
+import threading
+from array import array
+from itertools import islice
+
+from config import FILES
+
+BATCH_SIZE = 1000
+PATH_CACHE_SIZE = 4096  # Track paths kept in memory after a lookup
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8', '.pls')
+
+
+def read_m3u(file_path):
+    """Yield the entries of an M3U playlist, resolved against its folder"""
+    folder = os.path.dirname(os.path.abspath(file_path))
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield resolve_entry(line, folder)
+
+
+def read_pls(file_path):
+    """Yield the FileN entries of a PLS playlist, resolved against its folder"""
+    folder = os.path.dirname(os.path.abspath(file_path))
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            key, sep, value = line.strip().partition('=')
+            if sep and key.lower().startswith('file') and key[4:].isdigit():
+                yield resolve_entry(value.strip(), folder)
+
+
+def resolve_entry(entry, folder):
+    """Turn a relative playlist entry into a path; URLs are kept as they are"""
+    if '://' in entry or os.path.isabs(entry):
+        return entry
+    return os.path.normpath(os.path.join(folder, entry))
+
+
+def read_playlist_file(file_path):
+    """Yield the entries of an M3U or PLS file"""
+    if os.path.splitext(file_path)[1].lower() == '.pls':
+        return read_pls(file_path)
+    return read_m3u(file_path)
+
+
+class Playlist:
+    """One playlist as a read-only sequence of paths.
+
+    Track ids are loaded into a compact array the first time the playlist
+    is read; paths are looked up only for the entries actually used, so a
+    list view over a long playlist touches just the rows on screen. A map
+    from track id to first position is built on the first ``index()``.
+    """
+
+    def __init__(self, store, playlist_id, name):
+        self.store = store
+        self.id = playlist_id
+        self.name = name
+        self._track_ids = None
+        self._positions = None
+
+    @property
+    def track_ids(self):
+        if self._track_ids is None:
+            self._track_ids = array('q', self.store.track_ids(self.id))
+        return self._track_ids
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __getitem__(self, index):
+        return self.store.track_path(self.track_ids[index])
+
+    def __iter__(self):
+        return self.store.iter_paths(self.id)
+
+    def index(self, file_path):
+        """Get the position of a path in the playlist, raising ValueError if absent"""
+        track_id = self.store.track_id(file_path)
+        if self._positions is None:
+            positions = {}
+            for position, entry in enumerate(self.track_ids):
+                positions.setdefault(entry, position)
+            self._positions = positions
+        position = self._positions.get(track_id)
+        if position is None:
+            raise ValueError(f"{file_path!r} is not in playlist {self.name!r}")
+        return position
+
+    def append(self, paths):
+        """Add paths to the end of the playlist"""
+        self.store.append(self.id, paths)
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop the loaded track ids so the next read reloads them"""
+        self._track_ids = None
+        self._positions = None
+
+
+class PlaylistStore:
+    """SQLite store of playlists and the tracks they refer to"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or FILES['playlists']
+        self._lock = threading.Lock()
+        self._paths = {}  # track id -> path, filled as tracks are looked up
+        self._playlists = {}  # name -> Playlist, so views share loaded ids
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT NOT NULL UNIQUE);"
+            "CREATE TABLE IF NOT EXISTS playlists ("
+            " id INTEGER PRIMARY KEY,"
+            " name TEXT NOT NULL UNIQUE);"
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " playlist_id INTEGER NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " track_id INTEGER NOT NULL,"
+            " PRIMARY KEY (playlist_id, position)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS entries_track ON entries (track_id);"
+        )
+        self._conn.commit()
+
+    def names(self):
+        """Get the playlist names in alphabetical order"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM playlists ORDER BY name").fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, name):
+        """Get a playlist by name, or None; its entries load on first use"""
+        playlist = self._playlists.get(name)
+        if playlist is None:
+            with self._lock:
+                row = self._conn.execute("SELECT id FROM playlists WHERE name = ?",
+                                         (name,)).fetchone()
+            if row is None:
+                return None
+            playlist = self._playlists[name] = Playlist(self, row[0], name)
+        return playlist
+
+    def create(self, name, paths=()):
+        """Create a playlist, or empty an existing one, and fill it with paths"""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO playlists (name) VALUES (?)", (name,))
+            playlist_id = self._conn.execute("SELECT id FROM playlists WHERE name = ?",
+                                             (name,)).fetchone()[0]
+            self._conn.execute("DELETE FROM entries WHERE playlist_id = ?", (playlist_id,))
+            self._conn.commit()
+        playlist = self.get(name)
+        playlist.invalidate()
+        self.append(playlist_id, paths)
+        return playlist
+
+    def delete(self, name):
+        """Delete a playlist; its tracks no other playlist refers to are dropped"""
+        playlist = self._playlists.pop(name, None)
+        if playlist is not None:
+            playlist.invalidate()
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM playlists WHERE name = ?",
+                                     (name,)).fetchone()
+            if row is None:
+                return
+            track_ids = self._conn.execute(
+                "SELECT DISTINCT track_id FROM entries WHERE playlist_id = ?", row).fetchall()
+            self._conn.execute("DELETE FROM entries WHERE playlist_id = ?", row)
+            self._conn.execute("DELETE FROM playlists WHERE id = ?", row)
+            # Only the deleted playlist's tracks can have lost their last reference
+            self._conn.executemany(
+                "DELETE FROM tracks WHERE id = ?1 AND NOT EXISTS"
+                " (SELECT 1 FROM entries WHERE track_id = ?1)", track_ids)
+            self._conn.commit()
+        for track_id, in track_ids:
+            self._paths.pop(track_id, None)
+
+    def unique_name(self, name):
+        """Get name, or "name (2)", "name (3)"... if a playlist already has it"""
+        candidate, number = name, 1
+        with self._lock:
+            while self._conn.execute("SELECT 1 FROM playlists WHERE name = ?",
+                                     (candidate,)).fetchone():
+                number += 1
+                candidate = f"{name} ({number})"
+        return candidate
+
+    def append(self, playlist_id, paths):
+        """Append paths to a playlist in batches, returning how many were added"""
+        with self._lock:
+            end = self._conn.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM entries WHERE playlist_id = ?",
+                (playlist_id,)).fetchone()[0]
+        start = end
+        paths = iter(paths)
+        while True:
+            batch = list(islice(paths, BATCH_SIZE))
+            if not batch:
+                break
+            with self._lock:
+                self._conn.executemany("INSERT OR IGNORE INTO tracks (path) VALUES (?)",
+                                       [(path,) for path in batch])
+                self._conn.executemany(
+                    "INSERT INTO entries (playlist_id, position, track_id)"
+                    " SELECT ?, ?, id FROM tracks WHERE path = ?",
+                    [(playlist_id, end + i, path) for i, path in enumerate(batch)])
+                self._conn.commit()
+            end += len(batch)
+        return end - start
+
+    def track_ids(self, playlist_id):
+        """Get the track ids of a playlist in order"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT track_id FROM entries WHERE playlist_id = ? ORDER BY position",
+                (playlist_id,))
+            return [row[0] for row in cursor]
+
+    def track_id(self, file_path):
+        """Get the id of a track path, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM tracks WHERE path = ?",
+                                     (file_path,)).fetchone()
+        return row[0] if row else None
+
+    def track_path(self, track_id):
+        """Get the path of a track id"""
+        file_path = self._paths.get(track_id)
+        if file_path is None:
+            with self._lock:
+                row = self._conn.execute("SELECT path FROM tracks WHERE id = ?",
+                                         (track_id,)).fetchone()
+            if row is None:
+                raise KeyError(track_id)
+            if len(self._paths) >= PATH_CACHE_SIZE:
+                self._paths.clear()
+            file_path = self._paths[track_id] = row[0]
+        return file_path
+
+    def iter_paths(self, playlist_id):
+        """Yield the paths of a playlist in order, a batch of rows at a time"""
+        position = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT e.position, t.path FROM entries e JOIN tracks t ON t.id = e.track_id"
+                    " WHERE e.playlist_id = ? AND e.position > ? ORDER BY e.position LIMIT ?",
+                    (playlist_id, position, BATCH_SIZE)).fetchall()
+            if not rows:
+                return
+            for position, file_path in rows:
+                yield file_path
+
+    def import_file(self, file_path, name=None):
+        """Create a playlist from an M3U or PLS file, streaming its entries.
+
+        An existing playlist of the same name is left alone; the import is
+        given a numbered name instead.
+        """
+        name = name or os.path.splitext(os.path.basename(file_path))[0]
+        return self.create(self.unique_name(name), read_playlist_file(file_path))
+
+    def export_file(self, name, file_path):
+        """Write a playlist as M3U or PLS (by extension), returning the entry count"""
+        playlist = self.get(name)
+        if playlist is None:
+            raise KeyError(name)
+        pls = os.path.splitext(file_path)[1].lower() == '.pls'
+        count = 0
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('[playlist]\n' if pls else '#EXTM3U\n')
+            for count, path in enumerate(self.iter_paths(playlist.id), 1):
+                f.write(f'File{count}={path}\n' if pls else f'{path}\n')
+            if pls:
+                f.write(f'NumberOfEntries={count}\nVersion=2\n')
+        os.replace(tmp_path, file_path)
+        return count
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,75 @@
+"""
+Mbox Player Resume Positions
+Where playback of long files (audiobooks, videos) was left off, kept as a
+small JSON file of path -> seconds. Updates only touch memory; the caller
+decides when to flush, so progress ticks never cost a disk write. The
+store is an LRU capped at LIBRARY['max_recent_files'] entries.
+"""
+
+from collections import OrderedDict
+
+from config import FILES, LIBRARY, MEDIA
+from library_store import load_json, save_json
+
+
+class ResumeStore:
+    """LRU of resume positions with batched writes"""
+
+    def __init__(self, file_path=None, capacity=None):
+        self.file_path = file_path or FILES['resume_file']
+        self.capacity = capacity or LIBRARY['max_recent_files']
+        self.dirty = False
+        self._positions = OrderedDict()
+        try:
+            saved = load_json(self.file_path, {})
+            self._positions.update((path, float(seconds)) for path, seconds in saved.items())
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Error loading resume positions: {e}")
+        self._evict()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, file_path):
+        return file_path in self._positions
+
+    def get(self, file_path):
+        """Get the saved position of a file in seconds, or None"""
+        seconds = self._positions.get(file_path)
+        if seconds is not None:
+            self._positions.move_to_end(file_path)
+        return seconds
+
+    def update(self, file_path, seconds, duration):
+        """Remember a position; short files and positions near either end are not kept"""
+        if not duration or duration < MEDIA['resume_min_duration']:
+            return
+        if seconds < MEDIA['resume_margin'] or seconds > duration - MEDIA['resume_margin']:
+            self.forget(file_path)
+            return
+        seconds = round(seconds, 1)
+        if self._positions.get(file_path) != seconds:
+            self._positions[file_path] = seconds
+            self.dirty = True
+        self._positions.move_to_end(file_path)
+        self._evict()
+
+    def forget(self, file_path):
+        """Drop the position of a file, e.g. once it has been played to the end"""
+        if self._positions.pop(file_path, None) is not None:
+            self.dirty = True
+
+    def flush(self):
+        """Write the positions if anything changed since the last flush"""
+        if not self.dirty:
+            return
+        try:
+            save_json(self.file_path, self._positions)
+            self.dirty = False
+        except OSError as e:
+            print(f"Error saving resume positions: {e}")
+
+    def _evict(self):
+        while len(self._positions) > self.capacity:
+            self._positions.popitem(last=False)
+            self.dirty = True
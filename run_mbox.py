@@ -52,18 +52,10 @@ def main():
         ("pygame", "pygame"),
         ("cv2", "opencv-python"),
         ("mutagen", "mutagen"),
+        ("numpy", "numpy"),
         ("requests", "requests")
     ]
     
-    # Check optional VLC
-    try:
-        import vlc
-        print("✅ python-vlc is available (VLC media player required for video)")
-    except ImportError:
-        print("⚠️  python-vlc not available (video playback will be limited)")
-    except Exception as e:
-        print(f"⚠️  VLC not properly configured: {e}")
-    
     missing_deps = []
     for module, package in required_modules:
         if not check_dependency(module, package):
@@ -0,0 +1,211 @@
+"""
+Mbox Player Search
+In-memory inverted index over file names and tags for filtering the
+library as you type. Every query word must be the start of some word in
+the entry's file name, title, artist or album.
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import chain
+import numpy as np
+
+WORD = re.compile(r'\w+')
+MAX_CHAR = '\U0010ffff'  # Sorts after every word that shares a prefix
+
+
+def tokenize(text):
+    """Split text into lowercase words"""
+    return WORD.findall(text.lower()) if text else []
+
+
+def entry_words(file_path, tags=None):
+    """Get the searchable words of a file from its name and tags"""
+    text = os.path.splitext(os.path.basename(file_path))[0]
+    if tags:
+        text = ' '.join((text, tags.get('title') or '', tags.get('artist') or '',
+                         tags.get('album') or ''))
+    return set(tokenize(text))
+
+
+class SearchIndex:
+    """Inverted index from words to entries, plus a hash set of paths.
+
+    Entries get integer ids in the order they are added, and results come
+    back in that order. For lookups the postings are compiled into one flat
+    array ordered by a sorted vocabulary, so every word sharing a prefix is
+    one contiguous slice. Words changed since the last compile are read from
+    the live postings instead. Once enough of them pile up, the arrays are
+    rebuilt on a worker thread from a snapshot of the entries' word sets
+    and swapped in by the next search, so typing never waits on a rebuild.
+    The index itself is only changed and searched from one thread.
+    """
+
+    def __init__(self):
+        self._paths = []  # id -> path, None once removed
+        self._ids = {}  # path -> id
+        self._words = {}  # id -> words indexed for it
+        self._postings = defaultdict(set)  # word -> ids
+        self._vocabulary = []  # Sorted words as of the last compile
+        self._offsets = np.zeros(1, dtype=np.int64)  # Slice of _flat per word
+        self._flat = np.zeros(0, dtype=np.int32)
+        self._dirty = set()  # Words whose postings changed since the compile
+        self._compiling = None  # Words changed since a background compile's snapshot
+        self._compiled = None  # (changed words, arrays) from a finished background compile
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, file_path):
+        return file_path in self._ids
+
+    def add(self, file_path, tags=None):
+        """Index a file, or re-index it with new tags"""
+        entry = self._ids.get(file_path)
+        if entry is None:
+            entry = len(self._paths)
+            self._paths.append(file_path)
+            self._ids[file_path] = entry
+            old = set()
+        else:
+            old = self._words[entry]
+        words = entry_words(file_path, tags)
+        if words == old:
+            return
+        for word in old - words:
+            self._discard(word, entry)
+        postings = self._postings
+        for word in words - old:
+            postings[word].add(entry)
+        self._touch(words.symmetric_difference(old))
+        self._words[entry] = words  # Replaced, never changed in place: snapshots share it
+
+    def add_many(self, paths, metadata=None):
+        """Index many files, taking tags from a {path: record} map"""
+        metadata = metadata or {}
+        for file_path in paths:
+            self.add(file_path, metadata.get(file_path))
+
+    def remove(self, file_path):
+        """Drop a file from the index"""
+        entry = self._ids.pop(file_path, None)
+        if entry is None:
+            return
+        words = self._words.pop(entry)
+        for word in words:
+            self._discard(word, entry)
+        self._touch(words)
+        self._paths[entry] = None
+
+    def clear(self):
+        """Drop every entry"""
+        self.__init__()
+
+    def entry_id(self, file_path):
+        """Get the id a file was indexed under, which orders search results, or None"""
+        return self._ids.get(file_path)
+
+    def matches(self, file_path, query):
+        """Check whether an indexed file matches every word of a query"""
+        words = self._words.get(self._ids.get(file_path))
+        if words is None:
+            return False
+        return all(any(word.startswith(term) for word in words)
+                   for term in set(tokenize(query)))
+
+    def search(self, query):
+        """Get the paths matching every word of a query, in the order they were added"""
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return [path for path in self._paths if path is not None]
+        self._install_compiled()
+        if (self._compiling is None
+                and len(self._dirty) > max(10000, len(self._vocabulary) // 4)):
+            self.compile_in_background()
+
+        matches = self._prefix_mask(terms[0])
+        for term in terms[1:]:
+            np.logical_and(matches, self._prefix_mask(term), out=matches)
+        paths = self._paths
+        return [paths[entry] for entry in np.flatnonzero(matches).tolist()]
+
+    def compile(self):
+        """Rebuild the lookup arrays from the live postings"""
+        self._compiling = self._compiled = None  # Any background compile is now stale
+        self._vocabulary, self._offsets, self._flat = self._build(self._postings)
+        self._dirty.clear()
+
+    def compile_in_background(self):
+        """Rebuild the lookup arrays on a worker thread; a later search swaps them in"""
+        snapshot = list(self._words.items())
+        changed = self._compiling = set()
+        thread = threading.Thread(target=self._compile_snapshot, args=(snapshot, changed),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def _compile_snapshot(self, snapshot, changed):
+        """Build lookup arrays from (id, words) pairs (worker thread)"""
+        postings = defaultdict(list)
+        for entry, words in snapshot:
+            for word in words:
+                postings[word].append(entry)
+        self._compiled = (changed, self._build(postings))
+
+    def _install_compiled(self):
+        """Swap in the arrays of a finished background compile"""
+        compiled, self._compiled = self._compiled, None
+        if compiled is None or compiled[0] is not self._compiling:
+            return  # Nothing finished, or superseded by compile() or clear()
+        changed, arrays = compiled
+        self._vocabulary, self._offsets, self._flat = arrays
+        self._dirty = changed  # Only words changed since the snapshot differ now
+        self._compiling = None
+
+    @staticmethod
+    def _build(postings):
+        """Get (sorted vocabulary, offsets, flat ids) from a {word: ids} map"""
+        vocabulary = sorted(postings)
+        lists = [postings[word] for word in vocabulary]
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, lists), np.int64, len(lists)), out=offsets[1:])
+        flat = np.fromiter(chain.from_iterable(lists), np.int32, int(offsets[-1]))
+        return vocabulary, offsets, flat
+
+    def _touch(self, words):
+        """Mark words whose postings changed"""
+        self._dirty.update(words)
+        if self._compiling is not None:
+            self._compiling.update(words)
+
+    def _discard(self, word, entry):
+        ids = self._postings[word]
+        ids.discard(entry)
+        if not ids:
+            del self._postings[word]
+
+    def _prefix_mask(self, prefix):
+        """Get a mask over entry ids that have a word starting with prefix"""
+        mask = np.zeros(len(self._paths), dtype=bool)
+        words = self._vocabulary
+        first = bisect_left(words, prefix)
+        last = bisect_left(words, prefix + MAX_CHAR, first)
+
+        # Compiled postings, in runs between the words that changed since
+        changed = [word for word in self._dirty if word.startswith(prefix)]
+        stale = sorted(i for i in (bisect_left(words, word, first, last) for word in changed)
+                       if i < last and words[i] in self._dirty)
+        start = first
+        for end in stale + [last]:
+            if end > start:
+                mask[self._flat[self._offsets[start]:self._offsets[end]]] = True
+            start = end + 1
+
+        for word in changed:
+            ids = self._postings.get(word)
+            if ids:
+                mask[np.fromiter(ids, np.int32, len(ids))] = True
+        return mask
@@ -0,0 +1,188 @@
+"""
+Mbox Player Thumbnails
+Thumbnail generation for the Pictures + Videos grid. Images are decoded with
+PIL draft mode and videos are sampled with cv2 on a background pool. Results
+are cached on disk keyed by path, size and mtime, and kept in memory as an
+LRU of ImageTk.PhotoImage objects capped by their pixel size in bytes. With
+a fingerprint store, a file missing from the cache first looks for a cached
+thumbnail of a file with the same contents, so moved files keep theirs.
+"""
+
+import os
+import shutil
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from config import MEDIA, FILES
+
+THUMBNAIL_SIZE = (160, 120)
+
+
+def is_video(file_path):
+    """Check whether a path has a video extension"""
+    return os.path.splitext(file_path)[1].lower() in MEDIA['supported_video']
+
+
+def _video_frame(file_path):
+    """Grab a frame about a tenth of the way into a video as a PIL image"""
+    import cv2  # Deferred: only needed once a video thumbnail is built
+    capture = cv2.VideoCapture(file_path)
+    try:
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        if frames > 1:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(frames / 10))
+        ok, frame = capture.read()
+        if not ok:
+            return None
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        capture.release()
+
+
+def make_thumbnail(file_path, cache_path, size=THUMBNAIL_SIZE):
+    """Build a thumbnail, save it to the disk cache and return it"""
+    if is_video(file_path):
+        image = _video_frame(file_path)
+        if image is None:
+            return None
+    else:
+        image = Image.open(file_path)
+        image.draft('RGB', size)  # Let JPEG decode at a reduced scale
+    image = image.convert('RGB')
+    image.thumbnail(size)
+
+    tmp_path = cache_path + '.tmp'
+    image.save(tmp_path, 'JPEG', quality=85)
+    os.replace(tmp_path, cache_path)
+    return image
+
+
+class PhotoLRU:
+    """LRU of PhotoImages bounded by their decoded size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._photos = OrderedDict()
+
+    def __len__(self):
+        return len(self._photos)
+
+    def get(self, key):
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+        return photo
+
+    def put(self, key, photo):
+        if key in self._photos:
+            self.bytes -= self._cost(self._photos.pop(key))
+        self._photos[key] = photo
+        self.bytes += self._cost(photo)
+        while self.bytes > self.max_bytes and len(self._photos) > 1:
+            _, evicted = self._photos.popitem(last=False)
+            self.bytes -= self._cost(evicted)
+
+    @staticmethod
+    def _cost(photo):
+        return photo.width() * photo.height() * 4
+
+
+class ThumbnailCache:
+    """Serves thumbnails from memory or disk and builds missing ones in the background"""
+
+    def __init__(self, post, cache_dir=None, size=THUMBNAIL_SIZE, workers=None,
+                 max_bytes=32 * 1024 * 1024, fingerprints=None):
+        self.post = post
+        self.fingerprints = fingerprints
+        self.cache_dir = cache_dir or os.path.join(FILES['temp_dir'], 'thumbnails')
+        self.size = size
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.memory = PhotoLRU(max_bytes)
+        self._pool = None
+        self._pending = set()
+
+    def cache_path(self, file_path, size=None, mtime=None):
+        """Get the disk cache file for a version of a file, the current one by default"""
+        if size is None:
+            st = os.stat(file_path)
+            size, mtime = st.st_size, st.st_mtime
+        key = f"{os.path.abspath(file_path)}|{size}|{mtime}|{self.size}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.jpg')
+
+    def _moved_thumbnail(self, file_path, st):
+        """Find a cached thumbnail of another file with the same contents, or None"""
+        fingerprint = self.fingerprints.fingerprint(file_path, st)
+        for other_path, size, mtime in self.fingerprints.matches(fingerprint):
+            if other_path == file_path:
+                continue
+            cache_path = self.cache_path(other_path, size, mtime)
+            if os.path.exists(cache_path) and self.fingerprints.same_contents(
+                    file_path, st, other_path, size, mtime):
+                return cache_path
+        return None
+
+    def get(self, file_path):
+        """Get a PhotoImage if the thumbnail is in memory or on disk (Tk thread only)"""
+        photo = self.memory.get(file_path)
+        if photo is not None:
+            return photo
+        try:
+            with Image.open(self.cache_path(file_path)) as image:
+                image.load()
+                return self._remember(file_path, image)
+        except OSError:
+            return None
+
+    def request(self, file_path, callback):
+        """Build a thumbnail in the background and post callback(file_path)"""
+        if file_path in self._pending:
+            return
+        if self._pool is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending.add(file_path)
+        future = self._pool.submit(self._load_or_make, file_path)
+
+        def done(future):
+            if future.cancelled():
+                return
+            image = None if future.exception() else future.result()
+            self.post(self._built, file_path, image, callback)
+        future.add_done_callback(done)
+
+    def _load_or_make(self, file_path):
+        """Read a cached thumbnail, e.g. one made before the file moved, or build it"""
+        st = os.stat(file_path)
+        cache_path = self.cache_path(file_path, st.st_size, st.st_mtime)
+        if not os.path.exists(cache_path) and self.fingerprints is not None:
+            moved = self._moved_thumbnail(file_path, st)
+            if moved is not None:
+                shutil.copyfile(moved, cache_path)
+        try:
+            with Image.open(cache_path) as image:
+                image.load()
+                return image
+        except OSError:
+            return make_thumbnail(file_path, cache_path, self.size)
+
+    def cancel_pending(self):
+        """Drop queued thumbnail jobs, e.g. after scrolling far away"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._pending.clear()
+
+    def _built(self, file_path, image, callback):
+        self._pending.discard(file_path)
+        if image is not None:
+            self._remember(file_path, image)
+            callback(file_path)
+
+    def _remember(self, file_path, image):
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(image)
+        self.memory.put(file_path, photo)
+        return photo
@@ -0,0 +1,446 @@
+"""
+Mbox Player Video
+Video playback with cv2. A decoder thread fills a bounded queue of frames
+whose pixel buffers come from a fixed pool, and a presenter on the Tk thread
+shows whichever frame is due, dropping late frames instead of stalling.
+
+The decoder thread also converts each frame to RGBA, the layout PIL keeps
+pixels in, so the Tk thread can wrap a frame without copying it and hand it
+straight to the PhotoImage. It also opens the file, and stopping only
+signals it, so a slow or network file never holds up the Tk thread.
+"""
+
+import queue
+import threading
+import time
+import numpy as np
+
+from config import ADVANCED
+
+FRAME_QUEUE_SIZE = 8  # Decoded frames buffered ahead of the presenter
+DEFAULT_FPS = 25.0
+SCALERS = ('opencl', 'area', 'reduce', 'nearest')
+
+
+def fit_size(width, height, bounds):
+    """Scale (width, height) to fit within bounds, keeping the aspect ratio"""
+    max_width, max_height = bounds
+    scale = min(max_width / width, max_height / height)
+    return max(2, int(width * scale) & ~1), max(2, int(height * scale) & ~1)
+
+
+def configured_scaler():
+    """Pick a scaler from ADVANCED['enable_hardware_acceleration'] and ['use_opengl']"""
+    if not ADVANCED.get('enable_hardware_acceleration', True):
+        return 'reduce'
+    if ADVANCED.get('use_opengl', False):
+        import cv2
+        if cv2.ocl.haveOpenCL():
+            return 'opencl'
+    return 'area'
+
+
+class FrameScaler:
+    """Resizes frames into caller-owned buffers with one of SCALERS.
+
+    'opencl' and 'area' use cv2 (on the GPU through OpenCL, or SIMD code on
+    the CPU) with INTER_AREA when shrinking. 'reduce' is the software path:
+    PIL box-reduces by the whole factor and resamples the rest. 'nearest'
+    gathers pixels with precomputed indexes; the software path uses it for
+    upscaling, where reduce has nothing to do. The target size and the
+    nearest indexes are cached until the source or the window size changes.
+    """
+
+    def __init__(self, method=None):
+        self.method = method or configured_scaler()
+        if self.method not in SCALERS:
+            raise ValueError(f"Unknown scaler: {self.method}")
+        self._target = None  # ((source size, bounds), target size)
+        self._indexes = None  # ((source shape, size), rows, cols, row buffer)
+
+    def target_size(self, source_size, bounds):
+        """Get the frame size for a source shown within bounds"""
+        key = (source_size, bounds)
+        if self._target is None or self._target[0] != key:
+            size = fit_size(*source_size, bounds) if bounds else source_size
+            self._target = (key, size)
+        return self._target[1]
+
+    def scale(self, src, dst):
+        """Resize src into dst, whose shape sets the target size"""
+        size = (dst.shape[1], dst.shape[0])
+        shrinking = size[0] < src.shape[1]
+        if self.method in ('area', 'opencl'):
+            import cv2
+            interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+            if self.method == 'opencl':
+                dst[...] = cv2.resize(cv2.UMat(src), size, interpolation=interpolation).get()
+            else:
+                cv2.resize(src, size, dst=dst, interpolation=interpolation)
+        elif self.method == 'reduce' and shrinking:
+            self._reduce(src, dst, size)
+        else:
+            self._nearest(src, dst, size)
+        return dst
+
+    def _reduce(self, src, dst, size):
+        from PIL import Image
+        height, width = src.shape[:2]
+        # Channel order does not matter for resampling, so BGR passes through as "RGB"
+        image = Image.frombuffer('RGB', (width, height), src, 'raw', 'RGB', 0, 1)
+        factor = min(width // size[0], height // size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+        dst[...] = np.asarray(image)
+
+    def _nearest(self, src, dst, size):
+        key = (src.shape, size)
+        if self._indexes is None or self._indexes[0] != key:
+            rows = np.arange(size[1]) * src.shape[0] // size[1]
+            cols = np.arange(size[0]) * src.shape[1] // size[0]
+            row_buffer = np.empty((size[1],) + src.shape[1:], dtype=src.dtype)
+            self._indexes = (key, rows, cols, row_buffer)
+        _, rows, cols, row_buffer = self._indexes
+        np.take(src, rows, axis=0, out=row_buffer)
+        np.take(row_buffer, cols, axis=1, out=dst)
+
+
+class _Frame:
+    """A pooled RGBA buffer and the stream time it is due at"""
+
+    __slots__ = ('pixels', 'index', 'time')
+
+    def __init__(self, width, height):
+        self.pixels = np.empty((height, width, 4), dtype=np.uint8)
+        self.index = 0
+        self.time = 0.0
+
+
+class VideoStream:
+    """Decodes a video on a background thread into a bounded frame queue.
+
+    Frames are scaled and converted into a fixed pool of buffers, so memory
+    stays flat however long the video is. The consumer calls ``next_frame`` with the
+    current playback position and gets the newest frame that is due; frames
+    it was too late for are dropped, and once the decoder sees it is behind
+    it skips converting frames nobody will show.
+
+    The file is opened by the decoder thread; ``on_open(error)`` is called
+    from that thread once it is open (error None) or has failed, and until
+    then fps, duration and size are placeholders.
+    """
+
+    def __init__(self, file_path, size=None, start=0.0, queue_size=FRAME_QUEUE_SIZE,
+                 scaler=None, on_open=None):
+        self.file_path = file_path
+        self.on_open = on_open
+        self.capture = None
+        self.error = None
+        self.fps = DEFAULT_FPS
+        self.frame_count = 0
+        self.duration = None
+        self.source_size = None
+        self.scaler = scaler or FrameScaler()
+        self.bounds = size
+        self.size = None
+        self.start_time = start
+
+        # decoded/skipped are only written by the decoder thread, the rest by the consumer
+        self.stats = {'decoded': 0, 'skipped': 0, 'presented': 0, 'dropped': 0}
+        self._free = queue.Queue()
+        for _ in range(queue_size):
+            self._free.put(_Frame(2, 2))  # Sized to the video on first use
+        self._ready = queue.Queue()
+        self._held = None  # Next frame, taken from the queue but not yet due
+        self._position = start
+        self._opened = threading.Event()
+        self._stopped = threading.Event()
+        self._eof = threading.Event()
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+
+    def start(self):
+        """Start opening and decoding on the decoder thread and return the stream"""
+        self._thread.start()
+        return self
+
+    def wait_open(self, timeout=None):
+        """Wait until the file is open; raises the error if it could not be opened"""
+        self._opened.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self._opened.is_set()
+
+    def stop(self):
+        """Tell the decoder thread to stop; it releases the file on its way out"""
+        self._stopped.set()
+
+    def resize(self, bounds):
+        """Fit frames decoded from now on within new bounds"""
+        self.bounds = bounds
+
+    @property
+    def finished(self):
+        """Whether every frame has been decoded and consumed"""
+        return self._eof.is_set() and self._held is None and self._ready.empty()
+
+    def next_frame(self, position):
+        """Get the newest frame due at position (seconds), dropping older ones.
+
+        Returns None when no new frame is due yet. Hand the frame back with
+        ``release`` once it has been shown.
+        """
+        self._position = position
+        frame = None
+        while True:
+            if self._held is None:
+                try:
+                    self._held = self._ready.get_nowait()
+                except queue.Empty:
+                    break
+            if self._held.time > position:
+                break
+            if frame is not None:
+                self.release(frame)
+                self.stats['dropped'] += 1
+            frame, self._held = self._held, None
+        if frame is not None:
+            self.stats['presented'] += 1
+        return frame
+
+    def next_time(self):
+        """Get the time the next queued frame is due, or None if none is ready"""
+        if self._held is None:
+            try:
+                self._held = self._ready.get_nowait()
+            except queue.Empty:
+                return None
+        return self._held.time
+
+    def release(self, frame):
+        """Return a frame's buffer to the pool"""
+        self._free.put(frame)
+
+    def _take_free(self):
+        """Wait for a free buffer, or return None once stopped"""
+        while not self._stopped.is_set():
+            try:
+                return self._free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _open(self):
+        """Open the file and read its properties (decoder thread)"""
+        import cv2
+        self.capture = cv2.VideoCapture(self.file_path)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open video: {self.file_path}")
+
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 and fps < 1000 else DEFAULT_FPS
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.duration = self.frame_count / self.fps if self.frame_count > 0 else None
+        self.source_size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                            int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.size = self.scaler.target_size(self.source_size, self.bounds)
+        if self.start_time > 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, int(self.start_time * self.fps))
+
+    def _decode(self):
+        import cv2
+        try:
+            self._open()
+        except Exception as e:
+            self.error = e
+            if self.capture is not None:
+                self.capture.release()
+            self._eof.set()
+        self._opened.set()
+        if self.on_open:
+            self.on_open(self.error)
+        if self.error is not None:
+            return
+
+        index = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        raw = scaled = None
+        try:
+            while not self._stopped.is_set():
+                frame = self._take_free()
+                if frame is None:
+                    break
+
+                # More than a frame behind the presenter: skip without retrieving or scaling
+                ok = True
+                while ok and (index + 1) / self.fps < self._position:
+                    ok = self.capture.grab()
+                    if ok:
+                        self.stats['skipped'] += 1
+                        index += 1
+                if not ok:
+                    self._free.put(frame)
+                    break
+
+                ok, raw = self.capture.read(raw)
+                if not ok:
+                    self._free.put(frame)
+                    break
+                self.size = width, height = self.scaler.target_size(self.source_size, self.bounds)
+                if frame.pixels.shape[:2] != (height, width):
+                    frame.pixels = np.empty((height, width, 4), dtype=np.uint8)
+                if self.size != self.source_size:
+                    if scaled is None or scaled.shape[:2] != (height, width):
+                        scaled = np.empty((height, width, 3), dtype=np.uint8)
+                    raw_frame = self.scaler.scale(raw, scaled)
+                else:
+                    raw_frame = raw
+                cv2.cvtColor(raw_frame, cv2.COLOR_BGR2RGBA, dst=frame.pixels)
+                frame.index = index
+                frame.time = index / self.fps
+                index += 1
+                self.stats['decoded'] += 1
+                self._ready.put(frame)
+        except Exception as e:
+            print(f"Error decoding video {self.file_path}: {e}")
+        finally:
+            self.capture.release()
+            self._eof.set()
+
+
+class VideoPlayer:
+    """Plays VideoStreams into a VideoCanvas on the Tk thread.
+
+    The presenter wakes up when the next frame is due (using the view's
+    ``after``), shows it, and hands its buffer straight back to the pool.
+    It exposes the same controls as the audio engine so the player can
+    drive either one.
+    """
+
+    def __init__(self, view, post, on_start=None, on_finished=None, on_error=None):
+        self.view = view
+        self.post = post
+        self.on_start = on_start
+        self.on_finished = on_finished
+        self.on_error = on_error
+        self.stream = None
+        self.stats = {}
+        self._file_path = None
+        self._start = 0.0  # Position to report until the stream is open
+        self._origin = None  # perf_counter time of stream position 0, once open
+        self._paused_at = None
+        self._job = None
+        view.bind('<Configure>', self._on_resize, add='+')
+
+    def play(self, file_path, start=0.0):
+        """Start opening a video, playing it from start seconds once it is open.
+
+        on_start(file_path, duration) or on_error(file_path, error) follow
+        through ``post``.
+        """
+        self.stop()
+        stream = VideoStream(file_path, size=self.view.frame_bounds(), start=start,
+                             on_open=lambda error: self.post(self._opened, stream, error))
+        self.stream = stream.start()
+        self.stats = stream.stats
+        self._file_path = file_path
+        self._start = start
+        self._origin = None
+        self._paused_at = None
+
+    def _opened(self, stream, error):
+        """Start presenting a stream the decoder thread has opened"""
+        if stream is not self.stream:
+            return  # Stopped or replaced while opening
+        if error is not None:
+            self.stream = None
+            if self.on_error:
+                self.on_error(stream.file_path, error)
+            return
+        self._origin = time.perf_counter() - self._start
+        if self._paused_at is None:
+            self._schedule(0)
+        if self.on_start:
+            self.on_start(stream.file_path, stream.duration)
+
+    def pause(self):
+        """Freeze the clock and stop presenting"""
+        if self.stream is not None and self._paused_at is None:
+            self._paused_at = self.position()
+            self._cancel()
+
+    def resume(self):
+        """Continue from where the clock was paused"""
+        if self.stream is not None and self._paused_at is not None:
+            self._start = self._paused_at
+            self._paused_at = None
+            if self._origin is not None:  # Otherwise _opened starts the clock
+                self._origin = time.perf_counter() - self._start
+                self._schedule(0)
+
+    def stop(self):
+        """Stop playback and clear the view"""
+        self._cancel()
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+        self._paused_at = None
+        self.view.clear()
+
+    def seek(self, seconds):
+        """Restart decoding at a new position, keeping the paused state"""
+        if self.stream is None:
+            return
+        paused = self._paused_at is not None
+        self.play(self._file_path, max(0.0, seconds))
+        if paused:
+            self.pause()
+
+    def is_active(self):
+        """Whether a video is loaded (playing or paused)"""
+        return self.stream is not None
+
+    def position(self):
+        """Get the playback position in seconds"""
+        if self.stream is None:
+            return 0.0
+        if self._paused_at is not None:
+            return self._paused_at
+        if self._origin is None:
+            return self._start  # Still opening
+        return time.perf_counter() - self._origin
+
+    def duration(self):
+        """Get the length of the current video in seconds, if known"""
+        return self.stream.duration if self.stream is not None else None
+
+    def _on_resize(self, event):
+        if self.stream is not None:
+            self.stream.resize(self.view.frame_bounds())
+
+    def _schedule(self, delay_ms):
+        self._job = self.view.after(delay_ms, self._present)
+
+    def _cancel(self):
+        if self._job is not None:
+            self.view.after_cancel(self._job)
+            self._job = None
+
+    def _present(self):
+        self._job = None
+        stream = self.stream
+        frame = stream.next_frame(self.position())
+        if frame is not None:
+            self.view.show(frame.pixels)
+            stream.release(frame)
+
+        if stream.finished:
+            stream.stop()
+            self.stream = None
+            if self.on_finished:
+                self.on_finished()
+            return
+
+        due = stream.next_time()
+        wait = 1.0 / stream.fps if due is None else due - self.position()
+        self._schedule(max(1, int(wait * 1000)))
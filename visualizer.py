@@ -0,0 +1,98 @@
+"""
+Mbox Player Visualizer
+Spectrum and level data for the visualizer, taken from what the audio
+engine is playing.
+
+The engine copies each block it hands to the mixer into a PCMRing, keyed
+by output frame. The ring stores every sample twice, one capacity apart,
+so any window of up to ``capacity`` frames is one contiguous slice: the
+visualizer reads a NumPy view of the frames at the playing position,
+never a copy. SpectrumAnalyzer turns such a window into log-spaced band
+levels with one FFT and one reduceat per frame.
+"""
+
+import numpy as np
+
+RING_SECONDS = 1.5  # Covers the blocks queued ahead of the playing one
+FFT_SIZE = 2048
+BAND_COUNT = 32
+LOWEST_BAND = 40  # Hz
+FLOOR_DB = -60.0  # Shown as an empty bar
+FALL_PER_FRAME = 0.06  # Fraction of full height a bar drops per frame
+
+
+class PCMRing:
+    """The most recent output frames, readable as zero-copy windows.
+
+    Written by the engine thread and read by the Tk thread without a lock:
+    a read that races a write only shows a partly updated window.
+    """
+
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self.channels = channels
+        self.written = 0  # Output frame just past the newest sample
+        self._data = np.zeros((2 * capacity, channels), dtype=np.int16)
+
+    def write(self, samples, out_start):
+        """Store a block of int16 samples that starts at an output frame"""
+        samples = samples.reshape(len(samples), -1)
+        if len(samples) > self.capacity:
+            out_start += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        start = out_start % self.capacity
+        first = min(len(samples), self.capacity - start)
+        for offset in (0, self.capacity):
+            self._data[offset + start:offset + start + first] = samples[:first]
+            self._data[offset:offset + len(samples) - first] = samples[first:]
+        self.written = max(self.written, out_start + len(samples))
+
+    def window(self, end, frames):
+        """Get a view of the frames before output frame end, or None if not held"""
+        if frames > self.capacity or end < frames or end > self.written:
+            return None
+        if end - frames < self.written - self.capacity:
+            return None  # Already overwritten
+        start = (end - frames) % self.capacity
+        return self._data[start:start + frames]
+
+
+class SpectrumAnalyzer:
+    """Turns windows of samples into 0-1 band heights and channel levels"""
+
+    def __init__(self, rate, size=FFT_SIZE, bands=BAND_COUNT):
+        self.rate = rate
+        self.size = size
+        self.window = np.hanning(size).astype(np.float32)
+        self._reference = self.window.sum() * 32768 / 2  # Full-scale sine peak
+
+        freqs = np.fft.rfftfreq(size, 1.0 / rate)
+        edges = np.geomspace(LOWEST_BAND, min(16000, rate / 2), bands + 1)
+        starts = np.searchsorted(freqs, edges[:-1])
+        self._starts = np.maximum(starts, np.arange(bands) + starts[0])  # Never empty
+        self._stop = max(int(np.searchsorted(freqs, edges[-1])), self._starts[-1] + 1)
+        self.bands = np.zeros(bands, dtype=np.float32)
+
+    def analyze(self, samples):
+        """Get (band heights, channel levels) for a window of int16 samples"""
+        samples = samples.reshape(len(samples), -1)
+        mono = samples.mean(axis=1, dtype=np.float32)
+        spectrum = np.abs(np.fft.rfft(mono * self.window)[:self._stop])
+        peaks = np.maximum.reduceat(spectrum, self._starts) / self._reference
+        heights = self._scale(peaks)
+        # Bars jump up at once and fall back gradually
+        np.maximum(heights, self.bands - FALL_PER_FRAME, out=self.bands)
+
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float32), axis=0)) / 32768
+        return self.bands, self._scale(rms * np.sqrt(2))
+
+    def silence(self):
+        """Let the bars fall while nothing is playing; returns the band heights"""
+        np.maximum(self.bands - FALL_PER_FRAME, 0.0, out=self.bands)
+        return self.bands
+
+    @staticmethod
+    def _scale(amplitudes):
+        with np.errstate(divide='ignore'):
+            db = 20 * np.log10(amplitudes)
+        return np.clip(1.0 - db / FLOOR_DB, 0.0, 1.0).astype(np.float32)
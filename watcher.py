@@ -0,0 +1,338 @@
+"""
+Mbox Player Library Watcher
+Keeps the library index current by watching LIBRARY['scan_directories']
+instead of rescanning them. On Linux it uses inotify (through ctypes, so no
+extra package is needed); elsewhere, or if inotify is unavailable, it polls
+directory mtimes, which change whenever an entry is added, removed or
+renamed. Bursts of events are coalesced and applied to the index in one
+batch, then reported to the caller.
+"""
+
+import os
+import sys
+import ctypes
+import ctypes.util
+import errno
+import select
+import struct
+import threading
+import time
+
+from config import LIBRARY
+from library import media_extensions, is_excluded
+from metadata import read_tags
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+def load_inotify():
+    """Get libc with the inotify calls, or None where they are unavailable"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class LibraryWatcher:
+    """Watches the scan directories and applies file changes to the index.
+
+    ``on_changes(result)`` is called from the watcher thread with the paths
+    that were added or changed (``updated``) and deleted (``removed``), or
+    with ``rescan`` set when events were lost and a full scan is needed.
+    """
+
+    def __init__(self, index, directories=None, exclude_patterns=None,
+                 on_changes=None, use_inotify=True, poll_interval=None, settle=None):
+        self.index = index
+        self.directories = [os.path.abspath(d) for d in
+                            (directories if directories is not None
+                             else LIBRARY['scan_directories'])]
+        self.exclude_patterns = list(exclude_patterns if exclude_patterns is not None
+                                     else LIBRARY['exclude_patterns'])
+        self.on_changes = on_changes
+        self.poll_interval = poll_interval or LIBRARY['watch_poll_interval']
+        self.settle = settle if settle is not None else LIBRARY['watch_settle']
+        self.extensions = media_extensions()
+        self.libc = load_inotify() if use_inotify else None
+        self.backend = None
+        self._pending = {}  # path -> 'updated' or 'removed'; the last event wins
+        self._removed_dirs = set()
+        self._rescan = False
+        self._last_event = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Watch on a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop watching"""
+        self._stop.set()
+
+    def is_running(self):
+        """Check whether the watcher thread is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for the watcher thread to finish after stop()"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Watch until stopped, with inotify if it can be set up"""
+        if self.libc is not None:
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                try:
+                    self.backend = 'inotify'
+                    if self._run_inotify(fd):
+                        return
+                finally:
+                    os.close(fd)
+        self.backend = 'polling'
+        self._run_polling()
+
+    def _is_media(self, name):
+        return (not is_excluded(name, self.exclude_patterns)
+                and os.path.splitext(name)[1].lower() in self.extensions)
+
+    def _note(self, path, change):
+        self._pending[path] = change
+        self._last_event = time.monotonic()
+
+    def _note_dir_removed(self, path):
+        self._removed_dirs.add(os.path.join(path, ''))
+        self._last_event = time.monotonic()
+
+    def _report_files(self, directories):
+        """Report the media files in directories that just appeared"""
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if self._is_media(entry.name) and not entry.is_dir(follow_symlinks=False):
+                            self._note(entry.path, 'updated')
+            except OSError:
+                continue
+
+    # inotify backend
+
+    def _run_inotify(self, fd):
+        """Watch with inotify; returns False if it has to give way to polling"""
+        watches = {}  # wd -> directory
+
+        def add_tree(directory, report):
+            dirs = self._list_dirs(directory)
+            for path in dirs:
+                wd = self.libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK)
+                if wd < 0:
+                    err = ctypes.get_errno()
+                    if err == errno.ENOSPC:
+                        print("Error watching library: inotify watch limit reached, polling instead")
+                        return False
+                    continue
+                watches[wd] = path
+            if report:
+                # Listed after the watches exist, so files created meanwhile are not missed
+                self._report_files(dirs)
+            return True
+
+        for directory in self.directories:
+            if os.path.isdir(directory) and not add_tree(directory, report=False):
+                return False
+
+        while not self._stop.is_set():
+            ready, _, _ = select.select([fd], [], [], self._wait_time())
+            if ready:
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    data = b''
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, length = EVENT.unpack_from(data, offset)
+                    offset += EVENT.size
+                    name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                    offset += length
+                    if mask & IN_Q_OVERFLOW:
+                        self._rescan = True
+                        self._last_event = time.monotonic()
+                        continue
+                    directory = watches.get(wd)
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    if directory is None or not name:
+                        continue
+                    path = os.path.join(directory, name)
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            if not add_tree(path, report=True):
+                                return False
+                        elif mask & (IN_DELETE | IN_MOVED_FROM):
+                            self._note_dir_removed(path)
+                    elif self._is_media(name):
+                        if mask & (IN_DELETE | IN_MOVED_FROM):
+                            self._note(path, 'removed')
+                        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                            self._note(path, 'updated')
+            self._flush_if_settled()
+        return True
+
+    def _list_dirs(self, directory):
+        """List a directory and every directory under it"""
+        dirs = []
+        stack = [directory]
+        while stack:
+            path = stack.pop()
+            dirs.append(path)
+            try:
+                with os.scandir(path) as entries:
+                    stack.extend(entry.path for entry in entries
+                                 if entry.is_dir(follow_symlinks=False)
+                                 and not is_excluded(entry.name, self.exclude_patterns))
+            except OSError:
+                continue
+        return dirs
+
+    # Polling backend
+
+    def _snapshot(self, directory):
+        """Get (mtime, media file names, subdirectory names) of a directory, or None"""
+        try:
+            mtime = os.stat(directory).st_mtime
+            files, subdirs = set(), set()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if is_excluded(entry.name, self.exclude_patterns):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.name)
+                    elif self._is_media(entry.name):
+                        files.add(entry.name)
+        except OSError:
+            return None
+        return mtime, files, subdirs
+
+    def _run_polling(self):
+        """Stat every known directory each interval and relist only those that changed"""
+        state = {}
+
+        def add_tree(directory, report):
+            stack = [directory]
+            while stack:
+                path = stack.pop()
+                snapshot = self._snapshot(path)
+                if snapshot is None:
+                    continue
+                state[path] = snapshot
+                if report:
+                    for name in snapshot[1]:
+                        self._note(os.path.join(path, name), 'updated')
+                stack.extend(os.path.join(path, name) for name in snapshot[2])
+
+        for directory in self.directories:
+            add_tree(directory, report=False)
+
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.wait(min(self._wait_time(), max(0.0, next_poll - time.monotonic()))):
+            if time.monotonic() >= next_poll:
+                for directory, (mtime, files, subdirs) in list(state.items()):
+                    if directory not in state:
+                        continue  # Dropped along with a removed parent
+                    try:
+                        if os.stat(directory).st_mtime == mtime:
+                            continue
+                    except OSError:
+                        pass
+                    snapshot = self._snapshot(directory)
+                    if snapshot is None:
+                        prefix = os.path.join(directory, '')
+                        for path in [path for path in state if path.startswith(prefix)]:
+                            del state[path]
+                        del state[directory]
+                        self._note_dir_removed(directory)
+                        continue
+                    state[directory] = snapshot
+                    for name in snapshot[1] - files:
+                        self._note(os.path.join(directory, name), 'updated')
+                    for name in files - snapshot[1]:
+                        self._note(os.path.join(directory, name), 'removed')
+                    for name in snapshot[2] - subdirs:
+                        add_tree(os.path.join(directory, name), report=True)
+                    for name in subdirs - snapshot[2]:
+                        path = os.path.join(directory, name)
+                        prefix = os.path.join(path, '')
+                        for known in [known for known in state
+                                      if known == path or known.startswith(prefix)]:
+                            del state[known]
+                        self._note_dir_removed(path)
+                next_poll = time.monotonic() + self.poll_interval
+            self._flush_if_settled()
+
+    # Coalescing
+
+    def _wait_time(self):
+        """How long to wait for events before checking whether a batch has settled"""
+        if self._pending or self._removed_dirs or self._rescan:
+            return max(0.05, self._last_event + self.settle - time.monotonic())
+        return 1.0
+
+    def _flush_if_settled(self):
+        """Apply pending changes once no new events arrived for `settle` seconds"""
+        if not (self._pending or self._removed_dirs or self._rescan):
+            return
+        if time.monotonic() - self._last_event < self.settle:
+            return
+        pending, removed_dirs, rescan = self._pending, self._removed_dirs, self._rescan
+        self._pending, self._removed_dirs, self._rescan = {}, set(), False
+        result = self.apply(pending, removed_dirs)
+        result['rescan'] = rescan
+        if self.on_changes:
+            self.on_changes(result)
+
+    def apply(self, pending, removed_dirs=()):
+        """Write a batch of changes to the index and summarize it"""
+        removed = [path for path, change in pending.items() if change == 'removed']
+        if removed_dirs:
+            prefixes = tuple(removed_dirs)
+            removed.extend(path for path in self.index.paths()
+                           if path.startswith(prefixes) and path not in pending)
+        records = []
+        for path, change in pending.items():
+            if change != 'updated':
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                removed.append(path)  # Gone again before the batch settled
+                continue
+            record = {'path': path, 'size': st.st_size, 'mtime': st.st_mtime}
+            record.update(read_tags(path))
+            records.append(record)
+        self.index.upsert_many(records)
+        self.index.remove_many(removed)
+        return {'updated': [record['path'] for record in records], 'removed': removed}
@@ -0,0 +1,133 @@
+"""
+Mbox Player Waveforms
+Peak data for the waveform seek bar, computed once per file in a background
+process pool and cached as compact binary files in FILES['temp_dir'].
+
+Each cache file holds a small header followed by uint8 (min, max) pairs,
+one pair per SAMPLES_PER_PEAK mono samples.
+"""
+
+import os
+import hashlib
+import multiprocessing
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from config import FILES
+
+SAMPLES_PER_PEAK = 1024
+PEAK_RATE = 22050  # Decode rate used for analysis
+HEADER = struct.Struct('<4sIII')  # magic, sample rate, samples per peak, peak count
+MAGIC = b'MBPK'
+
+
+def compute_peaks(samples, samples_per_peak=SAMPLES_PER_PEAK):
+    """Reduce int16 mono samples to uint8 (min, max) pairs per block"""
+    samples = np.asarray(samples)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1).astype(np.int16)
+    count = -(-len(samples) // samples_per_peak)
+    if count == 0:
+        return np.zeros((0, 2), dtype=np.uint8)
+
+    # Pad the last block with its own final sample so it does not skew the range
+    padded = np.empty(count * samples_per_peak, dtype=np.int16)
+    padded[:len(samples)] = samples
+    padded[len(samples):] = samples[-1]
+    blocks = padded.reshape(count, samples_per_peak)
+
+    peaks = np.empty((count, 2), dtype=np.uint8)
+    peaks[:, 0] = (blocks.min(axis=1).astype(np.int32) + 32768) >> 8
+    peaks[:, 1] = (blocks.max(axis=1).astype(np.int32) + 32768) >> 8
+    return peaks
+
+
+def _init_decoder():
+    """Set up a silent mono mixer in a pool worker for decoding"""
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    import pygame
+    pygame.mixer.init(frequency=PEAK_RATE, size=-16, channels=1)
+
+
+def _decode_mono(file_path):
+    import pygame
+    return pygame.sndarray.array(pygame.mixer.Sound(file_path))
+
+
+def build_peak_file(file_path, cache_path):
+    """Decode a file, compute its peaks and write the cache file"""
+    peaks = compute_peaks(_decode_mono(file_path))
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, PEAK_RATE, SAMPLES_PER_PEAK, len(peaks)))
+        f.write(peaks.tobytes())
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def read_peak_file(cache_path):
+    """Read a cache file, returning (peaks, seconds per peak) or None"""
+    try:
+        with open(cache_path, 'rb') as f:
+            magic, rate, samples_per_peak, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                return None
+            peaks = np.fromfile(f, dtype=np.uint8, count=count * 2)
+    except (OSError, struct.error):
+        return None
+    if len(peaks) != count * 2:
+        return None
+    return peaks.reshape(count, 2), samples_per_peak / rate
+
+
+class PeakCache:
+    """Finds cached peaks for a file or builds them in a process pool"""
+
+    def __init__(self, post, cache_dir=None, workers=2):
+        self.post = post
+        self.cache_dir = cache_dir or os.path.join(FILES['temp_dir'], 'peaks')
+        self.workers = workers
+        self._pool = None
+        self._pending = {}
+
+    def cache_path(self, file_path):
+        """Get the cache file for the current version of a media file"""
+        st = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pk')
+
+    def load(self, file_path):
+        """Get (peaks, seconds per peak) from the cache, or None"""
+        try:
+            return read_peak_file(self.cache_path(file_path))
+        except OSError:
+            return None
+
+    def request(self, file_path, callback):
+        """Build peaks in the background and post callback(file_path, result)"""
+        try:
+            cache_path = self.cache_path(file_path)
+        except OSError:
+            return
+        if cache_path in self._pending:
+            return
+        if self._pool is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Spawn rather than fork: a forked child would inherit SDL's audio state
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_decoder)
+        future = self._pool.submit(build_peak_file, file_path, cache_path)
+        self._pending[cache_path] = future
+
+        def done(future):
+            self._pending.pop(cache_path, None)
+            if future.exception() is None:
+                self.post(callback, file_path, read_peak_file(cache_path))
+        future.add_done_callback(done)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,443 @@
+"""
+Mbox Player Widgets
+Custom Tk widgets used by the media center.
+"""
+
+import os
+import tkinter as tk
+import tkinter.font as tkfont
+
+
+class VirtualListbox(tk.Frame):
+    """Listbox that only holds the visible rows of a backing list.
+
+    The backing list is read through ``items`` and ``formatter``; Tk only
+    ever sees the handful of strings currently on screen. Indexes returned
+    by ``curselection`` refer to the backing list, like a normal Listbox.
+    """
+
+    def __init__(self, parent, items, formatter=str, font=('Arial', 12), **kwargs):
+        bg = kwargs.get('bg', None)
+        super().__init__(parent, bg=bg)
+        self.items = items
+        self.formatter = formatter
+        self.top = 0
+        self.selected = None
+        self._visible_rows = 1
+        self._row_height = tkfont.Font(font=font).metrics('linespace') + 1
+
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.listbox = tk.Listbox(self, font=font, activestyle='none',
+                                  exportselection=False, **kwargs)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.listbox.bind('<Configure>', self._on_configure)
+        self.listbox.bind('<<ListboxSelect>>', self._on_select)
+        self.listbox.bind('<MouseWheel>', self._on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self._scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self._scroll_by(3))
+        self.listbox.bind('<Up>', lambda e: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda e: self._move_selection(-self._visible_rows))
+        self.listbox.bind('<Next>', lambda e: self._move_selection(self._visible_rows))
+
+    def bind(self, sequence=None, func=None, add=None):
+        """Bind events on the inner listbox so clicks reach the caller"""
+        return self.listbox.bind(sequence, func, add)
+
+    def set_items(self, items):
+        """Point the view at a different backing list"""
+        self.items = items
+        self.selected = None
+        self.top = 0
+        self.refresh()
+
+    def rows_inserted(self, index):
+        """Keep the view on the same rows after one was inserted into the backing list"""
+        if self.selected is not None and index <= self.selected:
+            self.selected += 1
+        if index < self.top:
+            self.top += 1
+
+    def rows_removed(self, index):
+        """Keep the view on the same rows after one was removed from the backing list"""
+        if self.selected is not None:
+            if index == self.selected:
+                self.selected = None
+            elif index < self.selected:
+                self.selected -= 1
+        if index < self.top:
+            self.top -= 1
+
+    def curselection(self):
+        """Get the selected backing-list index as a tuple"""
+        if self.selected is None or self.selected >= len(self.items):
+            return ()
+        return (self.selected,)
+
+    def selection_set(self, index):
+        """Select a backing-list index and scroll it into view"""
+        self.selected = index
+        self.see(index)
+
+    def see(self, index):
+        """Scroll so a backing-list index is visible"""
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self._visible_rows:
+            self.top = index - self._visible_rows + 1
+        self.refresh()
+
+    def yview(self, *args):
+        """Scrollbar callback for moveto and scroll commands"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.items))
+            self.refresh()
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self._visible_rows
+            self._scroll_by(step)
+
+    def refresh(self):
+        """Re-render the visible rows from the backing list"""
+        total = len(self.items)
+        self.top = max(0, min(self.top, total - self._visible_rows))
+        end = min(total, self.top + self._visible_rows + 1)
+
+        self.listbox.delete(0, tk.END)
+        if end > self.top:
+            self.listbox.insert(0, *(self.formatter(self.items[i])
+                                     for i in range(self.top, end)))
+        if self.selected is not None and self.top <= self.selected < end:
+            self.listbox.selection_set(self.selected - self.top)
+            self.listbox.activate(self.selected - self.top)
+
+        if total:
+            self.scrollbar.set(self.top / total, end / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _scroll_by(self, rows):
+        self.top += rows
+        self.refresh()
+        return 'break'
+
+    def _move_selection(self, rows):
+        if self.items:
+            current = self.selected if self.selected is not None else self.top
+            self.selection_set(max(0, min(len(self.items) - 1, current + rows)))
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-1 if event.delta > 0 else 1)
+
+    def _on_configure(self, event):
+        rows = max(1, event.height // self._row_height)
+        if rows != self._visible_rows:
+            self._visible_rows = rows
+            self.refresh()
+
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.top + selection[0]
+
+
+class WaveformSeekBar(tk.Canvas):
+    """Seek bar that draws a track's waveform behind the playback position.
+
+    Follows a 0-100 variable like ttk.Progressbar. Peaks are uint8 (min, max)
+    pairs; they are reduced to one column per pixel and drawn as a single
+    polygon, so redrawing costs the same for a short song or an hour-long file.
+    Clicking calls ``command`` with the clicked fraction of the track.
+    """
+
+    def __init__(self, parent, variable, command=None, length=400, height=48,
+                 bg='black', wave_color='white', played_color='red', **kwargs):
+        super().__init__(parent, width=length, height=height, bg=bg,
+                         highlightthickness=0, **kwargs)
+        self.variable = variable
+        self.command = command
+        self.peaks = None
+        self._played = self.create_rectangle(0, 0, 0, height, fill=played_color, width=0)
+        self._wave = self.create_polygon(0, 0, 0, 0, fill=wave_color, outline='')
+        self._cursor = self.create_line(0, 0, 0, height, fill=played_color, width=2)
+
+        self.variable.trace_add('write', lambda *args: self.update_position())
+        self.bind('<Configure>', lambda e: self.redraw())
+        self.bind('<Button-1>', self._on_click)
+
+    def set_peaks(self, peaks):
+        """Show new peak data (or None for a flat line)"""
+        self.peaks = peaks
+        self.redraw()
+
+    def redraw(self):
+        """Redraw the waveform for the current size"""
+        width, height = max(self.winfo_width(), 2), max(self.winfo_height(), 2)
+        if self.peaks is None or len(self.peaks) == 0:
+            middle = height / 2
+            self.coords(self._wave, 0, middle - 1, width, middle - 1,
+                        width, middle + 1, 0, middle + 1)
+        else:
+            import numpy as np  # Peaks only exist once playback has loaded numpy
+            starts = np.linspace(0, len(self.peaks), width, endpoint=False).astype(np.intp)
+            lows = np.minimum.reduceat(self.peaks[:, 0], starts)
+            highs = np.maximum.reduceat(self.peaks[:, 1], starts)
+            xs = np.arange(width, dtype=np.float32)
+            tops = (255 - highs) * (height / 255.0)
+            bottoms = (255 - lows) * (height / 255.0)
+            top_edge = np.column_stack((xs, tops))
+            bottom_edge = np.column_stack((xs[::-1], bottoms[::-1]))
+            self.coords(self._wave, *np.concatenate((top_edge, bottom_edge)).ravel().tolist())
+        self.update_position()
+
+    def update_position(self):
+        """Move the cursor and played region to the variable's value"""
+        width, height = self.winfo_width(), self.winfo_height()
+        x = max(0.0, min(1.0, self.variable.get() / 100.0)) * width
+        self.coords(self._played, 0, 0, x, height)
+        self.coords(self._cursor, x, 0, x, height)
+
+    def _on_click(self, event):
+        if self.command and self.winfo_width() > 0:
+            self.command(max(0.0, min(1.0, event.x / self.winfo_width())))
+
+
+class SpectrumView(tk.Canvas):
+    """Spectrum bars with a level meter per channel, drawn at a capped frame rate.
+
+    ``source()`` returns (band heights, channel levels) as 0-1 sequences,
+    or None when there is nothing to show. The bars and meters are created
+    once and only moved afterwards. Polling stops as soon as the canvas is
+    not viewable, including when a parent frame is hidden; the owner calls
+    start() again when the parent is shown, since Tk sends no <Map> then.
+    """
+
+    def __init__(self, parent, source, bands=32, channels=2, fps=30, height=80,
+                 bg='black', bar_color='white', meter_color='red', **kwargs):
+        super().__init__(parent, height=height, bg=bg, highlightthickness=0, **kwargs)
+        self.source = source
+        self.interval = max(1, 1000 // fps)
+        self._bars = [self.create_rectangle(0, 0, 0, 0, fill=bar_color, width=0)
+                      for _ in range(bands)]
+        self._meters = [self.create_rectangle(0, 0, 0, 0, fill=meter_color, width=0)
+                        for _ in range(channels)]
+        self._job = None
+        self.bind('<Map>', lambda e: self.start())
+        self.bind('<Unmap>', lambda e: self.stop())
+
+    def start(self):
+        """Start drawing frames"""
+        if self._job is None:
+            self._job = self.after(self.interval, self._tick)
+
+    def stop(self):
+        """Stop drawing until the canvas is shown again"""
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        self._job = None
+        if not self.winfo_viewable():
+            return
+        frame = self.source()
+        if frame is not None:
+            self.draw(*frame)
+        self._job = self.after(self.interval, self._tick)
+
+    def draw(self, bands, levels):
+        """Move the bars and meters to new heights"""
+        width, height = self.winfo_width(), self.winfo_height()
+        meter_width = 8 * len(self._meters)
+        step = (width - meter_width - 8) / len(self._bars)
+        for i, (bar, value) in enumerate(zip(self._bars, bands)):
+            x = i * step
+            self.coords(bar, x + 1, height * (1.0 - value), x + step - 1, height)
+        for i, (meter, value) in enumerate(zip(self._meters, levels)):
+            x = width - meter_width + i * 8
+            self.coords(meter, x, height * (1.0 - value), x + 6, height)
+
+
+class VideoCanvas(tk.Canvas):
+    """Canvas that shows RGBA frames centred, pasting into one reused PhotoImage"""
+
+    def __init__(self, parent, bg='black', **kwargs):
+        super().__init__(parent, bg=bg, highlightthickness=0, **kwargs)
+        self._photo = None
+        self._image = self.create_image(0, 0, anchor=tk.CENTER)
+        self.bind('<Configure>', self._on_configure)
+
+    def frame_bounds(self):
+        """Get the largest frame size that fits the canvas"""
+        width, height = self.winfo_width(), self.winfo_height()
+        if width <= 1 or height <= 1:  # Not mapped yet; use the requested size
+            width, height = self.winfo_reqwidth(), self.winfo_reqheight()
+        return max(width, 2), max(height, 2)
+
+    def show(self, pixels):
+        """Show an RGBA uint8 array of shape (height, width, 4)"""
+        from PIL import Image, ImageTk
+        height, width = pixels.shape[:2]
+        # RGBA matches PIL's own pixel layout, so this wraps the array without a copy
+        image = Image.frombuffer('RGBA', (width, height), pixels, 'raw', 'RGBA', 0, 1)
+        if self._photo is None or (self._photo.width(), self._photo.height()) != (width, height):
+            self._photo = ImageTk.PhotoImage(image)
+            self.itemconfigure(self._image, image=self._photo)
+        else:
+            self._photo.paste(image)
+
+    def clear(self):
+        """Remove the current frame"""
+        self.itemconfigure(self._image, image='')
+        self._photo = None
+
+    def _on_configure(self, event):
+        self.coords(self._image, event.width / 2, event.height / 2)
+
+
+class ThumbnailGrid(tk.Frame):
+    """Scrollable grid of thumbnails that only creates items for visible cells.
+
+    ``thumbnails`` provides get(path) -> PhotoImage or None and
+    request(path, callback); cells whose thumbnail is missing show a
+    placeholder until the callback arrives. Canvas items of cells that
+    scroll out of view are recycled for the ones scrolling in.
+    """
+
+    MARGIN = 5  # Around the thumbnail box
+    LABEL_HEIGHT = 25  # Space under the box for the file name
+
+    def __init__(self, parent, items, thumbnails, on_open=None, cell_size=(180, 150),
+                 bg='black', fg='white', placeholder='gray', **kwargs):
+        super().__init__(parent, bg=bg, **kwargs)
+        self.items = items
+        self.thumbnails = thumbnails
+        self.on_open = on_open
+        self.cell_width, self.cell_height = cell_size
+        self.box_width = self.cell_width - 4 * self.MARGIN
+        self.box_height = self.cell_height - self.LABEL_HEIGHT - self.MARGIN
+        self.placeholder = placeholder
+        self.columns = 1
+        self._cells = {}  # item index -> (placeholder, image, label) canvas ids
+        self._photos = {}  # item index -> PhotoImage, keeps shown images alive
+        self._spare = []
+
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.fg = fg
+
+        self.canvas.bind('<Configure>', lambda e: self.refresh())
+        self.canvas.bind('<MouseWheel>', lambda e: self._yview('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self._yview('scroll', -1, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self._yview('scroll', 1, 'units'))
+        self.canvas.bind('<Double-Button-1>', self._on_double_click)
+
+    def set_items(self, items):
+        """Show a different list of paths"""
+        self.items = items
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def refresh(self):
+        """Lay out the grid and draw the visible cells"""
+        width = max(self.canvas.winfo_width(), self.cell_width)
+        self.columns = max(1, width // self.cell_width)
+        rows = -(-len(self.items) // self.columns)
+        self.canvas.configure(scrollregion=(0, 0, width, rows * self.cell_height),
+                              yscrollincrement=self.cell_height // 3)
+        for index in list(self._cells):
+            self._release(index)
+        self._render()
+
+    def thumbnail_ready(self, file_path):
+        """Swap in a thumbnail that finished building, if its cell is visible"""
+        for index, (_, image, _) in self._cells.items():
+            if index < len(self.items) and self.items[index] == file_path:
+                photo = self.thumbnails.get(file_path)
+                if photo is not None:
+                    self._photos[index] = photo
+                    self.canvas.itemconfigure(image, image=photo, state=tk.NORMAL)
+
+    def _visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = int(top // self.cell_height) * self.columns
+        last = (int(bottom // self.cell_height) + 1) * self.columns
+        return range(max(0, first), min(len(self.items), last))
+
+    def _render(self):
+        visible = self._visible_range()
+        for index in [i for i in self._cells if i not in visible]:
+            self._release(index)
+        for index in visible:
+            if index not in self._cells:
+                self._place(index)
+
+    def _place(self, index):
+        row, column = divmod(index, self.columns)
+        x = column * self.cell_width + self.cell_width // 2
+        y = row * self.cell_height
+        if self._spare:
+            rect, image, label = self._spare.pop()
+        else:
+            rect = self.canvas.create_rectangle(0, 0, 0, 0, fill=self.placeholder, width=0)
+            image = self.canvas.create_image(0, 0, anchor=tk.N)
+            label = self.canvas.create_text(0, 0, anchor=tk.N, fill=self.fg,
+                                            width=self.cell_width - 2 * self.MARGIN,
+                                            font=('Arial', 9))
+        top = y + self.MARGIN
+        self.canvas.coords(rect, x - self.box_width // 2, top,
+                           x + self.box_width // 2, top + self.box_height)
+        self.canvas.coords(image, x, top)
+        self.canvas.coords(label, x, top + self.box_height + self.MARGIN)
+        file_path = self.items[index]
+        self.canvas.itemconfigure(label, text=os.path.basename(file_path), state=tk.NORMAL)
+        self.canvas.itemconfigure(rect, state=tk.NORMAL)
+
+        photo = self.thumbnails.get(file_path)
+        if photo is not None:
+            self._photos[index] = photo
+            self.canvas.itemconfigure(image, image=photo, state=tk.NORMAL)
+        else:
+            self.canvas.itemconfigure(image, image='', state=tk.HIDDEN)
+            self.thumbnails.request(file_path, self.thumbnail_ready)
+        self._cells[index] = (rect, image, label)
+
+    def _release(self, index):
+        cell = self._cells.pop(index)
+        self._photos.pop(index, None)
+        for item in cell:
+            self.canvas.itemconfigure(item, state=tk.HIDDEN)
+        self.canvas.itemconfigure(cell[1], image='')
+        self._spare.append(cell)
+
+    def _yview(self, *args):
+        dragged = bool(args) and args[0] == 'moveto'
+        if dragged:
+            # A scrollbar drag can skip thousands of cells; drop their queued jobs
+            self.thumbnails.cancel_pending()
+        self.canvas.yview(*args)
+        self._render()
+        if dragged:
+            # Cells still in view lost their requests too; ask for them again
+            for index in self._cells:
+                if index not in self._photos:
+                    self.thumbnails.request(self.items[index], self.thumbnail_ready)
+
+    def _on_double_click(self, event):
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        column = int(x // self.cell_width)
+        if column < self.columns:
+            index = int(y // self.cell_height) * self.columns + column
+            if index < len(self.items) and self.on_open:
+                self.on_open(self.items[index])